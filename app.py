@@ -1,12 +1,12 @@
-from flask import Flask, render_template, request, jsonify
-import subprocess
-import platform
-import re
-import time
-import statistics
-import json
+from flask import Flask, Response, render_template, request, jsonify
 import os
 from datetime import datetime
+from spatial_index import SpatialIndex
+from geo import location_key
+from scan_log import open_storage
+from signal_surface import SurfaceEngine
+from location_clusters import LocationClusters, locations_response
+from heatmap_tiles import TILE_CACHE_DIR, TileServer, parse_ssid
 
 app = Flask(__name__)
 
@@ -17,109 +17,99 @@ DATA_FILE = 'dynamic_data.json'
 wifi_locations = {}
 signal_history = {}
 
+# Optional label of each location in wifi_locations, part of its stored key
+location_labels = {}
+
+# Spatial index over the keys of wifi_locations
+location_index = SpatialIndex()
+
+# Bumped when wifi_locations is loaded; the surface engine, its tiles and the clusters follow it
+data_version = 0
+surface_engine = None
+location_clusters = None
+
+# Heatmap tiles, rendered on request (versions restart with the process)
+tile_server = None
+
+# Storage behind DATA_FILE: a JSON snapshot + append-only log, or SQLite for .db files
+storage = None
+
+def get_storage():
+    """Return the storage backend for DATA_FILE, recreating it if the path changed"""
+    global storage
+    if storage is None or storage.snapshot_path != DATA_FILE:
+        if storage is not None:
+            storage.close()
+        storage = open_storage(DATA_FILE)
+    return storage
+
+def current_locations():
+    """(data_version, {coords: location}) of wifi_locations, named the way they are stored"""
+    locations = {}
+    for coords, networks in wifi_locations.items():
+        lat, lon = (float(value) for value in coords.split(','))
+        label = location_labels.get(coords)
+        locations[coords] = {
+            "name": label or location_key(lat, lon, label),
+            "latitude": lat,
+            "longitude": lon,
+            "networks": networks
+        }
+    return data_version, locations
+
+def get_surface_engine():
+    """Return the signal surface engine over wifi_locations, recreating it when they change"""
+    global surface_engine
+    if surface_engine is None or surface_engine.version != data_version:
+        version, locations = current_locations()
+        surface_engine = SurfaceEngine(locations, version=version)
+    return surface_engine
+
+def get_location_clusters():
+    """Return the viewport/cluster index over wifi_locations, recreating it when they change"""
+    global location_clusters
+    if location_clusters is None or location_clusters.version != data_version:
+        version, locations = current_locations()
+        location_clusters = LocationClusters(locations, version=version)
+    return location_clusters
+
+def get_tile_server():
+    """Return the heatmap tile server, creating it on first use"""
+    global tile_server
+    if tile_server is None:
+        tile_server = TileServer(TILE_CACHE_DIR, namespace="app", clear=True)
+    return tile_server
+
 # Function to load existing data from file
 def load_existing_data():
-    """Load existing data from the JSON file if it exists."""
+    """Load existing data from the data file, including updates still in its log."""
+    global data_version
     try:
         if os.path.exists(DATA_FILE):
-            with open(DATA_FILE, 'r') as file:
-                data = json.load(file)
-                # Extract locations data
-                if "locations" in data:
-                    for location_key, location_data in data["locations"].items():
-                        if "networks" in location_data:
-                            # Create key from latitude/longitude
-                            coords = f"{location_data.get('latitude'):.6f},{location_data.get('longitude'):.6f}"
-                            wifi_locations[coords] = location_data["networks"]
-                
-                print(f"Loaded {len(wifi_locations)} locations from {DATA_FILE}")
-                return True
+            data = get_storage().load()
+            for location_key, location_data in data["locations"].items():
+                if "networks" in location_data and location_data.get('latitude') is not None:
+                    # Create key from latitude/longitude
+                    coords = f"{location_data['latitude']:.6f},{location_data['longitude']:.6f}"
+                    wifi_locations[coords] = location_data["networks"]
+                    location_labels[coords] = location_data.get("label")
+                    location_index.insert(coords, location_data['latitude'], location_data['longitude'])
+            data_version += 1
+            
+            print(f"Loaded {len(wifi_locations)} locations from {DATA_FILE}")
+            return True
     except Exception as e:
         print(f"Error loading existing data: {str(e)}")
         return False
 
-# Function to save current data to file
-def save_data_to_file():
-    """Save the current WiFi data to the JSON file."""
-    try:
-        # Structure the data - combines existing data
-        data = {
-            "locations": {},
-            "metadata": {
-                "last_updated": datetime.now().isoformat(),
-                "version": "1.1"
-            }
-        }
-        
-        # Load existing data if file exists
-        try:
-            if os.path.exists(DATA_FILE):
-                with open(DATA_FILE, 'r') as file:
-                    existing_data = json.load(file)
-                    data["locations"] = existing_data.get("locations", {})
-                    # Keep the original creation date if available
-                    if "metadata" in existing_data and "created" in existing_data["metadata"]:
-                        data["metadata"]["created"] = existing_data["metadata"]["created"]
-                    else:
-                        data["metadata"]["created"] = datetime.now().isoformat()
-        except:
-            data["metadata"]["created"] = datetime.now().isoformat()
-        
-        # Update with new data from memory
-        for location_key, networks in wifi_locations.items():
-            # Parse lat/lon from the key
-            try:
-                lat, lon = location_key.split(',')
-                timestamp = datetime.now().isoformat()
-                location_name = f"Location_{timestamp}"
-                
-                # Create a unique location entry
-                data["locations"][f"{location_name}_{timestamp}"] = {
-                    "name": location_name,
-                    "latitude": float(lat),
-                    "longitude": float(lon),
-                    "timestamp": timestamp,
-                    "networks": networks,
-                    "note": ""
-                }
-            except:
-                # Skip locations with invalid keys
-                continue
-        
-        # Add signal history
-        data["signal_history"] = signal_history
-        
-        with open(DATA_FILE, 'w') as file:
-            json.dump(data, file, indent=2)
-        
-        print(f"Data saved to {DATA_FILE}")
-        return True
-    except Exception as e:
-        print(f"Error saving data: {str(e)}")
-        return False
-
-
-
 @app.route('/')
 def index():
     return render_template('map.html')
 
-# Add this new function at the top level
-def find_nearest_location(target_lat, target_lon, max_distance=0.001):  # max_distance in degrees (~100m)
-    """Find the nearest stored location within max_distance."""
-    nearest = None
-    min_dist = float('inf')
-    
-    for location_key in wifi_locations:
-        lat, lon = map(float, location_key.split(','))
-        # Simple distance calculation (Euclidean)
-        dist = ((lat - target_lat) ** 2 + (lon - target_lon) ** 2) ** 0.5
-        
-        if dist < min_dist and dist < max_distance:
-            min_dist = dist
-            nearest = location_key
-            
-    return nearest
+def find_nearest_location(target_lat, target_lon, max_distance=100):
+    """Find the nearest stored location within max_distance (meters)."""
+    match = location_index.nearest(target_lat, target_lon, max_distance)
+    return match[1] if match else None
 
 # Replace the existing /get_wifi route with this:
 @app.route('/get_wifi', methods=['POST'])
@@ -135,7 +125,7 @@ def get_wifi():
     if nearest_location:
         # Use stored data
         wifi_networks = wifi_locations[nearest_location]
-        stored_lat, stored_lon = map(float, nearest_location.split(','))
+        stored_lat, stored_lon, _ = location_index.get(nearest_location)
         
         return jsonify({
             "latitude": stored_lat, 
@@ -169,13 +159,9 @@ def get_all_wifi():
 @app.route('/get_data_for_download', methods=['GET'])
 def get_data_for_download():
     """Return all collected WiFi data for download as JSON"""
-    # Make sure to save the latest data
-    save_data_to_file()
-    
-    # Load the complete data from file to ensure we have everything
+    # Load the complete data, including updates still in the log, to ensure we have everything
     try:
-        with open(DATA_FILE, 'r') as file:
-            data = json.load(file)
+        data = get_storage().load()
     except:
         # If loading fails, use the in-memory data
         data = {
@@ -188,22 +174,24 @@ def get_data_for_download():
 
 @app.route('/get_all_locations', methods=['GET'])
 def get_all_locations():
-    """Return all stored location coordinates"""
-    locations = []
-    try:
-        with open(DATA_FILE, 'r') as file:
-            data = json.load(file)
-            for loc_key, loc_data in data["locations"].items():
-                if "latitude" in loc_data and "longitude" in loc_data:
-                    locations.append({
-                        "latitude": loc_data["latitude"],
-                        "longitude": loc_data["longitude"],
-                        "name": loc_data["name"]
-                    })
-    except Exception as e:
-        print(f"Error loading locations: {e}")
-    
-    return jsonify({"locations": locations})
+    """Return the locations in a viewport, clustered below POINTS_MIN_ZOOM, a page at a time"""
+    body, status = locations_response(get_location_clusters(), request.args)
+    return jsonify(body), status
+
+@app.route('/tiles/<path:ssid>/<int:z>/<int:x>/<int:y>.png', methods=['GET'])
+def get_tile(ssid, z, x, y):
+    """Heatmap tile of an SSID's signal surface ("_all" for the strongest network at each point)"""
+    if not (0 <= z <= 22 and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        return jsonify({"error": "No such tile"}), 404
+    engine = get_surface_engine()
+    png = get_tile_server().tile(engine, parse_ssid(ssid), z, x, y)
+    if png is None:
+        return jsonify({"error": "Network not found"}), 404
+    # Tile URLs don't change with the data, so browsers revalidate against the version
+    response = Response(png, mimetype='image/png')
+    response.set_etag(f"{engine.version}-{ssid}-{z}-{x}-{y}")
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
 
 # Load existing data when the app starts
 load_existing_data()
@@ -0,0 +1,102 @@
+"""Benchmark the scalar haversine loop against the NumPy distance kernels,
+and the callers ported to them against the linear scans they replaced.
+
+Usage: python bench_distance.py [--sizes 10000 100000 1000000]
+"""
+import argparse
+import time
+import numpy as np
+from geo import (haversine, haversine_one_to_many, equirectangular_one_to_many,
+                 haversine_many_to_many)
+from spatial_index import SpatialIndex
+
+# Survey area around the IITGN campus
+CENTER_LAT = 23.2100
+CENTER_LON = 72.6845
+SPREAD_DEG = 0.01
+
+def random_points(n, seed=0):
+    rng = np.random.default_rng(seed)
+    lats = CENTER_LAT + rng.uniform(-SPREAD_DEG, SPREAD_DEG, n)
+    lons = CENTER_LON + rng.uniform(-SPREAD_DEG, SPREAD_DEG, n)
+    return np.ascontiguousarray(lats), np.ascontiguousarray(lons)
+
+def best_time(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def bench_one_to_many(n, repeat=3):
+    lats, lons = random_points(n)
+    lat_list = lats.tolist()
+    lon_list = lons.tolist()
+
+    scalar = best_time(lambda: [haversine(CENTER_LAT, CENTER_LON, a, b)
+                                for a, b in zip(lat_list, lon_list)], 1 if n > 100000 else repeat)
+    vector = best_time(lambda: haversine_one_to_many(CENTER_LAT, CENTER_LON, lats, lons), repeat)
+    approx = best_time(lambda: equirectangular_one_to_many(CENTER_LAT, CENTER_LON, lats, lons), repeat)
+
+    exact = haversine_one_to_many(CENTER_LAT, CENTER_LON, lats, lons)
+    error = np.max(np.abs(equirectangular_one_to_many(CENTER_LAT, CENTER_LON, lats, lons) - exact))
+
+    print(f"one-to-many n={n:>9,}: scalar {scalar * 1000:9.2f} ms | "
+          f"haversine {vector * 1000:7.2f} ms ({scalar / vector:6.1f}x) | "
+          f"equirect {approx * 1000:7.2f} ms ({scalar / approx:6.1f}x, max err {error:.3f} m)")
+
+def bench_many_to_many(n, m=100, repeat=3):
+    lats1, lons1 = random_points(n, seed=1)
+    lats2, lons2 = random_points(m, seed=2)
+    vector = best_time(lambda: haversine_many_to_many(lats1, lons1, lats2, lons2), repeat)
+    print(f"many-to-many {n:,} x {m:,}: haversine {vector * 1000:.2f} ms "
+          f"({n * m / vector / 1e6:.1f} M pairs/s)")
+
+def linear_nearest(lat, lon, points, max_distance):
+    """The scan find_nearest_location and the merge step did before the index"""
+    best = None
+    for key, (p_lat, p_lon) in points.items():
+        dist = haversine(lat, lon, p_lat, p_lon)
+        if dist <= max_distance and (best is None or dist < best[0]):
+            best = (dist, key)
+    return best
+
+def bench_callers(n, count=1000, repeat=3):
+    """find_nearest_location (150 m), the collector's 10 m merge check and a 30 m radius query"""
+    lats, lons = random_points(n, seed=3)
+    query_lats, query_lons = random_points(count, seed=4)
+    index = SpatialIndex()
+    insert = best_time(lambda: [index.insert(i, a, b) for i, (a, b) in
+                                enumerate(zip(lats.tolist(), lons.tolist()))], 1)
+    queries = list(zip(query_lats.tolist(), query_lons.tolist()))
+
+    nearest = best_time(lambda: [index.nearest(a, b, 150) for a, b in queries], repeat)
+    merge = best_time(lambda: [index.nearest(a, b, 10) for a, b in queries], repeat)
+    radius = best_time(lambda: [index.within_radius(a, b, 30) for a, b in queries], repeat)
+
+    points = dict(enumerate(zip(lats.tolist(), lons.tolist())))
+    sample = queries[:max(1, min(len(queries), 2000000 // n))]
+    linear = best_time(lambda: [linear_nearest(a, b, points, 150) for a, b in sample], 1) / len(sample)
+
+    per_query = lambda total: total / len(queries) * 1e6
+    print(f"callers n={n:>9,}: insert {insert * 1000:8.1f} ms | nearest(150 m) {per_query(nearest):7.1f} us "
+          f"(linear scan {linear * 1e6:9.1f} us, {linear * len(queries) / nearest:7.1f}x) | "
+          f"merge(10 m) {per_query(merge):6.1f} us | radius(30 m) {per_query(radius):7.1f} us")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark distance kernels')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000],
+                        help='Point counts to benchmark (default: 10k 100k 1M)')
+    args = parser.parse_args()
+
+    for n in args.sizes:
+        bench_one_to_many(n)
+    for n in args.sizes:
+        if n <= 100000:
+            bench_many_to_many(n)
+    for n in args.sizes:
+        bench_callers(n)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Benchmark the scan-output parsers on the recorded transcripts in fixtures/scan_output.
+
+Each transcript is also repeated into a dense scan (--cells, default 250) to
+match busy areas, and parsed with both scan_parser and the previous
+re.split/re.search parser, alternating timing rounds between the two. Core fields (ssid, signal, auth, channel) are
+compared first; any network the parsers disagree on is listed. (The legacy
+netsh parser read the line after a hidden network's empty "SSID N :" header
+as its name; scan_parser skips hidden networks.)
+
+Usage: python bench_parser.py [--cells 250] [--repeat 200]
+"""
+import argparse
+import glob
+import os
+import re
+import time
+from scan_parser import parse_iwlist, parse_netsh
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "scan_output")
+
+CORE_FIELDS = ("ssid", "signal", "auth", "channel")
+
+def legacy_parse_iwlist(output, noise_floor=-95):
+    """The parser get_single_wifi_scan used before scan_parser"""
+    wifi_data = []
+    for section in re.split(r"Cell \d+ - ", output)[1:]:
+        ssid_match = re.search(r'ESSID:"(.*?)"', section)
+        signal_match = re.search(r"Signal level=(-?\d+) dBm", section)
+        channel_match = re.search(r"Channel:(\d+)", section)
+        encryption_match = re.search(r"Encryption key:(on|off)", section)
+        auth_match = re.search(r"IE: (?:WPA|IEEE 802.11i/WPA2|WPA2) Version \d+", section)
+        if ssid_match and signal_match:
+            signal_dbm = int(signal_match.group(1))
+            auth_type = "Open"
+            if encryption_match and encryption_match.group(1) == "on":
+                if auth_match:
+                    auth_type = "WPA2" if "WPA2" in auth_match.group(0) else "WPA"
+                else:
+                    auth_type = "WEP"
+            wifi_data.append({
+                "ssid": ssid_match.group(1),
+                "signal": signal_dbm,
+                "auth": auth_type,
+                "channel": int(channel_match.group(1)) if channel_match else 0,
+                "snr": signal_dbm - noise_floor
+            })
+    return wifi_data
+
+def legacy_parse_netsh(output, noise_floor=-95):
+    """The Windows parser get_single_wifi_scan used before scan_parser"""
+    wifi_data = []
+    for block in re.split(r"SSID \d+ : ", output)[1:]:
+        lines = block.strip().split('\n')
+        ssid = lines[0].strip() if lines else ""
+        if not ssid:
+            continue
+        signal_match = re.search(r"Signal\s*:\s*(\d+)%", block)
+        auth_match = re.search(r"Authentication\s*:\s*(\S+)", block)
+        channel_match = re.search(r"Channel\s*:\s*(\d+)", block)
+        if signal_match:
+            signal_percent = int(signal_match.group(1))
+            signal_dbm = int((signal_percent / 2) - 100)
+            wifi_data.append({
+                "ssid": ssid,
+                "signal": signal_dbm,
+                "auth": auth_match.group(1) if auth_match else "Unknown",
+                "channel": int(channel_match.group(1)) if channel_match else 0,
+                "snr": signal_dbm - noise_floor
+            })
+    return wifi_data
+
+PARSERS = {
+    "iwlist": (parse_iwlist, legacy_parse_iwlist, re.compile(r"^(\s*)Cell \d+ - ", re.M)),
+    "netsh": (parse_netsh, legacy_parse_netsh, re.compile(r"^(\s*)SSID \d+ : ", re.M)),
+}
+
+def densify(output, marker, cells):
+    """Repeat the cells of a transcript until it has `cells` of them, renumbered"""
+    starts = [m.start() for m in marker.finditer(output)]
+    if not starts:
+        return output
+    header, body = output[:starts[0]], output[starts[0]:]
+    blocks = [body[a - starts[0]:b - starts[0]] for a, b in zip(starts, starts[1:] + [len(output)])]
+    label = "Cell" if "Cell" in blocks[0] else "SSID"
+    parts = []
+    for i in range(cells):
+        block = blocks[i % len(blocks)]
+        parts.append(marker.sub(lambda m: f"{m.group(1)}{label} {i + 1:02d} {'-' if label == 'Cell' else ':'} ", block, count=1))
+    return header + "".join(parts)
+
+def core(networks):
+    return [tuple(n.get(f) for f in CORE_FIELDS) for n in networks]
+
+def best_times(funcs, repeat, rounds=7):
+    """Best time per call of each function, alternating between them so noise hits both alike"""
+    best = [float('inf')] * len(funcs)
+    for _ in range(rounds):
+        for i, func in enumerate(funcs):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                func()
+            best[i] = min(best[i], (time.perf_counter() - start) / repeat)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark scan-output parsers')
+    parser.add_argument('--cells', type=int, default=250, help='Cells per dense scan (default: 250)')
+    parser.add_argument('--repeat', type=int, default=200, help='Parses per timing run (default: 200)')
+    args = parser.parse_args()
+
+    for path in sorted(glob.glob(os.path.join(FIXTURE_DIR, "*.txt"))):
+        name = os.path.basename(path)
+        kind = name.split("_")[0]
+        if kind not in PARSERS:
+            continue
+        new_parser, old_parser, marker = PARSERS[kind]
+        with open(path, 'r') as file:
+            output = file.read()
+
+        for label, text in (("recorded", output), (f"{args.cells} cells", densify(output, marker, args.cells))):
+            new_result = new_parser(text)
+            new_core, old_core = core(new_result), core(old_parser(text))
+            if new_core != old_core:
+                differing = sorted(set(new_core) ^ set(old_core), key=str)
+                print(f"{name} ({label}): differs from legacy parser on {differing[:3]}")
+            if not new_result:
+                print(f"{name} ({label}): no networks")
+                continue
+            new_time, old_time = best_times([lambda: new_parser(text), lambda: old_parser(text)], args.repeat)
+            cells = len(new_result)
+            print(f"{name:22} {label:>10}: {cells:4d} networks | "
+                  f"scan_parser {cells / new_time:>10,.0f} cells/s | "
+                  f"legacy {cells / old_time:>10,.0f} cells/s ({old_time / new_time:.1f}x)")
+
+if __name__ == "__main__":
+    main()
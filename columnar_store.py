@@ -0,0 +1,411 @@
+"""Compact columnar file format for WiFi survey data (.wfc).
+
+In wifi_data.json every observation repeats its field names and SSID/auth
+strings. A .wfc file stores the same document as typed columns instead:
+
+- every string (SSIDs, auth types, BSSIDs, location keys, names, ...) goes
+  once into an interned string table, and columns hold uint32 ids into it;
+- observation fields are small fixed-width integers: int8 signal and noise
+  floor, int16 SNR, uint16 channel and frequency, and so on;
+- locations have float64 latitude/longitude and an offsets column:
+  location i owns observations offsets[i]:offsets[i + 1].
+
+Layout: the 8-byte magic, a uint32 header length, a JSON header (counts,
+metadata, column table), then each column 8-byte aligned. ColumnarFile maps
+the file with mmap and exposes each column as a zero-copy, read-only NumPy
+view, so opening a file costs nothing until columns are used.
+
+Conversion is lossless. A value that does not fit its column (a float
+signal, an out-of-range channel, a field with no column) is stored in the
+header as a per-row extra and put back on decoding.
+
+Usage: python columnar_store.py wifi_data.json [wifi_data.wfc]
+       python columnar_store.py wifi_data.wfc [wifi_data.json]
+"""
+import json
+import mmap
+import os
+import struct
+import numpy as np
+from persistence import fsync_policy, write_atomic
+
+MAGIC = b"WIFICOL1"
+FORMAT_VERSION = 1
+
+# File extensions that select the columnar format
+COLUMNAR_EXTENSIONS = ('.wfc',)
+
+# Column kinds: STRING columns hold string table ids; CENTI columns hold a
+# float with two decimals as an integer number of hundredths
+INT, FLOAT, STRING, CENTI = "int", "float", "string", "centi"
+
+LOCATION_COLUMNS = (
+    ("name", "<u4", STRING),
+    ("latitude", "<f8", FLOAT),
+    ("longitude", "<f8", FLOAT),
+    ("timestamp", "<u4", STRING),
+    ("note", "<u4", STRING),
+)
+
+OBSERVATION_COLUMNS = (
+    ("ssid", "<u4", STRING),
+    ("signal", "<i1", INT),
+    ("signal_percent", "<u1", INT),
+    ("auth", "<u4", STRING),
+    ("channel", "<u2", INT),
+    ("noise_floor", "<i1", INT),
+    ("snr", "<i2", INT),
+    ("samples", "<u2", INT),
+    ("signal_variance", "<u2", INT),
+    ("bssid", "<u4", STRING),
+    ("frequency", "<u2", INT),
+    ("quality", "<u1", INT),
+    ("signal_min", "<i1", INT),
+    ("signal_max", "<i1", INT),
+    ("signal_median", "<i1", INT),
+    ("signal_p10", "<i1", INT),
+    ("signal_p90", "<i1", INT),
+    ("signal_stderr", "<i2", CENTI),
+)
+
+def is_columnar_path(path):
+    """Return True if the path names a columnar file rather than JSON"""
+    return str(path).lower().endswith(COLUMNAR_EXTENSIONS)
+
+def missing_value(dtype, kind):
+    """The sentinel a column stores for rows without the field"""
+    if kind == FLOAT:
+        return float("nan")
+    info = np.iinfo(dtype)
+    return info.min if info.min < 0 else info.max
+
+class ColumnEncoder:
+    """Collects one column's values; values that don't fit go to `extras`"""
+
+    def __init__(self, field, dtype, kind, strings, extras):
+        self.field = field
+        self.dtype = dtype
+        self.kind = kind
+        self.strings = strings
+        self.extras = extras
+        self.missing = missing_value(dtype, kind)
+        if kind != FLOAT:
+            info = np.iinfo(dtype)
+            # The sentinel is not a storable value
+            self.low = info.min + 1 if info.min < 0 else info.min
+            self.high = info.max if info.min < 0 else info.max - 1
+        self.values = []
+        self.present = False
+
+    def encode(self, value):
+        kind = self.kind
+        if kind == STRING:
+            if type(value) is str:
+                index = self.strings.get(value)
+                if index is None:
+                    index = self.strings[value] = len(self.strings)
+                return index
+        elif kind == INT:
+            if type(value) is int and self.low <= value <= self.high:
+                return value
+        elif kind == FLOAT:
+            if type(value) is float and value == value:
+                return value
+        elif type(value) is float:
+            hundredths = round(value * 100)
+            # Only values that decode back to exactly the same float
+            if self.low <= hundredths <= self.high and hundredths / 100 == value:
+                return hundredths
+        return None
+
+    def add(self, row, record):
+        if self.field not in record:
+            self.values.append(self.missing)
+            return
+        value = record[self.field]
+        encoded = self.encode(value)
+        if encoded is None:
+            self.extras.setdefault(row, {})[self.field] = value
+            self.values.append(self.missing)
+        else:
+            self.present = True
+            self.values.append(encoded)
+
+    def array(self):
+        return np.array(self.values, dtype=self.dtype)
+
+def encode_columnar(data):
+    """Encode a data document as the bytes of a .wfc file"""
+    strings = {}
+    location_extras = {}
+    observation_extras = {}
+    keys = ColumnEncoder("key", "<u4", STRING, strings, location_extras)
+    location_columns = [ColumnEncoder(field, dtype, kind, strings, location_extras)
+                        for field, dtype, kind in LOCATION_COLUMNS]
+    observation_columns = [ColumnEncoder(field, dtype, kind, strings, observation_extras)
+                           for field, dtype, kind in OBSERVATION_COLUMNS]
+    location_fields = {field for field, _, _ in LOCATION_COLUMNS} | {"networks"}
+    observation_fields = {field for field, _, _ in OBSERVATION_COLUMNS}
+    offsets = [0]
+    without_networks = []
+    row = 0
+
+    for i, (key, location) in enumerate(data.get("locations", {}).items()):
+        keys.add(i, {"key": key})
+        for column in location_columns:
+            column.add(i, location)
+        for field, value in location.items():
+            if field not in location_fields:
+                location_extras.setdefault(i, {})[field] = value
+
+        networks = location.get("networks")
+        if not isinstance(networks, list) or not all(isinstance(n, dict) for n in networks):
+            without_networks.append(i)
+            if "networks" in location:
+                location_extras.setdefault(i, {})["networks"] = networks
+            networks = ()
+        for network in networks:
+            for column in observation_columns:
+                column.add(row, network)
+            for field, value in network.items():
+                if field not in observation_fields:
+                    observation_extras.setdefault(row, {})[field] = value
+            row += 1
+        offsets.append(row)
+
+    encoded = [s.encode("utf-8") for s in strings]
+    string_offsets = np.zeros(len(encoded) + 1, dtype="<u8")
+    np.cumsum([len(s) for s in encoded], out=string_offsets[1:])
+
+    arrays = {
+        "string_offsets": string_offsets,
+        "string_data": np.frombuffer(b"".join(encoded), dtype="u1"),
+        "offsets": np.array(offsets, dtype="<u4"),
+        "location.key": keys.array(),
+    }
+    # Columns no row has a value for are left out entirely
+    for prefix, columns in (("location.", location_columns), ("observation.", observation_columns)):
+        for column in columns:
+            if column.present:
+                arrays[prefix + column.field] = column.array()
+
+    column_table = {}
+    body = bytearray()
+    for name, array in arrays.items():
+        body.extend(b"\0" * (-len(body) % 8))
+        column_table[name] = {"dtype": array.dtype.str, "offset": len(body), "count": len(array)}
+        body.extend(array.tobytes())
+
+    header = json.dumps({
+        "version": FORMAT_VERSION,
+        "locations": len(offsets) - 1,
+        "observations": row,
+        "strings": len(encoded),
+        "columns": column_table,
+        "metadata": data.get("metadata", {}),
+        # Other top-level sections, e.g. signal_history
+        "sections": {k: v for k, v in data.items() if k not in ("locations", "metadata")},
+        "without_networks": without_networks,
+        "location_extras": location_extras,
+        "observation_extras": observation_extras,
+    }, separators=(',', ':')).encode("utf-8")
+
+    prefix = MAGIC + struct.pack("<I", len(header)) + header
+    return prefix + b"\0" * (-len(prefix) % 8) + bytes(body)
+
+def write_columnar(path, data):
+    """Write a data document to a .wfc file atomically; returns its size in bytes"""
+    encoded = encode_columnar(data)
+    policy = fsync_policy()
+    write_atomic(path, encoded, fsync=policy != "never", sync_directory=policy == "always")
+    return len(encoded)
+
+class ColumnarFile:
+    """A .wfc file mapped into memory.
+
+    column(name) returns a read-only NumPy view straight into the mapping,
+    e.g. column("observation.signal"). Locations and observations are
+    decoded into the JSON layout only on request. Views stay valid until
+    close(); close it only once nothing holds one.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a columnar WiFi data file")
+        header_length, = struct.unpack_from("<I", self._mmap, len(MAGIC))
+        start = len(MAGIC) + 4
+        self.header = json.loads(self._mmap[start:start + header_length].decode("utf-8"))
+        if self.header["version"] != FORMAT_VERSION:
+            self._mmap.close()
+            raise ValueError(f"Unsupported columnar format version {self.header['version']} in {path}")
+        base = start + header_length
+        self._base = base + (-base % 8)
+        self._columns = {}
+        self._strings = None
+        self._string_ids = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._columns = {}
+        try:
+            self._mmap.close()
+        except BufferError:
+            # A caller still holds a view; the mapping goes when it does
+            pass
+
+    @property
+    def location_count(self):
+        return self.header["locations"]
+
+    @property
+    def observation_count(self):
+        return self.header["observations"]
+
+    def column(self, name):
+        """Zero-copy view of a column, or None if no row has that field"""
+        array = self._columns.get(name)
+        if array is None:
+            spec = self.header["columns"].get(name)
+            if spec is None:
+                return None
+            array = np.frombuffer(self._mmap, dtype=spec["dtype"], count=spec["count"],
+                                  offset=self._base + spec["offset"])
+            self._columns[name] = array
+        return array
+
+    def strings(self):
+        """The string table, decoded once; equal strings in the output share one object"""
+        if self._strings is None:
+            offsets = self.column("string_offsets").tolist()
+            data = self.column("string_data").tobytes()
+            self._strings = [data[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+        return self._strings
+
+    def string_id(self, value):
+        """Id of a string in the table, or None if the file never mentions it"""
+        if self._string_ids is None:
+            self._string_ids = {s: i for i, s in enumerate(self.strings())}
+        return self._string_ids.get(value)
+
+    def observations_of(self, ssid):
+        """(observation rows, location indices) of every observation of `ssid`, as arrays"""
+        ssids = self.column("observation.ssid")
+        string_id = self.string_id(ssid)
+        if ssids is None or string_id is None:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty
+        rows = np.flatnonzero(ssids == string_id)
+        locations = np.searchsorted(self.column("offsets"), rows, side="right") - 1
+        return rows, locations
+
+    def _decoded_columns(self, prefix, specs):
+        strings = self.strings()
+        decoded = []
+        for field, dtype, kind in specs:
+            array = self.column(prefix + field)
+            if array is None:
+                continue
+            missing = missing_value(dtype, kind)
+            values = array.tolist()
+            if kind == STRING:
+                values = [None if v == missing else strings[v] for v in values]
+            elif kind == CENTI:
+                values = [None if v == missing else v / 100 for v in values]
+            elif kind == FLOAT:
+                values = [None if v != v else v for v in values]
+            else:
+                values = [None if v == missing else v for v in values]
+            decoded.append((field, values))
+        return decoded
+
+    def to_document(self):
+        """Decode the whole file into the wifi_data.json document layout"""
+        header = self.header
+        strings = self.strings()
+        location_columns = self._decoded_columns("location.", LOCATION_COLUMNS)
+        observation_columns = self._decoded_columns("observation.", OBSERVATION_COLUMNS)
+        location_extras = header["location_extras"]
+        observation_extras = header["observation_extras"]
+        without_networks = set(header["without_networks"])
+        keys = self.column("location.key").tolist()
+        offsets = self.column("offsets").tolist()
+
+        networks = []
+        for row in range(self.observation_count):
+            network = {}
+            for field, values in observation_columns:
+                if values[row] is not None:
+                    network[field] = values[row]
+            extras = observation_extras.get(str(row))
+            if extras:
+                network.update(extras)
+            networks.append(network)
+
+        locations = {}
+        for i in range(self.location_count):
+            location = {}
+            for field, values in location_columns:
+                if values[i] is not None:
+                    location[field] = values[i]
+            if i not in without_networks:
+                location["networks"] = networks[offsets[i]:offsets[i + 1]]
+            extras = location_extras.get(str(i))
+            if extras:
+                location.update(extras)
+            locations[strings[keys[i]]] = location
+
+        data = {"locations": locations, "metadata": header["metadata"]}
+        data.update(header["sections"])
+        return data
+
+def read_columnar(path):
+    """Read a .wfc file into the wifi_data.json document layout"""
+    with ColumnarFile(path) as columnar:
+        return columnar.to_document()
+
+def json_to_columnar(json_path, columnar_path):
+    """Convert a wifi_data.json / dynamic_data.json document to a .wfc file; returns (locations, bytes)"""
+    with open(json_path, 'r') as file:
+        data = json.load(file)
+    size = write_columnar(columnar_path, data)
+    return len(data.get("locations", {})), size
+
+def columnar_to_json(columnar_path, json_path):
+    """Convert a .wfc file back to the JSON layout; returns (locations, bytes)"""
+    data = read_columnar(columnar_path)
+    text = json.dumps(data, indent=2)
+    write_atomic(json_path, text, fsync=fsync_policy() != "never")
+    return len(data["locations"]), len(text)
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Convert WiFi data between JSON and the columnar .wfc format')
+    parser.add_argument('source', help='A .json file to convert to .wfc, or a .wfc file to convert to JSON')
+    parser.add_argument('target', nargs='?', help='Output file (default: same name with the other extension)')
+    parser.add_argument('--check', action='store_true', help='Verify that the output decodes to the source document')
+    args = parser.parse_args()
+
+    to_json = is_columnar_path(args.source)
+    target = args.target or os.path.splitext(args.source)[0] + ('.json' if to_json else COLUMNAR_EXTENSIONS[0])
+    convert = columnar_to_json if to_json else json_to_columnar
+    count, size = convert(args.source, target)
+    print(f"Converted {count} locations from {args.source} ({os.path.getsize(args.source) / 1024:.0f} KiB) "
+          f"to {target} ({size / 1024:.0f} KiB)")
+
+    if args.check:
+        json_path, columnar_path = (target, args.source) if to_json else (args.source, target)
+        with open(json_path, 'r') as file:
+            original = json.load(file)
+        if read_columnar(columnar_path) != original:
+            print("Check failed: the columnar file does not decode to the JSON document")
+            raise SystemExit(1)
+        print("Check passed")
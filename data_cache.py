@@ -0,0 +1,93 @@
+import hashlib
+import json
+import os
+import threading
+
+def file_signature(path):
+    """Return (mtime_ns, size, inode) for a file, or None if it does not exist."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+class CachedJSONFile:
+    """Process-wide cache of a parsed JSON file.
+
+    The file is only re-parsed when the mtime, size or inode of it, or of any
+    of `watch_paths` (e.g. a log replayed by the loader), changes. Reloads
+    happen under a lock so concurrent requests trigger a single parse, and the
+    parsed document is shared between callers, who must treat it as read-only.
+    """
+
+    def __init__(self, path, loader=None, on_reload=None, watch_paths=()):
+        self.path = path
+        self.watch_paths = tuple(watch_paths)
+        self.loader = loader or self._load_json
+        self.on_reload = on_reload
+        self.hits = 0
+        self.reloads = 0
+        self.errors = 0
+        self._signature = None
+        self._data = None
+        self._lock = threading.Lock()
+
+    def _load_json(self, path):
+        with open(path, 'r') as file:
+            return json.load(file)
+
+    def _current_signature(self):
+        signature = file_signature(self.path)
+        if signature is None or not self.watch_paths:
+            return signature
+        return (signature,) + tuple(file_signature(p) for p in self.watch_paths)
+
+    def get(self):
+        """Return the parsed document, reloading it if the file changed."""
+        signature = self._current_signature()
+        data = self._data
+        if data is not None and signature == self._signature:
+            self.hits += 1
+            return data
+
+        with self._lock:
+            # Another request may have reloaded while we waited for the lock
+            signature = self._current_signature()
+            if self._data is not None and signature == self._signature:
+                self.hits += 1
+                return self._data
+
+            if signature is None:
+                data = None
+            else:
+                try:
+                    data = self.loader(self.path)
+                except Exception:
+                    self.errors += 1
+                    raise
+            self._data = data
+            self._signature = signature
+            self.reloads += 1
+            if self.on_reload:
+                self.on_reload(data)
+            return data
+
+    @property
+    def version(self):
+        """Short digest of the loaded file signature: stable across restarts, new whenever the file changes"""
+        return hashlib.sha1(repr(self._signature).encode()).hexdigest()[:12]
+
+    def invalidate(self):
+        """Force the next get() to re-read the file."""
+        with self._lock:
+            self._signature = None
+            self._data = None
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "hits": self.hits,
+            "reloads": self.reloads,
+            "errors": self.errors,
+            "signature": json.loads(json.dumps(self._signature)) if self._signature else None
+        }
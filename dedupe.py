@@ -0,0 +1,78 @@
+"""Collapse duplicate locations in a data file onto stable geohash keys.
+
+Earlier versions of app.py added a new Location_<timestamp>_<timestamp>
+entry for every location on every save, so its data file grew with each
+download. This tool re-keys every location with geo.location_key(), so
+entries in the same geohash cell with the same label collapse into one,
+keeping the newest. Names the collectors generate (Location_...,
+Dynamic_Scan_..., Survey_Scan_...) are not labels; any other name is.
+Locations without coordinates are kept as they are.
+
+Usage: python dedupe.py dynamic_data.json [--output deduped.json] [--precision 9] [--dry-run]
+"""
+import re
+from geo import GEOHASH_PRECISION, location_key
+from scan_log import open_storage
+
+GENERATED_NAME = re.compile(r"^(Location|Dynamic_Scan|Survey_Scan)_")
+
+def location_label(location):
+    """The label a location is keyed by, or None for generated names"""
+    if location.get("label"):
+        return location["label"]
+    name = location.get("name")
+    if not name or GENERATED_NAME.match(name):
+        return None
+    return name
+
+def dedupe_locations(locations, precision=GEOHASH_PRECISION):
+    """Return {stable key: newest location in that cell} for a {key: location} mapping"""
+    result = {}
+    for key, location in locations.items():
+        lat = location.get("latitude")
+        lon = location.get("longitude")
+        if lat is None or lon is None:
+            result[key] = location
+            continue
+        label = location_label(location)
+        stable_key = location_key(lat, lon, label, precision)
+        current = result.get(stable_key)
+        if current is None or (location.get("timestamp") or "") >= (current.get("timestamp") or ""):
+            if label and "label" not in location:
+                # Recorded so app.py keys later updates of this location the same way
+                location = dict(location, label=label)
+            result[stable_key] = location
+    return result
+
+def dedupe_file(path, output=None, precision=GEOHASH_PRECISION, dry_run=False):
+    """Deduplicate a data file (JSON + log or SQLite) into `output` (default: in place).
+
+    Returns (locations before, locations after).
+    """
+    source = open_storage(path)
+    data = source.load()
+    source.close()
+    before = len(data["locations"])
+    data["locations"] = dedupe_locations(data["locations"], precision)
+    data["metadata"]["location_count"] = len(data["locations"])
+    if not dry_run:
+        # Compacting writes the snapshot atomically and empties the log
+        target = open_storage(output or path)
+        target.compact(data)
+        target.close()
+    return before, len(data["locations"])
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Collapse duplicate locations onto stable geohash keys')
+    parser.add_argument('data_file', help='Data file to deduplicate (.json or .db)')
+    parser.add_argument('--output', '-o', help='Write the result here instead of replacing the data file')
+    parser.add_argument('--precision', type=int, default=GEOHASH_PRECISION,
+                        help=f'Geohash length of the cells (default: {GEOHASH_PRECISION}, about 4.8 m)')
+    parser.add_argument('--dry-run', action='store_true', help='Only report how many locations would remain')
+    args = parser.parse_args()
+
+    before, after = dedupe_file(args.data_file, args.output, args.precision, args.dry_run)
+    target = args.output or args.data_file
+    print(f"{before} locations -> {after} ({before - after} duplicates"
+          f"{' would be' if args.dry_run else ''} removed){'' if args.dry_run else f' -> {target}'}")
@@ -1,26 +1,49 @@
-import subprocess
-import platform
-import re
 import time
-import statistics
-import json
-import os
 from datetime import datetime
 import argparse
 import sys
-import urllib.request
-import socket
 import webbrowser
-import math
 import threading
 from threading import Event
 
 # Import Flask components
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify
+from spatial_index import build_location_index
+from scan_log import empty_data, open_storage
+from ssid_index import build_ssid_aggregates, diff_networks, observations_response, parse_observation_args
+from scan_pipeline import ScanPipeline
+from scan_helper import configure_scanner, get_scanner
+from scanners import SCANNER_BACKENDS
+from signal_stats import collect_samples
+from location_service import LOCATION_TIMEOUT, configure_location, get_location_service
+from track import SurveyRecorder, Track, TrackProjector, track_fix
+from snapshot_store import SnapshotStore
+from signal_surface import point_response, surface_response
+from location_clusters import location_summary, locations_response
+from event_stream import EventBroadcaster, format_event
+from heatmap_tiles import TILE_CACHE_DIR, TileServer, parse_ssid
+from persistence import FSYNC_POLICIES, configure_persistence, flush_all, write_report
 
 # File where data will be stored
 DATA_FILE = 'dynamic_data.json'
 
+# Permanent store that collected data is merged into when scanning stops
+PERMANENT_DATA_FILE = 'wifi_data.json'
+
+# Locations closer than this (meters) are merged into one permanent location
+MERGE_DISTANCE = 10
+
+# Directory survey mode records its fixes and scans to
+SURVEY_DIR = 'surveys'
+
+# Adaptive sampling: with a tolerance in dB, keep scanning a point until every
+# network's RSSI standard error is within it (None = always take `samples` scans)
+SAMPLE_TOLERANCE = None
+
+# Budget for adaptive sampling at one point
+MAX_SAMPLES = 20
+MAX_SAMPLE_TIME = None
+
 # Distance threshold in degrees 
 LOCATION_THRESHOLD = 0.0001
 
@@ -28,6 +51,26 @@ LOCATION_THRESHOLD = 0.0001
 app = None
 webapp_thread = None
 
+# Spatial index over stored locations, used by the collector (the web app reads snapshots)
+location_index = None
+
+# Per-SSID aggregates, updated by the collector as scans are ingested
+ssid_aggregates = None
+
+# Storage behind DATA_FILE: a JSON snapshot + append-only log, or SQLite for .db files
+storage = None
+
+# Immutable snapshots of the collected data for the web threads; the collector publishes each batch
+snapshot_store = None
+
+# Heatmap tiles of the snapshots; the web app renders the latest snapshot's pyramid in the background
+# once the collector has published nothing new for TILE_QUIET_PERIOD seconds
+tile_server = None
+TILE_QUIET_PERIOD = 30
+
+# Live updates for /events: each published batch goes out as a "scan" event
+event_broadcaster = None
+
 def start_webapp(host='0.0.0.0', port=5000, debug=False, use_reloader=False):
     """Start the Flask web application in a separate thread"""
     global app
@@ -75,30 +118,7 @@ def start_webapp(host='0.0.0.0', port=5000, debug=False, use_reloader=False):
         @app.route('/get_all_wifi', methods=['GET'])
         def get_all_wifi():
             """Return all unique SSIDs and their signal strength ranges"""
-            data = load_existing_data()
-            ssid_data = {}
-            
-            for location_key, location_data in data["locations"].items():
-                for network in location_data.get("networks", []):
-                    ssid = network.get("ssid")
-                    if not ssid:
-                        continue
-                    
-                    signal = network.get("signal", 0)
-                    
-                    if ssid not in ssid_data:
-                        ssid_data[ssid] = {
-                            "ssid": ssid,
-                            "min_signal": signal,
-                            "max_signal": signal,
-                            "locations": 1
-                        }
-                    else:
-                        ssid_data[ssid]["min_signal"] = min(ssid_data[ssid]["min_signal"], signal)
-                        ssid_data[ssid]["max_signal"] = max(ssid_data[ssid]["max_signal"], signal)
-                        ssid_data[ssid]["locations"] += 1
-            
-            networks = list(ssid_data.values())
+            networks = get_snapshot_store().get().networks
             return jsonify({
                 "networks": networks
             })
@@ -106,35 +126,81 @@ def start_webapp(host='0.0.0.0', port=5000, debug=False, use_reloader=False):
         @app.route('/get_data_for_download', methods=['GET'])
         def get_data_for_download():
             """Return all collected WiFi data for download as JSON"""
-            try:
-                with open(DATA_FILE, 'r') as file:
-                    data = json.load(file)
-            except Exception as e:
-                data = {
-                    "error": str(e),
-                    "timestamp": datetime.now().isoformat()
-                }
-            
-            return jsonify(data)
+            return jsonify(get_snapshot_store().get().document())
         
         @app.route('/get_all_locations', methods=['GET'])
         def get_all_locations():
-            """Return all stored location coordinates"""
-            locations = []
+            """Return the stored locations in a viewport, clustered below POINTS_MIN_ZOOM, a page at a time"""
+            body, status = locations_response(get_snapshot_store().get().location_clusters(), request.args)
+            return jsonify(body), status
+        
+        @app.route('/network/<ssid>', methods=['GET'])
+        def get_network_details(ssid):
+            """Observations of an SSID or BSSID ordered by timestamp, filtered by since/until and paged by offset/limit"""
             try:
-                with open(DATA_FILE, 'r') as file:
-                    data = json.load(file)
-                    for loc_key, loc_data in data["locations"].items():
-                        if "latitude" in loc_data and "longitude" in loc_data:
-                            locations.append({
-                                "latitude": loc_data["latitude"],
-                                "longitude": loc_data["longitude"],
-                                "name": loc_data["name"]
-                            })
-            except Exception as e:
-                print(f"Error loading locations: {e}")
-            
-            return jsonify({"locations": locations})
+                since, until, offset, limit = parse_observation_args(request.args)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            snapshot = get_snapshot_store().get()
+            locations = snapshot.locations
+            total, refs = snapshot.observation_index().lookup(ssid, since, until, offset, limit)
+            matches = [(locations[key], locations[key]["networks"][position]) for key, position in refs]
+            body, status = observations_response(ssid, total, matches, offset, limit)
+            return jsonify(body), status
+        
+        @app.route('/surface', methods=['GET'])
+        def get_surface():
+            """Interpolated signal grid for an SSID, cached per snapshot version"""
+            body, status = surface_response(get_snapshot_store().get().surface_engine(), request.args)
+            return jsonify(body), status
+        
+        @app.route('/surface/point', methods=['GET'])
+        def get_surface_point():
+            """Predicted signal at lat/lon from the current snapshot's surface"""
+            body, status = point_response(get_snapshot_store().get().surface_engine(), request.args)
+            return jsonify(body), status
+        
+        @app.route('/tiles/<path:ssid>/<int:z>/<int:x>/<int:y>.png', methods=['GET'])
+        def get_tile(ssid, z, x, y):
+            """Heatmap tile of an SSID's signal surface ("_all" for the strongest network at each point)"""
+            if not (0 <= z <= 22 and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+                return jsonify({"error": "No such tile"}), 404
+            engine = get_snapshot_store().get().surface_engine()
+            png = get_tile_server().tile(engine, parse_ssid(ssid), z, x, y)
+            if png is None:
+                return jsonify({"error": "Network not found"}), 404
+            # Tile URLs don't change with the data, so browsers revalidate against the version
+            response = Response(png, mimetype='image/png')
+            response.set_etag(f"{engine.version}-{ssid}-{z}-{x}-{y}")
+            response.headers['Cache-Control'] = 'no-cache'
+            return response.make_conditional(request)
+        
+        @app.route('/events', methods=['GET'])
+        def get_events():
+            """Server-Sent Events stream of scan deltas as the collector stores them
+
+            Events: "scan" (changed locations and SSID aggregates, id = snapshot
+            version), "reset" (the data was cleared) and "resync" (the client
+            missed events and should refetch).
+            """
+            # Subscribe before reading the version, so no event falls between the check and the stream
+            broadcaster = get_event_broadcaster()
+            subscription = broadcaster.subscribe()
+            first = None
+            version = get_snapshot_store().version
+            last_id = request.headers.get('Last-Event-ID')
+            if last_id and last_id != str(version):
+                # Reconnected after missing some versions
+                first = format_event("resync", {"version": version})
+            response = Response(broadcaster.stream(first, subscription), mimetype='text/event-stream')
+            # A stream that never starts never reaches its own cleanup
+            response.call_on_close(lambda: broadcaster.unsubscribe(subscription))
+            response.headers['Cache-Control'] = 'no-cache'
+            response.headers['X-Accel-Buffering'] = 'no'
+            return response
+    
+    # Seed the snapshot before any request thread can race to do it, and start on its tiles
+    get_tile_server().precompute(get_snapshot_store().get().surface_engine())
     
     # Create and start the server in a new thread
     def run_webapp():
@@ -153,111 +219,179 @@ def start_webapp(host='0.0.0.0', port=5000, debug=False, use_reloader=False):
     except:
         pass
 
-def find_nearest_location(target_lat, target_lon, max_distance=0.001):
-    """Find the nearest stored location within max_distance."""
-    data = load_existing_data()
-    nearest = None
-    min_dist = float('inf')
-    
-    for location_key, location_data in data["locations"].items():
-        lat = location_data.get("latitude")
-        lon = location_data.get("longitude")
-        
-        if lat is None or lon is None:
-            continue
-            
-        # Calculate distance
-        dist = calculate_distance(lat, lon, target_lat, target_lon)
-        
-        if dist < min_dist and dist < 150:  # Max 150 meters
-            min_dist = dist
-            nearest = {
-                "key": location_key,
-                "distance": dist,
-                "location_data": location_data
-            }
-    
-    return nearest
-
-def calculate_distance(lat1, lon1, lat2, lon2):
-    """Calculate distance between two coordinates in meters"""
-    R = 6371000  # Earth's radius in meters
-    φ1 = math.radians(lat1)
-    φ2 = math.radians(lat2)
-    Δφ = math.radians(lat2 - lat1)
-    Δλ = math.radians(lon2 - lon1)
-
-    a = math.sin(Δφ/2) * math.sin(Δφ/2) + \
-        math.cos(φ1) * math.cos(φ2) * \
-        math.sin(Δλ/2) * math.sin(Δλ/2)
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-    return R * c
-
-def dynamic_wifi_collection(interval=10, duration=None, stop_event=None):
+def get_location_index():
+    """Return the spatial index over stored locations, building it on first use"""
+    global location_index
+    if location_index is None:
+        location_index = build_location_index(load_existing_data()["locations"])
+    return location_index
+
+def get_ssid_aggregates():
+    """Return the per-SSID aggregates over stored locations, building them on first use"""
+    global ssid_aggregates
+    if ssid_aggregates is None:
+        ssid_aggregates = build_ssid_aggregates(load_existing_data()["locations"])
+    return ssid_aggregates
+
+def get_snapshot_store():
+    """Return the snapshot store the web routes read from, seeding it from storage on first use"""
+    global snapshot_store
+    if snapshot_store is None:
+        snapshot_store = SnapshotStore(load_existing_data(), get_ssid_aggregates().networks())
+    return snapshot_store
+
+def get_tile_server():
+    """Return the heatmap tile server, creating it on first use"""
+    global tile_server
+    if tile_server is None:
+        # Snapshot versions restart at 1 with the process, so tiles from an earlier run are stale
+        tile_server = TileServer(TILE_CACHE_DIR, namespace="dynamic", clear=True, quiet_period=TILE_QUIET_PERIOD)
+    return tile_server
+
+def get_event_broadcaster():
+    """Return the /events broadcaster, creating it on first use"""
+    global event_broadcaster
+    if event_broadcaster is None:
+        event_broadcaster = EventBroadcaster()
+    return event_broadcaster
+
+def publish_locations(changes):
+    """Publish changed locations to the web threads, queue the new snapshot's tiles and push the delta"""
+    store = get_snapshot_store()
+    previous = store.get()
+    snapshot = store.update(changes, get_ssid_aggregates().networks())
+    if app is not None:
+        get_tile_server().precompute(snapshot.surface_engine())
+        if len(get_event_broadcaster()):
+            networks, removed = diff_networks(previous.networks, snapshot.networks)
+            get_event_broadcaster().publish("scan", {
+                "version": snapshot.version,
+                "locations": [dict(location_summary(location), key=key,
+                                   latitude=location["latitude"], longitude=location["longitude"])
+                              for key, location in changes.items() if location is not None],
+                "networks": networks,
+                "removed_networks": removed
+            }, event_id=snapshot.version)
+
+def find_nearest_location(target_lat, target_lon, max_distance=150):
+    """Find the nearest location in the current snapshot within max_distance (meters)."""
+    match = get_snapshot_store().get().location_index().nearest(target_lat, target_lon, max_distance)
+    if match is None:
+        return None
+
+    dist, location_key, location_data = match
+    return {
+        "key": location_key,
+        "distance": dist,
+        "location_data": location_data
+    }
+
+def dynamic_wifi_collection(interval=10, duration=None, stop_event=None, survey=False):
     """
     Continuously collect WiFi data with specified interval
     Overwrites data for same location, appends for new locations
+    Scans run on their own thread on fixed interval ticks; this thread writes
+    them to storage in batches, so disk stalls never delay the next scan.
+    In survey mode location fixes and scans are recorded as separate time
+    series (under SURVEY_DIR) and each scan is placed on the track at its
+    midpoint time, instead of at the fix taken before it started.
     Args:
         interval: Time between scans in seconds
         duration: Total collection time in seconds (None for infinite)
         stop_event: Threading event to stop collection
+        survey: Interpolate scan positions from the GPS track
     """
     print(f"Starting dynamic WiFi collection (interval: {interval}s)")
     print("Press Ctrl+C to stop collection")
 
-    start_time = time.time()
-    last_lat = None
-    last_lon = None
-    scan_count = 0
+    written = 0
     
     # Distance threshold in meters - locations closer than this are considered the same
     location_distance_threshold = 0.5 
 
-    try:
-        while True:
-            # Check if we should stop
-            if stop_event and stop_event.is_set():
-                break
-            if duration and (time.time() - start_time) >= duration:
-                print("\nCollection duration reached")
-                break
-
-            # Get current location
-            lat, lon, loc_desc = get_current_location()
-            if not lat or not lon:
-                print("Could not determine location, skipping scan")
-                time.sleep(interval)
-                continue
+    # Load existing data once; each scan is appended to the log instead of rewriting the file
+    data = load_existing_data()
 
-            # Get WiFi data
-            wifi_networks = get_wifi_networks(samples=3)
-            scan_count += 1
+    if survey:
+        track = Track()
+        projector = TrackProjector(track)
+        recorder = SurveyRecorder(SURVEY_DIR)
+        print(f"Survey mode: recording to {recorder.fixes_path} and {recorder.scans_path}")
 
-            # Load existing data
-            data = load_existing_data()
-            timestamp = datetime.now().isoformat()
+        def on_fix(fix):
+            # Fixed and IP positions don't follow the surveyor
+            if not track_fix(fix.source, fix.accuracy):
+                return
+            track.add(fix.timestamp, fix.latitude, fix.longitude)
+            recorder.record_fix(fix)
+
+        get_location_service().subscribe(on_fix)
+
+    def survey_scan():
+        scan_start = time.time()
+        wifi_networks = get_wifi_networks(samples=3)
+        record = {
+            "networks": wifi_networks,
+            "scan_start": scan_start,
+            "scan_end": time.time()
+        }
+        recorder.record_scan(record)
+        return record
+
+    def scan():
+        if survey:
+            return survey_scan()
+
+        # Get current location
+        lat, lon, loc_desc = get_current_location()
+        if not lat or not lon:
+            print("Could not determine location, skipping scan")
+            return None
+
+        # Get WiFi data, stamped with the time it was taken rather than written
+        wifi_networks = get_wifi_networks(samples=3)
+        return {
+            "latitude": lat,
+            "longitude": lon,
+            "networks": wifi_networks,
+            "timestamp": datetime.now().isoformat()
+        }
+
+    def write_batch(records):
+        if survey:
+            # Only scans the track already covers are ready to be placed
+            records = projector.push(records)
+        store_records(records)
+
+    def store_records(records):
+        nonlocal written
+        if not records:
+            return
+        index = get_location_index()
+        changed = {}
+        for record in records:
+            lat, lon = record["latitude"], record["longitude"]
+            timestamp = record["timestamp"]
+            written += 1
 
             # Check if we have an existing entry for this location (within threshold)
-            location_found = False
-            for key, location in data["locations"].items():
-                location_lat = location["latitude"]
-                location_lon = location["longitude"]
-                
-                # Calculate distance between current and stored location
-                distance = calculate_distance(lat, lon, location_lat, location_lon)
-                
-                # If within threshold, consider it the same location
-                if distance < location_distance_threshold:
-                    # Update existing location data
-                    data["locations"][key]["networks"] = wifi_networks
-                    data["locations"][key]["timestamp"] = timestamp
-                    data["locations"][key]["note"] = f"Updated scan at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-                    location_found = True
-                    print(f"\rUpdating existing location - Scan #{scan_count} - Distance: {distance:.2f}m", end="")
-                    break
+            match = index.nearest(lat, lon, location_distance_threshold)
+            if match and match[1] in data["locations"]:
+                distance, key, _ = match
+                # Update a copy of the location; the published one may be in a reader's snapshot
+                location = dict(data["locations"][key])
+                old_networks = location.get("networks")
+                location["networks"] = record["networks"]
+                location["timestamp"] = timestamp
+                location["note"] = f"Updated scan at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+                data["locations"][key] = location
+                index.insert(key, location["latitude"], location["longitude"], location)
+                get_ssid_aggregates().replace_location(old_networks, location)
+                location_key = key
+                print(f"\rUpdating existing location - Scan #{written} - Distance: {distance:.2f}m", end="")
 
             # If no existing location found, create new entry
-            if not location_found:
+            else:
                 location_name = f"Dynamic_Scan_{timestamp}"
                 location_key = f"{location_name}_{timestamp}"
                 data["locations"][location_key] = {
@@ -265,223 +399,98 @@ def dynamic_wifi_collection(interval=10, duration=None, stop_event=None):
                     "latitude": lat,
                     "longitude": lon,
                     "timestamp": timestamp,
-                    "networks": wifi_networks,
+                    "networks": record["networks"],
                     "note": f"New location scan at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
                 }
-                print(f"\rNew location added - Scan #{scan_count}", end="")
+                index.insert(location_key, lat, lon, data["locations"][location_key])
+                get_ssid_aggregates().add_location(data["locations"][location_key])
+                print(f"\rNew location added - Scan #{written}", end="")
+            changed[location_key] = data["locations"][location_key]
 
-            # Save updated data
+        # Append the batch to the log in one write, folding the log into the snapshot now and then
+        if get_storage().upsert_many(changed.items()):
             save_data(data)
-            
-            # Update last known location
-            last_lat, last_lon = lat, lon
-            
-            # Wait for next interval
-            time.sleep(interval)
+        # Then let the web threads see the batch all at once
+        publish_locations(changed)
 
+    pipeline = ScanPipeline(scan, write_batch, interval)
+    try:
+        pipeline.run(duration=duration, stop_event=stop_event)
+        if duration and not (stop_event and stop_event.is_set()):
+            print("\nCollection duration reached")
     except KeyboardInterrupt:
         print("\nDynamic collection stopped by user")
     finally:
+        pipeline.stop()
+        if survey:
+            store_records(projector.flush())
+            recorder.close()
+            print(f"\nSurvey: {projector.placed} scans placed on the track, {projector.dropped} dropped with no fix nearby")
         # Always run cleanup when scanning stops (whether by KeyboardInterrupt or duration)
         cleanup_and_transfer_data()
-    print(f"\nCollection completed: {scan_count} scans performed")
-    return scan_count
-
-def get_wifi_networks(samples=3, delay=0.2):
-    all_samples = []
-    
-    for _ in range(samples):
-        networks = get_single_wifi_scan()
-        if networks:
-            all_samples.append(networks)
-        time.sleep(delay)
-    
-    return aggregate_wifi_samples(all_samples)
+        flush_all()
+        for line in write_report():
+            print(f"Writes to {line}")
+        if tile_server is not None:
+            tile_server.close()
+        if event_broadcaster is not None:
+            event_broadcaster.close()
+    if pipeline.dropped or pipeline.missed_ticks:
+        print(f"Dropped {pipeline.dropped} queued scans, skipped {pipeline.missed_ticks} overrun ticks")
+    if pipeline.errors:
+        print(f"{pipeline.errors} scans failed")
+    print(f"\nCollection completed: {pipeline.produced} scans performed")
+    return pipeline.produced
+
+def get_wifi_networks(samples=3, delay=0.2, tolerance=None, max_samples=None, max_time=None):
+    """Scan the current point and return its aggregated networks.
+
+    With a tolerance (dB, default SAMPLE_TOLERANCE) sampling is adaptive:
+    `samples` becomes the minimum and scanning stops once every network's
+    RSSI standard error is within tolerance, or at the sample/time budget.
+    """
+    tolerance = SAMPLE_TOLERANCE if tolerance is None else tolerance
+    aggregator = collect_samples(
+        get_single_wifi_scan, samples=samples, delay=delay, tolerance=tolerance,
+        max_samples=MAX_SAMPLES if max_samples is None else max_samples,
+        max_time=MAX_SAMPLE_TIME if max_time is None else max_time)
+    if tolerance is not None:
+        print(f"Took {aggregator.scans} samples (tolerance {tolerance} dB)")
+    return aggregator.results()
 
 def get_single_wifi_scan():
-    wifi_data = []
-    os_type = platform.system()
-    
-    noise_floor = -95
-
-    if os_type == "Windows":
-        try:
-            subprocess.run("netsh wlan show networks mode=bssid", shell=True, stderr=subprocess.DEVNULL)
-            output = subprocess.check_output("netsh wlan show networks mode=bssid", shell=True).decode()
-            ssid_blocks = re.split(r"SSID \d+ : ", output)[1:]  
-            
-            for block in ssid_blocks:
-                lines = block.strip().split('\n')
-                if not lines:
-                    continue
-                    
-                ssid = lines[0].strip()
-                if not ssid:
-                    continue
-                    
-                signal_match = re.search(r"Signal\s*:\s*(\d+)%", block)
-                auth_match = re.search(r"Authentication\s*:\s*(\S+)", block)
-                channel_match = re.search(r"Channel\s*:\s*(\d+)", block)
-                
-                if signal_match:
-                    signal_percent = int(signal_match.group(1))
-                    signal_dbm = int((signal_percent / 2) - 100)
-                    snr = signal_dbm - noise_floor
-                    auth_type = auth_match.group(1) if auth_match else "Unknown"
-                    channel = int(channel_match.group(1)) if channel_match else 0
-                    
-                    wifi_data.append({
-                        "ssid": ssid, 
-                        "signal": signal_dbm,
-                        "signal_percent": signal_percent,
-                        "auth": auth_type,
-                        "channel": channel,
-                        "noise_floor": noise_floor,
-                        "snr": snr
-                    })
-            
-            print(f"Found {len(wifi_data)} networks in scan")
-
-        except Exception as e:
-            print(f"Error fetching WiFi data: {str(e)}")
-
-    elif os_type == "Linux":
-        try:
-            interfaces = subprocess.check_output(["ls", "/sys/class/net"]).decode().split()
-            wifi_interface = None
-            
-            for interface in interfaces:
-                try:
-                    output = subprocess.check_output(["iwconfig", interface], stderr=subprocess.DEVNULL).decode()
-                    if "ESSID" in output:
-                        wifi_interface = interface
-                        break
-                except:
-                    continue
-            
-            if wifi_interface:
-                try:
-                    survey_output = subprocess.check_output(["iw", "dev", wifi_interface, "survey", "dump"], stderr=subprocess.DEVNULL).decode()
-                    noise_match = re.search(r"noise:\s*(-\d+)", survey_output)
-                    if noise_match:
-                        noise_floor = int(noise_match.group(1))
-                except:
-                    pass
-                
-                output = subprocess.check_output(["sudo", "iwlist", wifi_interface, "scan"]).decode()
-                network_sections = re.split(r"Cell \d+ - ", output)[1:]
-                
-                for section in network_sections:
-                    ssid_match = re.search(r'ESSID:"(.*?)"', section)
-                    signal_match = re.search(r"Signal level=(-?\d+) dBm", section)
-                    channel_match = re.search(r"Channel:(\d+)", section)
-                    encryption_match = re.search(r"Encryption key:(on|off)", section)
-                    auth_match = re.search(r"IE: (?:WPA|IEEE 802.11i/WPA2|WPA2) Version \d+", section)
-                    
-                    if ssid_match and signal_match:
-                        ssid = ssid_match.group(1)
-                        signal_dbm = int(signal_match.group(1))
-                        snr = signal_dbm - noise_floor
-                        channel = int(channel_match.group(1)) if channel_match else 0
-                        auth_type = "Open"
-                        if encryption_match and encryption_match.group(1) == "on":
-                            if auth_match:
-                                if "WPA2" in auth_match.group(0):
-                                    auth_type = "WPA2"
-                                else:
-                                    auth_type = "WPA"
-                            else:
-                                auth_type = "WEP"
-                        
-                        signal_percent = max(0, min(100, 2 * (signal_dbm + 100)))
-                        
-                        wifi_data.append({
-                            "ssid": ssid, 
-                            "signal": signal_dbm,
-                            "signal_percent": signal_percent,
-                            "auth": auth_type,
-                            "channel": channel,
-                            "noise_floor": noise_floor,
-                            "snr": snr
-                        })
-        except Exception as e:
-            print(f"Error fetching WiFi data on Linux: {str(e)}")
-    
-    return wifi_data
-
-def aggregate_wifi_samples(samples):
-    if not samples:
+    try:
+        # iwlist/iw scan in the privileged helper process; nmcli, netsh and replay scan in-process
+        return get_scanner().scan()
+    except EOFError:
+        # A replay ran out of scans; let the run end instead of scanning nothing forever
+        raise
+    except Exception as e:
+        print(f"Error fetching WiFi data: {str(e)}")
         return []
-    
-    if len(samples) == 1:
-        return sorted(samples[0], key=lambda n: n["signal"], reverse=True)
-    
-    networks_by_ssid = {}
-    
-    for sample in samples:
-        for network in sample:
-            ssid = network["ssid"]
-            if ssid not in networks_by_ssid:
-                networks_by_ssid[ssid] = []
-            networks_by_ssid[ssid].append(network)
-    
-    result = []
-    for ssid, networks in networks_by_ssid.items():
-        signal_values = [n["signal"] for n in networks]
-        snr_values = [n["snr"] for n in networks]
-        avg_signal = int(statistics.mean(signal_values))
-        avg_snr = int(statistics.mean(snr_values))
-        
-        signal_variance = None
-        if len(signal_values) > 1:
-            try:
-                signal_variance = int(statistics.stdev(signal_values))
-            except:
-                pass
-        
-        strongest = max(networks, key=lambda n: n["signal"])
-        
-        network_data = {
-            "ssid": ssid,
-            "signal": avg_signal,
-            "signal_percent": strongest.get("signal_percent", 0),
-            "auth": strongest.get("auth", "Unknown"),
-            "channel": strongest.get("channel", 0),
-            "noise_floor": strongest.get("noise_floor", -95),
-            "snr": avg_snr,
-            "samples": len(networks)
-        }
-        
-        if signal_variance:
-            network_data["signal_variance"] = signal_variance
-        
-        result.append(network_data)
-    
-    return sorted(result, key=lambda n: n["signal"], reverse=True)
+
+def get_storage():
+    """Return the storage backend for DATA_FILE, recreating it if the path changed"""
+    global storage
+    if storage is None or storage.snapshot_path != DATA_FILE:
+        if storage is not None:
+            storage.close()
+        storage = open_storage(DATA_FILE)
+    return storage
 
 def load_existing_data():
+    """Load DATA_FILE, replaying the scan log on top of a JSON snapshot"""
     try:
-        if os.path.exists(DATA_FILE):
-            with open(DATA_FILE, 'r') as file:
-                return json.load(file)
+        return get_storage().load()
     except Exception as e:
         print(f"Error loading existing data: {e}")
     
-    return {
-        "locations": {},
-        "metadata": {
-            "created": datetime.now().isoformat(),
-            "last_updated": datetime.now().isoformat(),
-            "version": "1.0"
-        }
-    }
+    return empty_data()
 
 def save_data(data_obj):
-    data_obj["metadata"]["last_updated"] = datetime.now().isoformat()
-    
+    """Write the full document to DATA_FILE, truncating the scan log for JSON files"""
     try:
-        with open(DATA_FILE, 'w') as file:
-            json.dump(data_obj, file, indent=2)
+        get_storage().compact(data_obj)
         print(f"Data saved to {DATA_FILE}")
     except Exception as e:
         print(f"Error saving data: {e}")
@@ -519,163 +528,27 @@ def list_known_locations():
         print(f"  {key}: {loc['description']} ({loc['latitude']}, {loc['longitude']})")
     print()
 
-def get_current_location():
-    try:
-        print("Attempting to determine your current location...")
-        try:
-            with urllib.request.urlopen('https://ipinfo.io/json', timeout=5) as response:
-                data = json.loads(response.read().decode())
-                if 'loc' in data:
-                    lat, lon = map(float, data['loc'].split(','))
-                    print(f"Location detected: {lat}, {lon} (approximate based on IP)")
-                    return lat, lon, f"IP-based location: {data.get('city', '')}, {data.get('region', '')}"
-        except Exception as e:
-            print(f"Error determining location via IP: {e}")
-            
-        import http.server
-        import threading
-        import time
-        import urllib.parse
-        
-        location_data = {'lat': None, 'lon': None, 'accuracy': None}
-        server_port = 8000
-        
-        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        while True:
-            try:
-                s.bind(('', server_port))
-                s.close()
-                break
-            except:
-                server_port += 1
-                if server_port > 9000:
-                    raise Exception("No available ports found")
-        
-        class LocationHandler(http.server.BaseHTTPRequestHandler):
-            def do_GET(self):
-                if self.path.startswith('/setlocation'):
-                    query = urllib.parse.urlparse(self.path).query
-                    params = dict(urllib.parse.parse_qsl(query))
-                    
-                    if 'lat' in params and 'lon' in params:
-                        location_data['lat'] = float(params['lat'])
-                        location_data['lon'] = float(params['lon'])
-                        if 'accuracy' in params:
-                            location_data['accuracy'] = float(params['accuracy'])
-                        
-                    self.send_response(200)
-                    self.send_header('Content-type', 'text/html')
-                    self.end_headers()
-                    self.wfile.write(b"<html><body><h1>Location received!</h1><p>You can close this window now.</p></body></html>")
-                else:
-                    self.send_response(200)
-                    self.send_header('Content-type', 'text/html')
-                    self.end_headers()
-                    
-                    html = """
-                    <html>
-                    <head>
-                        <title>Location Permission</title>
-                        <script>
-                        function getLocation() {
-                            if (navigator.geolocation) {
-                                // Request high accuracy
-                                const options = {
-                                    enableHighAccuracy: true,
-                                    timeout: 15000,
-                                    maximumAge: 0
-                                };
-                                navigator.geolocation.getCurrentPosition(showPosition, showError, options);
-                                document.getElementById('status').innerHTML = "Getting your location with high accuracy...";
-                            } else {
-                                document.getElementById('status').innerHTML = "Geolocation is not supported by this browser.";
-                            }
-                        }
-                        
-                        function showPosition(position) {
-                            var lat = position.coords.latitude;
-                            var lon = position.coords.longitude;
-                            var accuracy = position.coords.accuracy;
-                            
-                            document.getElementById('status').innerHTML = 
-                                "Location detected: " + lat + ", " + lon + "<br>Accuracy: " + 
-                                accuracy + " meters";
-                            
-                            window.location.href = "/setlocation?lat=" + lat + "&lon=" + lon + "&accuracy=" + accuracy;
-                        }
-                        
-                        function showError(error) {
-                            switch(error.code) {
-                                case error.PERMISSION_DENIED:
-                                    document.getElementById('status').innerHTML = "User denied the request for Geolocation."
-                                    break;
-                                case error.POSITION_UNAVAILABLE:
-                                    document.getElementById('status').innerHTML = "Location information is unavailable."
-                                    break;
-                                case error.TIMEOUT:
-                                    document.getElementById('status').innerHTML = "The request to get user location timed out."
-                                    break;
-                                case error.UNKNOWN_ERROR:
-                                    document.getElementById('status').innerHTML = "An unknown error occurred."
-                                    break;
-                            }
-                        }
-                        
-                        window.onload = getLocation;
-                        </script>
-                    </head>
-                    <body>
-                        <h1>WiFi Data Collector - Location Permission</h1>
-                        <p>To collect accurate location data, please allow location access when prompted.</p>
-                        <p>For best results:</p>
-                        <ul>
-                            <li>Use a device with GPS</li>
-                            <li>Enable WiFi and Bluetooth for better indoor accuracy</li>
-                            <li>If using a mobile device, grant precise location permission</li>
-                        </ul>
-                        <p id="status">Waiting for location permission...</p>
-                        <button onclick="getLocation()">Try Again</button>
-                    </body>
-                    </html>
-                    """
-                    self.wfile.write(html.encode())
-                    
-            def log_message(self, format, *args):
-                return
-        
-        server = http.server.HTTPServer(('', server_port), LocationHandler)
-        thread = threading.Thread(target=server.serve_forever)
-        thread.daemon = True
-        thread.start()
-        
-        webbrowser.open(f'http://localhost:{server_port}')
-        print(f"A browser window has been opened to request your location.")
-        print("Please allow location access when prompted.")
-        print("For best results, use a device with GPS and enable WiFi/Bluetooth.")
-        
-        timeout = 60
-        start_time = time.time()
-        while location_data['lat'] is None and time.time() - start_time < timeout:
-            time.sleep(1)
-        
-        server.shutdown()
-        thread.join()
-        
-        if location_data['lat'] is not None and location_data['lon'] is not None:
-            accuracy_msg = f", accuracy: {location_data['accuracy']} meters" if location_data['accuracy'] else ""
-            print(f"Location detected: {location_data['lat']}, {location_data['lon']}{accuracy_msg}")
-            accuracy_desc = f" (accuracy: {location_data['accuracy']:.1f}m)" if location_data['accuracy'] else ""
-            return location_data['lat'], location_data['lon'], f"Browser-based geolocation{accuracy_desc}"
-            
-    except Exception as e:
-        print(f"Error determining location via browser: {e}")
-    
-    return None, None, None
+def get_current_location(timeout=0):
+    """Return (lat, lon, description) from the location service's cached fix.
+
+    Never blocks by default; a one-shot collection can pass `timeout` to wait
+    that many seconds for a first fix. Returns (None, None, None) without one.
+    """
+    # Recorded scans carry the position they were taken at
+    scanner_location = get_scanner().location()
+    if scanner_location:
+        return scanner_location
+
+    service = get_location_service()
+    fix = service.wait(timeout) if timeout else service.current()
+    if fix is None:
+        return None, None, None
+    return fix.latitude, fix.longitude, fix.description
 
 def collect_wifi_data(location_name=None, latitude=None, longitude=None, samples=3, note=None):
     print(f"Collecting WiFi data with {samples} samples...")
     
-    auto_lat, auto_lon, auto_desc = get_current_location()
+    auto_lat, auto_lon, auto_desc = get_current_location(timeout=LOCATION_TIMEOUT)
     
     if auto_lat and auto_lon:
         latitude = auto_lat
@@ -735,8 +608,12 @@ def collect_wifi_data(location_name=None, latitude=None, longitude=None, samples
         "networks": wifi_networks,
         "note": note if note else ""
     }
+    get_location_index().insert(location_key, latitude, longitude, data["locations"][location_key])
+    get_ssid_aggregates().add_location(data["locations"][location_key])
     
-    save_data(data)
+    if get_storage().upsert(location_key, data["locations"][location_key]):
+        save_data(data)
+    publish_locations({location_key: data["locations"][location_key]})
     
     print(f"\nFound {len(wifi_networks)} WiFi networks at {location_name} ({latitude}, {longitude})")
     for network in wifi_networks:
@@ -757,28 +634,21 @@ def cleanup_and_transfer_data():
     
     # Load data from both files
     try:
-        # Load dynamic data (temporary)
-        with open('dynamic_data.json', 'r') as file:
-            dynamic_data = json.load(file)
+        # Load dynamic data (temporary), including scans still in the log
+        dynamic_data = get_storage().load()
         
-        # Load wifi data (permanent)
-        wifi_data = {}
-        if os.path.exists('wifi_data.json'):
-            with open('wifi_data.json', 'r') as file:
-                wifi_data = json.load(file)
-        else:
-            # Initialize with empty structure if file doesn't exist
-            wifi_data = {
-                "locations": {},
-                "metadata": {
-                    "created": datetime.now().isoformat(),
-                    "last_updated": datetime.now().isoformat()
-                }
-            }
+        # Load wifi data (permanent); changes are written back one location at a time
+        permanent = open_storage(PERMANENT_DATA_FILE)
+        wifi_data = permanent.load()
+        
+        # Bucket permanent locations into cells of MERGE_DISTANCE so each incoming
+        # location is only compared against its neighbouring cells
+        merge_index = build_location_index(wifi_data["locations"], cell_size=MERGE_DISTANCE)
         
         # Transfer locations from dynamic to permanent storage
         locations_added = 0
         locations_updated = 0
+        compaction_due = False
         
         for loc_key, loc_data in dynamic_data.get("locations", {}).items():
             # Check if this location exists in permanent storage
@@ -788,53 +658,41 @@ def cleanup_and_transfer_data():
             if not lat or not lon:
                 continue
                 
-            # Look for matching location
-            location_exists = False
-            for wifi_key, wifi_loc in wifi_data["locations"].items():
-                wifi_lat = wifi_loc.get("latitude")
-                wifi_lon = wifi_loc.get("longitude")
-                
-                if not wifi_lat or not wifi_lon:
-                    continue
-                    
-                # Calculate distance between locations
-                dist = calculate_distance(lat, lon, wifi_lat, wifi_lon)
-                
-                # If the locations are close enough, update the existing entry
-                if dist < 10:  # 10 meters threshold for considering same location
-                    # Update existing location with new data
-                    wifi_data["locations"][wifi_key]["networks"] = loc_data["networks"]
-                    wifi_data["locations"][wifi_key]["timestamp"] = loc_data["timestamp"]
-                    wifi_data["locations"][wifi_key]["note"] = f"Updated from dynamic scan on {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-                    location_exists = True
-                    locations_updated += 1
-                    break
-            
-            # If no matching location found, add as new
-            if not location_exists:
+            # Look for the closest matching location
+            match = merge_index.nearest(lat, lon, MERGE_DISTANCE)
+            if match:
+                # Update existing location with new data
+                wifi_key = match[1]
+                wifi_loc = wifi_data["locations"][wifi_key]
+                wifi_loc["networks"] = loc_data["networks"]
+                wifi_loc["timestamp"] = loc_data["timestamp"]
+                wifi_loc["note"] = f"Updated from dynamic scan on {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+                locations_updated += 1
+            else:
                 # Generate a permanent key (without the temporary timestamp)
-                new_key = f"Location_{lat:.6f}_{lon:.6f}"
-                wifi_data["locations"][new_key] = loc_data
+                wifi_key = f"Location_{lat:.6f}_{lon:.6f}"
+                wifi_data["locations"][wifi_key] = loc_data
+                merge_index.insert(wifi_key, lat, lon, loc_data)
                 locations_added += 1
+            
+            compaction_due = permanent.upsert(wifi_key, wifi_data["locations"][wifi_key]) or compaction_due
         
         # Update metadata
-        wifi_data["metadata"]["last_updated"] = datetime.now().isoformat()
         wifi_data["metadata"]["location_count"] = len(wifi_data["locations"])
+        compaction_due = permanent.update_metadata({"location_count": len(wifi_data["locations"])}) or compaction_due
         
-        # Save updated permanent data
-        with open('wifi_data.json', 'w') as file:
-            json.dump(wifi_data, file, indent=2)
+        # Fold the log into the permanent snapshot only once it has grown large
+        if compaction_due:
+            permanent.compact(wifi_data)
+        permanent.close()
         
-        # Clear dynamic data by creating a fresh file with empty structure
-        empty_data = {
-            "locations": {},
-            "metadata": {
-                "created": datetime.now().isoformat(),
-                "last_updated": datetime.now().isoformat()
-            }
-        }
-        with open('dynamic_data.json', 'w') as file:
-            json.dump(empty_data, file, indent=2)
+        # Clear dynamic data by compacting an empty structure over the snapshot and log
+        get_storage().compact(empty_data())
+        get_location_index().clear()
+        get_ssid_aggregates().clear()
+        snapshot = get_snapshot_store().publish(empty_data())
+        if event_broadcaster is not None:
+            event_broadcaster.publish("reset", {"version": snapshot.version}, event_id=snapshot.version)
         
         print(f"Data transfer complete: {locations_updated} locations updated, {locations_added} new locations added")
         print(f"Total locations in permanent storage: {len(wifi_data['locations'])}")
@@ -855,26 +713,58 @@ def parse_arguments():
     return parser.parse_args()
 
 def main():
+    global DATA_FILE, SAMPLE_TOLERANCE, MAX_SAMPLES, MAX_SAMPLE_TIME, SURVEY_DIR
     parser = argparse.ArgumentParser(description='Dynamically collect WiFi network data over time.')
-    parser.add_argument('--interval', '-i', type=int, default=10,
+    parser.add_argument('--interval', '-i', type=float, default=10,
                       help='Scanning interval in seconds (default: 10)')
     parser.add_argument('--duration', '-d', type=int,
                       help='Total collection duration in seconds (default: infinite)')
     parser.add_argument('--output', '-o',
-                      help='Output JSON file (default: dynamic_data.json)')
+                      help='Output file, .json or .db for SQLite (default: dynamic_data.json)')
     parser.add_argument('--no-web', action='store_true',
                       help='Disable web interface')
     parser.add_argument('--port', '-p', type=int, default=5000,
                       help='Port for web interface (default: 5000)')
+    parser.add_argument('--tolerance', type=float,
+                      help='Sample each point adaptively until RSSI standard error is below this many dB')
+    parser.add_argument('--max-samples', type=int, default=MAX_SAMPLES,
+                      help=f'Most samples per point when sampling adaptively (default: {MAX_SAMPLES})')
+    parser.add_argument('--max-sample-time', type=float,
+                      help='Most seconds per point when sampling adaptively')
+    parser.add_argument('--location-source', action='append', metavar='SOURCE',
+                      help='Location source, highest priority first: fixed:LAT,LON, gpsd[:HOST[:PORT]], '
+                           'nmea:HOST:PORT, browser[:PORT] or ip (default: ip, with browser if it fails)')
+    parser.add_argument('--survey', action='store_true',
+                      help='Walk survey: place each scan on the GPS track at its midpoint time')
+    parser.add_argument('--survey-dir', default=SURVEY_DIR,
+                      help=f'Where survey sessions are recorded (default: {SURVEY_DIR})')
+    parser.add_argument('--scanner', choices=sorted(SCANNER_BACKENDS),
+                      help='Scanner backend (default: netsh on Windows, iwlist elsewhere)')
+    parser.add_argument('--replay', help='Replay recorded scans from this file instead of scanning')
+    parser.add_argument('--replay-rate', type=float, default=1.0,
+                      help='Replay speed, 1 = real time, 0 = as fast as possible (default: 1)')
+    parser.add_argument('--flush-interval', type=float,
+                      help='Seconds to collect writes into one commit, 0 = write through (default: 1)')
+    parser.add_argument('--fsync', choices=FSYNC_POLICIES,
+                      help='What to fsync: always, snapshots (default) or never')
     args = parser.parse_args()
 
-    global DATA_FILE
     if args.output:
         DATA_FILE = args.output
+    SAMPLE_TOLERANCE = args.tolerance
+    SURVEY_DIR = args.survey_dir
+    MAX_SAMPLES = args.max_samples
+    MAX_SAMPLE_TIME = args.max_sample_time
+    if args.scanner or args.replay:
+        configure_scanner(args.scanner, replay=args.replay, rate=args.replay_rate)
+    if args.location_source:
+        configure_location(args.location_source)
+    configure_persistence(args.flush_interval, args.fsync)
 
     print("=== Dynamic WiFi Data Collector ===")
     print(f"Output file: {DATA_FILE}")
     print(f"Interval: {args.interval} seconds")
+    print(f"Scanner: {get_scanner().backend}")
     if args.duration:
         print(f"Duration: {args.duration} seconds")
     else:
@@ -889,7 +779,8 @@ def main():
     
     dynamic_wifi_collection(
         interval=args.interval,
-        duration=args.duration
+        duration=args.duration,
+        survey=args.survey
     )
 
 if __name__ == "__main__":
@@ -0,0 +1,149 @@
+"""Server-Sent Events fan-out for live updates.
+
+The collector publishes each event once; EventBroadcaster formats it and
+hands it to every connected client's Subscription. A subscription holds at
+most `queue_size` events. A client that falls that far behind loses its
+backlog and gets a single "resync" event instead, telling it to refetch
+the current state, so publish() never blocks on a slow client and the
+memory a client can pin is bounded.
+
+stream() is the generator a Flask Response sends as text/event-stream. It
+writes a comment line every HEARTBEAT seconds while idle, which keeps
+proxies from closing the connection and notices disconnected clients. A
+route that checks the client's state before streaming subscribes first
+and hands the subscription to stream(), so nothing published in between
+is lost.
+"""
+import collections
+import json
+import threading
+
+EVENT_QUEUE_SIZE = 64
+
+# Seconds between keep-alive comments on an idle stream
+HEARTBEAT = 15.0
+
+# Milliseconds browsers wait before reconnecting a dropped stream
+RETRY_MS = 3000
+
+def format_event(event, data, event_id=None):
+    """One SSE message: optional id, event name and JSON data"""
+    lines = [] if event_id is None else [f"id: {event_id}"]
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return "\n".join(lines) + "\n\n"
+
+class Subscription:
+    """Bounded queue of formatted events for one client"""
+
+    def __init__(self, queue_size=EVENT_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.dropped = 0
+        self._events = collections.deque()
+        self._lagged = False
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def put(self, message):
+        with self._cond:
+            if len(self._events) >= self.queue_size:
+                # Too far behind to catch up event by event; have it refetch instead
+                self.dropped += len(self._events) + 1
+                self._events.clear()
+                self._lagged = True
+            elif not self._lagged:
+                self._events.append(message)
+            else:
+                self.dropped += 1
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """The next message, a resync message, or None on timeout or close"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._events or self._lagged or self._closed, timeout)
+            if self._events:
+                return self._events.popleft()
+            if self._lagged and not self._closed:
+                self._lagged = False
+                return format_event("resync", {"reason": "lagged"})
+            return None
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+
+    @property
+    def closed(self):
+        return self._closed
+
+class EventBroadcaster:
+    """Publishes events to every subscribed client without waiting for any of them"""
+
+    def __init__(self, queue_size=EVENT_QUEUE_SIZE, heartbeat=HEARTBEAT):
+        self.queue_size = queue_size
+        self.heartbeat = heartbeat
+        self.published = 0
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._subscriptions)
+
+    def subscribe(self):
+        subscription = Subscription(self.queue_size)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscription.close()
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def publish(self, event, data, event_id=None):
+        """Queue an event for every client; returns the number of clients it went to"""
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        if not subscriptions:
+            return 0
+        message = format_event(event, data, event_id)
+        for subscription in subscriptions:
+            subscription.put(message)
+        self.published += 1
+        return len(subscriptions)
+
+    def stream(self, first=None, subscription=None):
+        """Generator of SSE text for one client, starting with the message `first` if given.
+
+        With a `subscription` from subscribe() the stream carries every
+        event published since it was made; otherwise it subscribes now.
+        """
+        if subscription is None:
+            subscription = self.subscribe()
+        try:
+            yield f"retry: {RETRY_MS}\n\n"
+            if first is not None:
+                yield first
+            while not subscription.closed:
+                message = subscription.get(self.heartbeat)
+                if message is not None:
+                    yield message
+                elif not subscription.closed:
+                    yield ": keep-alive\n\n"
+        finally:
+            self.unsubscribe(subscription)
+
+    def close(self):
+        """End every client's stream"""
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+            self._subscriptions.clear()
+        for subscription in subscriptions:
+            subscription.close()
+
+    def stats(self):
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        return {"clients": len(subscriptions), "published": self.published,
+                "dropped": sum(subscription.dropped for subscription in subscriptions)}
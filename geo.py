@@ -0,0 +1,111 @@
+import math
+import numpy as np
+
+# Earth's radius in meters
+EARTH_RADIUS = 6371000
+
+# Meters per degree of latitude
+METERS_PER_DEGREE = 111320
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+# Geohash length of stable location keys; 9 characters is a cell of about 4.8 x 4.8 m
+GEOHASH_PRECISION = 9
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Calculate distance between two coordinates in meters"""
+    φ1 = math.radians(lat1)
+    φ2 = math.radians(lat2)
+    Δφ = math.radians(lat2 - lat1)
+    Δλ = math.radians(lon2 - lon1)
+
+    a = math.sin(Δφ/2) * math.sin(Δφ/2) + \
+        math.cos(φ1) * math.cos(φ2) * \
+        math.sin(Δλ/2) * math.sin(Δλ/2)
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
+    return EARTH_RADIUS * c
+
+def radius_degrees(lat, radius):
+    """(latitude, longitude) half-widths in degrees of a box holding every point within `radius` meters.
+
+    Distances are haversine on EARTH_RADIUS, so the radius is converted
+    with the same radius. The longitude half-width uses the highest
+    latitude the circle reaches, where a degree of longitude is shortest.
+    """
+    lat_deg = math.degrees(radius / EARTH_RADIUS)
+    max_lat = min(abs(lat) + lat_deg, 90.0)
+    # sin(Δλ/2) <= sin(d/2R) / cos(φ) for every point of the circle
+    ratio = math.sin(radius / (2 * EARTH_RADIUS)) / max(math.cos(math.radians(max_lat)), 1e-12)
+    lon_deg = 180.0 if ratio >= 1 else math.degrees(2 * math.asin(ratio))
+    return lat_deg, lon_deg
+
+def as_column(values):
+    """Return values as a contiguous float64 array"""
+    return np.ascontiguousarray(values, dtype=np.float64)
+
+def haversine_one_to_many(lat, lon, lats, lons):
+    """Distances in meters from one point to each of `lats`/`lons`"""
+    lats = as_column(lats)
+    lons = as_column(lons)
+    φ1 = math.radians(lat)
+    φ2 = np.radians(lats)
+    sin_dφ = np.sin((φ2 - φ1) * 0.5)
+    sin_dλ = np.sin(np.radians(lons - lon) * 0.5)
+    a = sin_dφ * sin_dφ + math.cos(φ1) * np.cos(φ2) * sin_dλ * sin_dλ
+    # arcsin form is equivalent to atan2(√a, √(1-a)) for a in [0, 1]
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def haversine_many_to_many(lats1, lons1, lats2, lons2):
+    """(N, M) matrix of distances in meters between two sets of points"""
+    φ1 = np.radians(as_column(lats1))[:, None]
+    λ1 = np.radians(as_column(lons1))[:, None]
+    φ2 = np.radians(as_column(lats2))[None, :]
+    λ2 = np.radians(as_column(lons2))[None, :]
+    sin_dφ = np.sin((φ2 - φ1) * 0.5)
+    sin_dλ = np.sin((λ2 - λ1) * 0.5)
+    a = sin_dφ * sin_dφ + np.cos(φ1) * np.cos(φ2) * sin_dλ * sin_dλ
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def equirectangular_one_to_many(lat, lon, lats, lons):
+    """Equirectangular approximation of haversine_one_to_many.
+
+    Accurate to well under 0.1% at survey scales (a few km) and cheaper,
+    since it needs a single cosine.
+    """
+    lats = as_column(lats)
+    lons = as_column(lons)
+    k = math.cos(math.radians(lat))
+    x = (lons - lon) * k
+    y = lats - lat
+    return np.radians(np.sqrt(x * x + y * y)) * EARTH_RADIUS
+
+def geohash(lat, lon, precision=GEOHASH_PRECISION):
+    """Geohash of a point: `precision` base-32 characters, alternating longitude and latitude bits"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    value = bits = 0
+    use_lon = True
+    while len(chars) < precision:
+        coordinate, bounds = (lon, lon_range) if use_lon else (lat, lat_range)
+        mid = (bounds[0] + bounds[1]) / 2
+        if coordinate >= mid:
+            value = value * 2 + 1
+            bounds[0] = mid
+        else:
+            value *= 2
+            bounds[1] = mid
+        use_lon = not use_lon
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            value = bits = 0
+    return "".join(chars)
+
+def location_key(lat, lon, label=None, precision=GEOHASH_PRECISION):
+    """Stable storage key for a location: its label (default "Location") and geohash cell.
+
+    Every point in the same cell gets the same key, so storing a location
+    again replaces the earlier entry instead of adding one.
+    """
+    return f"{label or 'Location'}_{geohash(lat, lon, precision)}"
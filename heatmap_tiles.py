@@ -0,0 +1,339 @@
+"""Heatmap raster tiles rendered from signal surfaces.
+
+/tiles/<ssid>/<z>/<x>/<y>.png serves standard Web Mercator (slippy map)
+tiles that Leaflet overlays directly; ssid "_all" is the strongest network
+at each point. A tile is the SSID's signal surface (see signal_surface)
+sampled at the centre of each of its 256 x 256 pixels and coloured with
+the map legend's bands, all in NumPy, then PNG-encoded with zlib.
+
+Tiles are cached in memory (LRU) and on disk under
+<cache_dir>/<namespace>/<version>/<ssid>/<z>/<x>/<y>.png, keyed by the
+dataset version, so a new version never serves stale tiles. Only tiles
+with data go to disk; tiles outside a surface are answered with the
+shared empty tile. The disk holds at most `disk_cache_size` tiles rendered
+on request (the oldest are removed first) and a pyramid of at most as
+many. precompute() renders the pyramid for a new version in a background
+process pool, once no newer version has arrived for `quiet_period`
+seconds, and removes the previous versions' tiles once it is done.
+"""
+import collections
+import math
+import os
+import shutil
+import struct
+import threading
+import time
+import zlib
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor
+from multiprocessing import get_context
+from urllib.parse import quote
+import numpy as np
+from persistence import write_atomic
+from signal_surface import sample_grid
+
+TILE_SIZE = 256
+
+# Tile path segment for the strongest network at each point
+ALL_NETWORKS = "_all"
+
+# Zoom levels the background pass renders (the map opens at 16; OSM goes to 19)
+PYRAMID_ZOOMS = range(14, 20)
+
+TILE_CACHE_DIR = "tile_cache"
+TILE_CACHE_SIZE = 2048
+
+# Tiles kept on disk per namespace and version: rendered on request, and in the pyramid
+TILE_DISK_CACHE_SIZE = 20000
+TILE_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))
+
+# Tiles per process-pool job
+TILES_PER_JOB = 64
+
+# Same bands as the map legend: (lower bound in dBm, RGB)
+SIGNAL_BANDS = (
+    (-65, (0, 160, 0)),
+    (-75, (230, 200, 0)),
+    (-85, (255, 140, 0)),
+    (-math.inf, (220, 30, 30)),
+)
+HEATMAP_ALPHA = 150
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+def _colour_table():
+    """RGBA for every whole dBm from -128 to 127, indexed by dBm + 128"""
+    table = np.zeros((256, 4), dtype=np.uint8)
+    for dbm in range(-128, 128):
+        for bound, rgb in SIGNAL_BANDS:
+            if dbm > bound:
+                table[dbm + 128] = rgb + (HEATMAP_ALPHA,)
+                break
+    return table
+
+COLOUR_TABLE = _colour_table()
+
+def _png_chunk(tag, data):
+    return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xffffffff)
+
+def encode_png(rgba):
+    """Encode an (height, width, 4) uint8 array as an RGBA PNG"""
+    height, width, _ = rgba.shape
+    raw = np.zeros((height, width * 4 + 1), dtype=np.uint8)
+    # Each scanline starts with filter type 0 (none)
+    raw[:, 1:] = rgba.reshape(height, width * 4)
+    header = struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)
+    return (PNG_SIGNATURE + _png_chunk(b"IHDR", header)
+            + _png_chunk(b"IDAT", zlib.compress(raw.tobytes(), 6)) + _png_chunk(b"IEND", b""))
+
+EMPTY_TILE = encode_png(np.zeros((TILE_SIZE, TILE_SIZE, 4), dtype=np.uint8))
+
+def tile_bounds(z, x, y):
+    """(south, west, north, east) of a tile"""
+    n = 2 ** z
+    west = x / n * 360 - 180
+    east = (x + 1) / n * 360 - 180
+    north = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    south = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return south, west, north, east
+
+def tile_range(bbox, z):
+    """x and y ranges of the tiles at zoom z covering a (south, west, north, east) box"""
+    south, west, north, east = bbox
+    n = 2 ** z
+
+    def tile_x(lon):
+        return min(n - 1, max(0, int((lon + 180) / 360 * n)))
+
+    def tile_y(lat):
+        lat = math.radians(max(-85.0511, min(85.0511, lat)))
+        return min(n - 1, max(0, int((1 - math.asinh(math.tan(lat)) / math.pi) / 2 * n)))
+
+    return range(tile_x(west), tile_x(east) + 1), range(tile_y(north), tile_y(south) + 1)
+
+def tile_overlaps(z, x, y, bbox):
+    """True if a tile intersects a (west, south, east, north) box"""
+    south, west, north, east = tile_bounds(z, x, y)
+    box_west, box_south, box_east, box_north = bbox
+    return west <= box_east and east >= box_west and south <= box_north and north >= box_south
+
+def render_tile(grid, z, x, y):
+    """PNG of one tile from a surface grid, or None if the tile has no data"""
+    n = 2 ** z
+    pixel = (np.arange(TILE_SIZE) + 0.5) / TILE_SIZE
+    lons = (x + pixel) / n * 360 - 180
+    lats = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * (y + pixel) / n))))
+    values = sample_grid(grid, lats[:, None], lons[None, :])
+    empty = np.isnan(values)
+    if empty.all():
+        return None
+    index = np.clip(np.round(np.where(empty, -128, values)), -128, 127).astype(np.int16) + 128
+    rgba = COLOUR_TABLE[index]
+    rgba[empty] = 0
+    return encode_png(rgba)
+
+def render_tiles(grid, tiles, directory):
+    """Process-pool job: render `tiles` ((z, x, y), ...) of a grid and write those with data under `directory`"""
+    written = 0
+    for z, x, y in tiles:
+        png = render_tile(grid, z, x, y)
+        if png is None:
+            continue
+        path = os.path.join(directory, str(z), str(x), f"{y}.png")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_atomic(path, png, fsync=False)
+        written += 1
+    return written
+
+def parse_ssid(segment):
+    return None if segment == ALL_NETWORKS else segment
+
+class TileServer:
+    """Tile renderer with an in-memory LRU and an on-disk cache, both keyed by dataset version.
+
+    Engines passed in are signal_surface.SurfaceEngine instances whose
+    `version` identifies the dataset. With `clear` the namespace's disk
+    cache is emptied first, for versions that don't survive a restart.
+    A `quiet_period` holds the pyramid back while new versions keep coming.
+    """
+
+    def __init__(self, cache_dir=TILE_CACHE_DIR, namespace="tiles", cache_size=TILE_CACHE_SIZE,
+                 workers=TILE_WORKERS, zooms=PYRAMID_ZOOMS, clear=False,
+                 disk_cache_size=TILE_DISK_CACHE_SIZE, quiet_period=0):
+        self.directory = os.path.join(cache_dir, namespace)
+        self.cache_size = cache_size
+        self.disk_cache_size = disk_cache_size
+        self.quiet_period = quiet_period
+        self.workers = workers
+        self.zooms = zooms
+        self.hits = 0
+        self.disk_hits = 0
+        self.renders = 0
+        self.precomputed = 0
+        self._tiles = collections.OrderedDict()
+        # Paths of the tiles written on request, oldest first
+        self._disk_tiles = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._pending = None
+        self._requested = 0.0
+        self._wake = threading.Condition(self._lock)
+        self._thread = None
+        self._pool = None
+        self._closed = False
+        if clear:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def version_directory(self, version):
+        return os.path.join(self.directory, quote(str(version), safe=""))
+
+    def ssid_directory(self, version, ssid):
+        return os.path.join(self.version_directory(version), quote(ssid or ALL_NETWORKS, safe=""))
+
+    def tile(self, engine, ssid, z, x, y):
+        """PNG bytes of a tile for the engine's dataset version, or None if the SSID is unknown"""
+        key = (engine.version, ssid, z, x, y)
+        with self._lock:
+            png = self._tiles.get(key)
+            if png is not None:
+                self._tiles.move_to_end(key)
+                self.hits += 1
+                return png
+
+        path = os.path.join(self.ssid_directory(engine.version, ssid), str(z), str(x), f"{y}.png")
+        try:
+            with open(path, 'rb') as file:
+                png = file.read()
+            self.disk_hits += 1
+        except OSError:
+            surface = engine.surface(ssid)
+            if surface is None:
+                # With no data at all the map still gets (transparent) tiles
+                return EMPTY_TILE if ssid is None else None
+            if not tile_overlaps(z, x, y, surface.bbox):
+                return EMPTY_TILE
+            png = render_tile(surface.grid, z, x, y) or EMPTY_TILE
+            self.renders += 1
+            if png is not EMPTY_TILE:
+                self._cache_on_disk(path, png)
+
+        with self._lock:
+            self._tiles[key] = png
+            while len(self._tiles) > self.cache_size:
+                self._tiles.popitem(last=False)
+        return png
+
+    def _cache_on_disk(self, path, png):
+        """Write a rendered tile, removing the oldest ones past disk_cache_size"""
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            write_atomic(path, png, fsync=False)
+        except OSError as e:
+            print(f"Error caching tile {path}: {e}")
+            return
+        with self._lock:
+            self._disk_tiles[path] = None
+            self._disk_tiles.move_to_end(path)
+            evicted = []
+            while len(self._disk_tiles) > self.disk_cache_size:
+                evicted.append(self._disk_tiles.popitem(last=False)[0])
+        for old in evicted:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+
+    def precompute(self, engine, ssids=(None,)):
+        """Render the pyramid of a new dataset version in the background.
+
+        Returns at once. The pyramid is rendered once no newer version has
+        arrived for quiet_period seconds; of versions that arrive faster
+        than that, or faster than they render, only the newest is rendered.
+        """
+        with self._lock:
+            self._pending = (engine, tuple(ssids))
+            self._requested = time.monotonic()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._precompute_loop, name="tile-pyramid", daemon=True)
+                self._thread.start()
+            self._wake.notify()
+
+    def _precompute_loop(self):
+        while True:
+            with self._lock:
+                while self._pending is None and not self._closed:
+                    self._wake.wait()
+                # Let a burst of versions settle before rendering the newest
+                while not self._closed:
+                    remaining = self._requested + self.quiet_period - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._wake.wait(remaining)
+                if self._closed:
+                    return
+                engine, ssids = self._pending
+                self._pending = None
+            try:
+                self._render_pyramid(engine, ssids)
+                self._prune(engine.version)
+            except Exception as e:
+                if self._closed:
+                    return
+                if isinstance(e, BrokenExecutor):
+                    # A worker died; start a fresh pool for the next version
+                    self._pool = None
+                print(f"Error precomputing tiles: {e!r}")
+
+    def _render_pyramid(self, engine, ssids):
+        if self._pool is None:
+            # spawn: the web server's threads make fork unsafe
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=get_context("spawn"))
+        jobs = []
+        budget = self.disk_cache_size
+        for ssid in ssids:
+            surface = engine.surface(ssid)
+            if surface is None:
+                continue
+            directory = self.ssid_directory(engine.version, ssid)
+            west, south, east, north = surface.bbox
+            tiles = []
+            for z in self.zooms:
+                xs, ys = tile_range((south, west, north, east), z)
+                # Zoom levels that would take the pyramid past the disk budget are left to requests
+                if len(tiles) + len(xs) * len(ys) > budget:
+                    break
+                tiles.extend((z, x, y) for x in xs for y in ys)
+            budget -= len(tiles)
+            for start in range(0, len(tiles), TILES_PER_JOB):
+                jobs.append(self._pool.submit(render_tiles, surface.grid, tiles[start:start + TILES_PER_JOB], directory))
+        for job in jobs:
+            self.precomputed += job.result()
+
+    def _prune(self, current_version):
+        """Remove tiles of every version but the current one and any queued after it"""
+        with self._lock:
+            versions = {current_version}
+            if self._pending is not None:
+                versions.add(self._pending[0].version)
+            for key in [key for key in self._tiles if key[0] not in versions]:
+                del self._tiles[key]
+            directories = tuple(self.version_directory(version) + os.sep for version in versions)
+            for path in [path for path in self._disk_tiles if not path.startswith(directories)]:
+                del self._disk_tiles[path]
+        keep = {os.path.basename(self.version_directory(version)) for version in versions}
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            if name not in keep:
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._wake.notify()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        return {"cached": len(self._tiles), "hits": self.hits, "disk_hits": self.disk_hits,
+                "renders": self.renders, "precomputed": self.precomputed}
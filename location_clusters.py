@@ -0,0 +1,276 @@
+"""Viewport queries over the stored locations for the map.
+
+/get_all_locations takes the map's viewport (bbox=west,south,east,north)
+and zoom. Below POINTS_MIN_ZOOM the locations in view are aggregated into
+clusters on a grid of CLUSTER_PIXELS-sized squares in Web Mercator pixels
+(count, centroid, mean and best signal per cluster), so the response grows
+with the screen size rather than with the dataset. From POINTS_MIN_ZOOM on,
+or without a zoom, the individual locations in view are returned.
+
+Either list is paginated with an opaque cursor: each page holds up to
+`limit` items in a fixed order (location key, or cluster cell) and
+next_cursor resumes after the last of them. The ordered contents of the
+last few viewports are cached, so the pages after the first are found by
+bisection instead of gathering and sorting the viewport again.
+
+LocationClusters summarizes every location once, into a spatial index for
+pages of locations and column arrays for clustering. updated() makes the
+next version with only the changed locations re-summarized, leaving the
+current one to the readers that hold it, which the collector's snapshots
+use; the static apps make a new one when the data file changes.
+"""
+import base64
+import bisect
+import collections
+import json
+import math
+import threading
+import numpy as np
+from signal_surface import WORLD_BBOX, parse_bbox
+from spatial_index import SpatialIndex
+
+# From this zoom on the map gets individual locations instead of clusters
+POINTS_MIN_ZOOM = 17
+MAX_ZOOM = 22
+
+# Side of a cluster cell in screen pixels
+CLUSTER_PIXELS = 64
+TILE_SIZE = 256
+
+PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 5000
+
+# Ordered viewports (bbox and zoom) kept per LocationClusters for paging through them
+VIEWPORT_CACHE_SIZE = 16
+
+def location_summary(location):
+    """What the map shows of a location: name, timestamp, best signal and network count"""
+    signals = [network["signal"] for network in location.get("networks", ())
+               if network.get("signal") is not None]
+    return {
+        "name": location.get("name", "Unknown Location"),
+        "timestamp": location.get("timestamp", ""),
+        "best_signal": max(signals) if signals else None,
+        "networks": len(location.get("networks", ())),
+    }
+
+def mercator_pixels(lats, lons, zoom):
+    """Web Mercator pixel coordinates (x, y) of arrays of points at a zoom level"""
+    scale = TILE_SIZE * 2 ** zoom
+    lats = np.radians(np.clip(lats, WORLD_BBOX[0], WORLD_BBOX[2]))
+    x = (lons + 180) / 360 * scale
+    y = (1 - np.arcsinh(np.tan(lats)) / math.pi) / 2 * scale
+    return x, y
+
+def encode_cursor(zoom, after):
+    text = json.dumps({"z": zoom, "after": after}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(text.encode()).decode().rstrip("=")
+
+def decode_cursor(token):
+    """(zoom, after) of a cursor; zoom is None for a page of individual locations"""
+    try:
+        cursor = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        return cursor["z"], cursor["after"]
+    except (ValueError, TypeError, KeyError):
+        raise ValueError("invalid cursor")
+
+class LocationClusters:
+    """Summaries of a dataset's locations, indexed for viewport queries"""
+
+    def __init__(self, locations, version=None, cell_size=50):
+        self.version = version
+        self.index = SpatialIndex(cell_size)
+        # Column arrays for clustering, which touches every location in view.
+        # Each location has a row; removed rows are marked dead and reused.
+        self._rows = {}
+        self._free = []
+        self.lats = np.empty(0, dtype=np.float64)
+        self.lons = np.empty(0, dtype=np.float64)
+        self.signals = np.empty(0, dtype=np.float64)
+        self.live = np.zeros(0, dtype=bool)
+        # (bbox, grid zoom) -> (order keys, items); `_applied` counts apply() calls to drop stale builds
+        self._viewports = collections.OrderedDict()
+        self._applied = 0
+        self._lock = threading.Lock()
+        self.apply(locations, version)
+
+    def __len__(self):
+        return len(self.index)
+
+    def apply(self, changes, version=None):
+        """Apply {key: location, or None to remove} and move to `version`"""
+        with self._lock:
+            for key, location in changes.items():
+                self._remove(key)
+                if location is None:
+                    continue
+                lat = location.get("latitude")
+                lon = location.get("longitude")
+                if lat is None or lon is None:
+                    continue
+                summary = location_summary(location)
+                self.index.insert(key, lat, lon, summary)
+                row = self._free.pop() if self._free else self._grow()
+                self.lats[row] = lat
+                self.lons[row] = lon
+                self.signals[row] = np.nan if summary["best_signal"] is None else summary["best_signal"]
+                self.live[row] = True
+                self._rows[key] = row
+            self.version = version
+            self._viewports.clear()
+            self._applied += 1
+
+    def updated(self, changes, version=None):
+        """A copy with `changes` applied at `version`, as by apply(); this one is left as it was"""
+        clusters = LocationClusters({}, self.version, self.index.cell_size)
+        with self._lock:
+            clusters.index = self.index.copy()
+            clusters._rows = dict(self._rows)
+            clusters._free = list(self._free)
+            clusters.lats = self.lats.copy()
+            clusters.lons = self.lons.copy()
+            clusters.signals = self.signals.copy()
+            clusters.live = self.live.copy()
+        clusters.apply(changes, version)
+        return clusters
+
+    def _remove(self, key):
+        row = self._rows.pop(key, None)
+        if row is not None:
+            self.index.remove(key)
+            self.live[row] = False
+            self._free.append(row)
+
+    def _grow(self):
+        row = len(self._rows) + len(self._free)
+        if row == len(self.live):
+            capacity = max(64, 2 * row)
+            self.lats = np.resize(self.lats, capacity)
+            self.lons = np.resize(self.lons, capacity)
+            self.signals = np.resize(self.signals, capacity)
+            self.live = np.concatenate([self.live, np.zeros(capacity - row, dtype=bool)])
+        return row
+
+    def query(self, bbox=None, zoom=None, cursor=None, limit=PAGE_SIZE):
+        """One page of the locations or clusters in a (south, west, north, east) box.
+
+        Returns {"clustered", "locations", "clusters", "total", "next_cursor"};
+        total counts the items on every page.
+        """
+        bbox = bbox or WORLD_BBOX
+        grid_zoom = zoom if zoom is not None and zoom < POINTS_MIN_ZOOM else None
+        after = None
+        if cursor:
+            cursor_zoom, after = decode_cursor(cursor)
+            if cursor_zoom != grid_zoom:
+                raise ValueError("cursor belongs to a different zoom level")
+            if not isinstance(after, str if grid_zoom is None else int):
+                raise ValueError("invalid cursor")
+
+        order, items = self._viewport(bbox, grid_zoom)
+        start = bisect.bisect_right(order, after) if after is not None else 0
+        page = items[start:start + limit]
+        last = order[start + len(page) - 1] if page else None
+        if grid_zoom is None:
+            locations = [dict(summary, key=key, latitude=lat, longitude=lon) for key, lat, lon, summary in page]
+            clusters = []
+        else:
+            locations = []
+            clusters = [cluster for _, cluster in page]
+
+        total = len(items)
+        more = total - start > limit
+        return {
+            "clustered": grid_zoom is not None,
+            "locations": locations,
+            "clusters": clusters,
+            "total": total,
+            "next_cursor": encode_cursor(grid_zoom, last) if more else None,
+        }
+
+    def _viewport(self, bbox, grid_zoom):
+        """(order keys, items) of a box in page order: locations by key, or clusters by cell"""
+        cache_key = (bbox, grid_zoom)
+        with self._lock:
+            viewport = self._viewports.get(cache_key)
+            if viewport is not None:
+                self._viewports.move_to_end(cache_key)
+                return viewport
+            applied = self._applied
+
+        if grid_zoom is None:
+            items = sorted(self.index.within_bbox(*bbox), key=lambda point: point[0])
+        else:
+            items = self._clusters(bbox, grid_zoom)
+        viewport = ([item[0] for item in items], items)
+        with self._lock:
+            # A build that raced with apply() may mix versions; serve it once but don't keep it
+            if applied == self._applied:
+                self._viewports[cache_key] = viewport
+                while len(self._viewports) > VIEWPORT_CACHE_SIZE:
+                    self._viewports.popitem(last=False)
+        return viewport
+
+    def _clusters(self, bbox, zoom):
+        """[(cell, cluster)] of the locations in a box on the zoom level's pixel grid, ordered by cell"""
+        south, west, north, east = bbox
+        with self._lock:
+            inside = self.live & (self.lats >= south) & (self.lats <= north) & (self.lons >= west) & (self.lons <= east)
+            lats, lons, signals = self.lats[inside], self.lons[inside], self.signals[inside]
+        if not len(lats):
+            return []
+        x, y = mercator_pixels(lats, lons, zoom)
+        # One sortable id per cell; np.unique's order is the page order
+        ids = (np.floor(x / CLUSTER_PIXELS).astype(np.int64) << 32) | np.floor(y / CLUSTER_PIXELS).astype(np.int64)
+        unique, inverse, counts = np.unique(ids, return_inverse=True, return_counts=True)
+        has_signal = ~np.isnan(signals)
+        lat_sum = np.bincount(inverse, lats, len(unique))
+        lon_sum = np.bincount(inverse, lons, len(unique))
+        signal_count = np.bincount(inverse, has_signal, len(unique))
+        signal_sum = np.bincount(inverse, np.where(has_signal, signals, 0), len(unique))
+        best = np.full(len(unique), -np.inf)
+        np.maximum.at(best, inverse[has_signal], signals[has_signal])
+
+        clusters = []
+        for i, cell in enumerate(unique.tolist()):
+            clusters.append((cell, {
+                "latitude": float(lat_sum[i] / counts[i]),
+                "longitude": float(lon_sum[i] / counts[i]),
+                "count": int(counts[i]),
+                "mean_signal": round(float(signal_sum[i] / signal_count[i]), 1) if signal_count[i] else None,
+                "best_signal": float(best[i]) if signal_count[i] else None,
+            }))
+        return clusters
+
+def parse_location_args(args):
+    """Validate /get_all_locations query parameters into LocationClusters.query() keyword arguments"""
+    bbox = args.get("bbox")
+    zoom = args.get("zoom")
+    limit = args.get("limit")
+    try:
+        zoom = int(zoom) if zoom not in (None, "") else None
+    except ValueError:
+        raise ValueError("zoom must be an integer")
+    if zoom is not None and not 0 <= zoom <= MAX_ZOOM:
+        raise ValueError(f"zoom must be between 0 and {MAX_ZOOM}")
+    try:
+        limit = int(limit) if limit else PAGE_SIZE
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    return {
+        "bbox": parse_bbox(bbox) if bbox else None,
+        "zoom": zoom,
+        "cursor": args.get("cursor") or None,
+        "limit": limit,
+    }
+
+def locations_response(clusters, args):
+    """(body, status) for a /get_all_locations request against `clusters`"""
+    try:
+        body = clusters.query(**parse_location_args(args))
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    body["version"] = clusters.version
+    return body, 200
@@ -0,0 +1,436 @@
+"""Long-lived location service for the collectors.
+
+Location sources run on background threads and push fixes into a
+LocationService, which caches the latest fix from each source with its
+time and accuracy. current() never blocks: it returns the best fresh fix
+(sources are ranked in the order given) or None, so a missing fix makes a
+scan wait for the next tick instead of stalling the loop.
+
+Fallback sources only start if the others have no usable fix FALLBACK_DELAY
+seconds after the service starts. By default the IP lookup comes first and
+the browser page is the fallback, as the collectors always did, so a run
+only binds a port and opens a tab when the IP lookup fails.
+
+Sources, as given to --location-source:
+
+    fixed:LAT,LON[,ACCURACY]   a known position
+    gpsd[:HOST[:PORT]]         gpsd JSON on a local socket (default localhost:2947)
+    nmea:HOST:PORT             raw NMEA sentences (GGA/RMC) on a TCP socket
+    browser[:PORT]             a page that pushes the browser's geolocation as it changes
+    ip                         approximate location from the public IP, refreshed every 10 minutes
+"""
+import collections
+import http.server
+import json
+import socket
+import threading
+import time
+import urllib.parse
+import urllib.request
+import webbrowser
+
+LocationFix = collections.namedtuple(
+    "LocationFix", ["latitude", "longitude", "accuracy", "source", "timestamp", "description"])
+
+# Seconds after which a moving source's fix is no longer trusted
+FIX_MAX_AGE = 30
+
+# Seconds a one-shot collection waits for a first fix
+LOCATION_TIMEOUT = 60
+
+# Seconds without a usable fix before fallback sources are started
+FALLBACK_DELAY = 10
+
+class LocationSource:
+    """Base class for sources; run() pushes fixes until `stop` is set"""
+
+    name = None
+    # None means the source's fixes never go stale
+    max_age = FIX_MAX_AGE
+
+    def run(self, publish, stop):
+        raise NotImplementedError
+
+    def fix(self, latitude, longitude, accuracy=None, description=None):
+        return LocationFix(latitude, longitude, accuracy, self.name, time.time(), description or self.name)
+
+class FixedSource(LocationSource):
+    name = "fixed"
+    max_age = None
+
+    def __init__(self, latitude, longitude, accuracy=None):
+        self.latitude = latitude
+        self.longitude = longitude
+        self.accuracy = accuracy
+
+    def run(self, publish, stop):
+        publish(self.fix(self.latitude, self.longitude, self.accuracy, "Fixed location"))
+
+class IPSource(LocationSource):
+    """Approximate position from the public IP address"""
+
+    name = "ip"
+    max_age = None
+    URL = 'https://ipinfo.io/json'
+    # ipinfo locates to a city, so treat it as a few kilometres
+    ACCURACY = 5000
+
+    def __init__(self, refresh=600):
+        self.refresh = refresh
+
+    def run(self, publish, stop):
+        while not stop.is_set():
+            try:
+                with urllib.request.urlopen(self.URL, timeout=5) as response:
+                    data = json.loads(response.read().decode())
+                if 'loc' in data:
+                    lat, lon = map(float, data['loc'].split(','))
+                    publish(self.fix(lat, lon, self.ACCURACY,
+                                     f"IP-based location: {data.get('city', '')}, {data.get('region', '')}"))
+            except Exception as e:
+                print(f"Error determining location via IP: {e}")
+            stop.wait(self.refresh)
+
+def nmea_coordinate(value, hemisphere):
+    """Convert an NMEA ddmm.mmmm / dddmm.mmmm field to signed decimal degrees"""
+    if not value:
+        return None
+    dot = value.index('.') if '.' in value else len(value)
+    degrees = float(value[:dot - 2]) + float(value[dot - 2:]) / 60
+    return -degrees if hemisphere in ('S', 'W') else degrees
+
+def parse_nmea(line):
+    """Parse a GGA or RMC sentence into (lat, lon, accuracy_m) or None"""
+    line = line.strip()
+    if not line.startswith('$'):
+        return None
+    body, _, checksum = line[1:].partition('*')
+    if checksum:
+        expected = 0
+        for char in body:
+            expected ^= ord(char)
+        try:
+            if int(checksum[:2], 16) != expected:
+                return None
+        except ValueError:
+            return None
+    fields = body.split(',')
+    sentence = fields[0][-3:]
+    try:
+        if sentence == 'GGA' and len(fields) > 8 and fields[6] not in ('', '0'):
+            lat = nmea_coordinate(fields[2], fields[3])
+            lon = nmea_coordinate(fields[4], fields[5])
+            # Horizontal dilution of precision times a typical 5 m receiver error
+            accuracy = float(fields[8]) * 5 if fields[8] else None
+        elif sentence == 'RMC' and len(fields) > 6 and fields[2] == 'A':
+            lat = nmea_coordinate(fields[3], fields[4])
+            lon = nmea_coordinate(fields[5], fields[6])
+            accuracy = None
+        else:
+            return None
+    except ValueError:
+        return None
+    if lat is None or lon is None:
+        return None
+    return lat, lon, accuracy
+
+class SocketSource(LocationSource):
+    """Reads fixes from gpsd (JSON) or a raw NMEA feed, reconnecting if the socket drops"""
+
+    def __init__(self, host='localhost', port=2947, protocol='gpsd', retry=5):
+        self.host = host
+        self.port = port
+        self.protocol = protocol
+        self.name = protocol
+        self.retry = retry
+
+    def parse(self, line):
+        if self.protocol == 'nmea':
+            return parse_nmea(line)
+        try:
+            report = json.loads(line)
+        except ValueError:
+            return None
+        if report.get('class') != 'TPV' or report.get('mode', 0) < 2 or 'lat' not in report:
+            return None
+        accuracy = report.get('eph') or max(report.get('epx', 0), report.get('epy', 0)) or None
+        return report['lat'], report['lon'], accuracy
+
+    def run(self, publish, stop):
+        while not stop.is_set():
+            try:
+                with socket.create_connection((self.host, self.port), timeout=5) as sock:
+                    if self.protocol == 'gpsd':
+                        sock.sendall(b'?WATCH={"enable":true,"json":true};\n')
+                    sock.settimeout(1)
+                    buffer = b''
+                    while not stop.is_set():
+                        try:
+                            chunk = sock.recv(4096)
+                        except socket.timeout:
+                            continue
+                        if not chunk:
+                            break
+                        buffer += chunk
+                        *lines, buffer = buffer.split(b'\n')
+                        for line in lines:
+                            position = self.parse(line.decode(errors='replace'))
+                            if position:
+                                lat, lon, accuracy = position
+                                publish(self.fix(lat, lon, accuracy, f"GPS fix via {self.protocol}"))
+            except OSError as e:
+                print(f"Error reading location from {self.protocol} at {self.host}:{self.port}: {e}")
+            stop.wait(self.retry)
+
+LOCATION_PAGE = """
+<html>
+<head>
+    <title>Location Permission</title>
+    <script>
+    function sendPosition(position) {
+        lastPosition = position;
+        var lat = position.coords.latitude;
+        var lon = position.coords.longitude;
+        var accuracy = position.coords.accuracy;
+        document.getElementById('status').innerHTML =
+            "Location: " + lat + ", " + lon + "<br>Accuracy: " + accuracy + " meters<br>" +
+            "Keep this tab open while collecting; it sends updates as you move.";
+        fetch("/setlocation?lat=" + lat + "&lon=" + lon + "&accuracy=" + accuracy);
+    }
+
+    function showError(error) {
+        var messages = {1: "User denied the request for Geolocation.",
+                        2: "Location information is unavailable.",
+                        3: "The request to get user location timed out."};
+        document.getElementById('status').innerHTML = messages[error.code] || "An unknown error occurred.";
+    }
+
+    // watchPosition is silent while we stand still, so resend the last
+    // position well within the server's 30 s FIX_MAX_AGE while the tab is open
+    var lastPosition = null;
+    setInterval(function() { if (lastPosition) sendPosition(lastPosition); }, 10000);
+
+    function watchLocation() {
+        if (navigator.geolocation) {
+            navigator.geolocation.watchPosition(sendPosition, showError,
+                {enableHighAccuracy: true, timeout: 15000, maximumAge: 0});
+            document.getElementById('status').innerHTML = "Getting your location with high accuracy...";
+        } else {
+            document.getElementById('status').innerHTML = "Geolocation is not supported by this browser.";
+        }
+    }
+
+    window.onload = watchLocation;
+    </script>
+</head>
+<body>
+    <h1>WiFi Data Collector - Location Permission</h1>
+    <p>To collect accurate location data, please allow location access when prompted.</p>
+    <p>For best results:</p>
+    <ul>
+        <li>Use a device with GPS</li>
+        <li>Enable WiFi and Bluetooth for better indoor accuracy</li>
+        <li>If using a mobile device, grant precise location permission</li>
+    </ul>
+    <p id="status">Waiting for location permission...</p>
+    <button onclick="watchLocation()">Try Again</button>
+</body>
+</html>
+"""
+
+class BrowserSource(LocationSource):
+    """Serves a page that streams the browser's geolocation back to us.
+
+    The server and browser tab are started once and kept for the whole
+    session; the page uses watchPosition, so every movement pushes a fix,
+    and resends the last one every 10 s so a stationary fix stays fresh
+    while the tab is open.
+    """
+
+    name = "browser"
+
+    def __init__(self, port=8000, open_browser=True):
+        self.port = port
+        self.open_browser = open_browser
+        self.server = None
+
+    def run(self, publish, stop):
+        source = self
+
+        class LocationHandler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.startswith('/setlocation'):
+                    params = dict(urllib.parse.parse_qsl(urllib.parse.urlparse(self.path).query))
+                    try:
+                        accuracy = float(params['accuracy']) if 'accuracy' in params else None
+                        accuracy_desc = f" (accuracy: {accuracy:.1f}m)" if accuracy else ""
+                        publish(source.fix(float(params['lat']), float(params['lon']), accuracy,
+                                           f"Browser-based geolocation{accuracy_desc}"))
+                    except (KeyError, ValueError):
+                        self.send_response(400)
+                        self.end_headers()
+                        return
+                    self.send_response(204)
+                    self.end_headers()
+                else:
+                    self.send_response(200)
+                    self.send_header('Content-type', 'text/html')
+                    self.end_headers()
+                    self.wfile.write(LOCATION_PAGE.encode())
+
+            def log_message(self, format, *args):
+                return
+
+        # Take the first free port from self.port up to 9000
+        for port in range(self.port, 9001):
+            try:
+                self.server = http.server.ThreadingHTTPServer(('', port), LocationHandler)
+                break
+            except OSError:
+                continue
+        else:
+            print("Error determining location via browser: No available ports found")
+            return
+        self.port = self.server.server_address[1]
+
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        if self.open_browser:
+            webbrowser.open(f'http://localhost:{self.port}')
+            print("A browser window has been opened to share your location.")
+            print("Please allow location access when prompted and keep the tab open.")
+        stop.wait()
+        self.server.shutdown()
+
+class LocationService:
+    """Caches the latest fix from each source and answers current() without blocking"""
+
+    def __init__(self, sources, fallbacks=(), fallback_delay=FALLBACK_DELAY):
+        self.sources = list(sources) + list(fallbacks)
+        self.fallbacks = list(fallbacks)
+        self.fallback_delay = fallback_delay
+        self._fixes = {}
+        self._lock = threading.Lock()
+        self._updated = threading.Condition(self._lock)
+        self._stop = threading.Event()
+        self._threads = []
+        self._listeners = []
+
+    def start(self):
+        for source in self.sources:
+            if source not in self.fallbacks:
+                self._start_source(source)
+        if self.fallbacks:
+            threading.Thread(target=self._start_fallbacks, daemon=True).start()
+        return self
+
+    def _start_source(self, source):
+        thread = threading.Thread(target=self._run_source, args=(source,), daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def _start_fallbacks(self):
+        with self._updated:
+            found = self._updated.wait_for(lambda: self._best() is not None or self._stop.is_set(),
+                                           self.fallback_delay)
+        if not found:
+            for source in self.fallbacks:
+                self._start_source(source)
+
+    def _run_source(self, source):
+        try:
+            source.run(lambda fix: self.publish(fix, source), self._stop)
+        except Exception as e:
+            print(f"Location source {source.name} failed: {e}")
+
+    def publish(self, fix, source=None):
+        """Cache `fix` as the latest from `source` (by default, the source named in the fix)"""
+        if source is None:
+            source = next((s for s in self.sources if s.name == fix.source), fix.source)
+        with self._updated:
+            if source not in self._fixes:
+                print(f"Location detected: {fix.latitude}, {fix.longitude} ({fix.description})")
+            self._fixes[source] = fix
+            self._updated.notify_all()
+        for listener in self._listeners:
+            listener(fix)
+
+    def subscribe(self, listener):
+        """Call listener(fix) for every fix published from now on"""
+        self._listeners.append(listener)
+
+    def _best(self):
+        # Caller holds the lock
+        now = time.time()
+        for source in self.sources:
+            fix = self._fixes.get(source)
+            if fix and (source.max_age is None or now - fix.timestamp <= source.max_age):
+                return fix
+        return None
+
+    def current(self):
+        """Return the freshest usable fix from the highest-ranked source, or None"""
+        with self._lock:
+            return self._best()
+
+    def wait(self, timeout):
+        """Block up to `timeout` seconds for a usable fix; for one-shot collection"""
+        deadline = time.monotonic() + timeout
+        with self._updated:
+            fix = self._best()
+            while fix is None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                # Wake at least once a second, since fixes also age out
+                self._updated.wait(min(remaining, 1))
+                fix = self._best()
+            return fix
+
+    def stop(self):
+        self._stop.set()
+        with self._updated:
+            self._updated.notify_all()
+
+def parse_source(spec):
+    """Build a source from a --location-source spec such as 'gpsd' or 'fixed:23.21,72.68'"""
+    kind, _, arg = spec.partition(':')
+    if kind == 'fixed':
+        values = [float(v) for v in arg.split(',')]
+        if len(values) < 2:
+            raise ValueError("fixed needs LAT,LON")
+        return FixedSource(*values[:3])
+    if kind in ('gpsd', 'nmea'):
+        host, _, port = arg.partition(':')
+        if kind == 'nmea' and not port:
+            raise ValueError("nmea needs HOST:PORT")
+        return SocketSource(host or 'localhost', int(port or 2947), protocol=kind)
+    if kind == 'browser':
+        return BrowserSource(int(arg) if arg else 8000)
+    if kind == 'ip':
+        return IPSource()
+    raise ValueError(f"Unknown location source: {spec}")
+
+# The IP lookup first, with the browser page as the fallback when it fails, as the collectors always did
+DEFAULT_SOURCES = ('ip',)
+DEFAULT_FALLBACKS = ('browser',)
+
+location_service = None
+
+def configure_location(specs=None):
+    """Replace the shared service with one for the given source specs"""
+    global location_service
+    if location_service is not None:
+        location_service.stop()
+    if specs:
+        location_service = LocationService([parse_source(spec) for spec in specs])
+    else:
+        location_service = LocationService([parse_source(spec) for spec in DEFAULT_SOURCES],
+                                           [parse_source(spec) for spec in DEFAULT_FALLBACKS])
+    location_service.start()
+    return location_service
+
+def get_location_service():
+    """Return the shared service, starting the default sources on first use"""
+    if location_service is None:
+        configure_location()
+    return location_service
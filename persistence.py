@@ -0,0 +1,314 @@
+"""Atomic, group-committed writes for the data files.
+
+Two kinds of writer share one commit loop:
+
+- DocumentWriter replaces a whole JSON document. It writes a temporary
+  file and renames it over the target, so readers and crashes see either
+  the old file or the new one and never a truncated one. A burst of saves
+  writes only the last document.
+- AppendWriter appends lines (the scan log). Lines submitted within one
+  flush interval go out in a single write.
+
+With a flush interval above 0, submit() returns at once. A background
+thread commits everything submitted in the next `flush_interval` seconds as
+one write. With 0, every submission is committed before submit() returns.
+submit(..., wait=True) and flush() commit at once, for callers that must
+know the data is on disk.
+
+The fsync policy decides what is forced to stable storage:
+
+    always     every commit, log appends included, plus the directory after a rename
+    snapshots  whole-document replacements only (default); appends are left to the OS
+    never      nothing; fastest, but a power cut can lose recent commits
+
+Each writer keeps its commit latency, and write_report() summarizes it. The
+defaults come from WIFI_FLUSH_INTERVAL and WIFI_FSYNC, or configure_persistence().
+"""
+import atexit
+import copy
+import json
+import os
+import threading
+import time
+from signal_stats import RunningStats
+
+FSYNC_POLICIES = ("always", "snapshots", "never")
+
+# Seconds a burst of writes is collected before it is committed (0 = write through)
+FLUSH_INTERVAL = float(os.environ.get("WIFI_FLUSH_INTERVAL", 1.0))
+
+FSYNC_POLICY = os.environ.get("WIFI_FSYNC", "snapshots")
+
+# Writers by (class, absolute path), shared by everything in the process writing that file
+writers = {}
+writers_lock = threading.Lock()
+
+def configure_persistence(flush_interval=None, fsync=None):
+    """Set the flush interval and fsync policy for every writer"""
+    global FLUSH_INTERVAL, FSYNC_POLICY
+    if fsync is not None:
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy: {fsync} (choose from {', '.join(FSYNC_POLICIES)})")
+        FSYNC_POLICY = fsync
+    if flush_interval is not None:
+        FLUSH_INTERVAL = flush_interval
+
+def fsync_policy():
+    return FSYNC_POLICY
+
+def fsync_directory(path):
+    """Make a rename in the directory of `path` durable (a no-op on Windows)"""
+    if os.name == "nt":
+        return
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def write_atomic(path, text, fsync=True, sync_directory=False):
+    """Write `text` (str or bytes) to a temporary file and rename it over `path`"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb' if isinstance(text, bytes) else 'w') as file:
+            file.write(text)
+            if fsync:
+                file.flush()
+                os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    if sync_directory:
+        fsync_directory(path)
+
+class GroupCommitWriter:
+    """Base for writers that coalesce submissions into commits.
+
+    Subclasses define how two pending submissions combine and how the
+    combined one is written. A failed commit is kept pending and retried.
+    """
+
+    def __init__(self, path, flush_interval=None, fsync=None):
+        self.path = path
+        # None follows the module-wide FLUSH_INTERVAL / FSYNC_POLICY
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.submitted = 0
+        self.bytes_written = 0
+        # Commit latency in milliseconds
+        self.latency = RunningStats(resolution=0.1)
+        self._pending = None
+        self._in_flight = None
+        self._cond = threading.Condition()
+        self._commit_lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+
+    @property
+    def interval(self):
+        return FLUSH_INTERVAL if self.flush_interval is None else self.flush_interval
+
+    @property
+    def policy(self):
+        return self.fsync or FSYNC_POLICY
+
+    def _combine(self, older, newer):
+        raise NotImplementedError
+
+    def _write(self, pending):
+        """Write a pending submission; returns the number of bytes written"""
+        raise NotImplementedError
+
+    def submit(self, item, wait=False):
+        with self._cond:
+            self._pending = item if self._pending is None else self._combine(self._pending, item)
+            self.submitted += 1
+            background = not wait and self.interval > 0 and not self._closed
+            if background:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, daemon=True,
+                                                    name=f"commit-{os.path.basename(self.path)}")
+                    self._thread.start()
+                self._cond.notify()
+        if not background:
+            self.flush()
+
+    def flush(self):
+        """Commit whatever is pending now"""
+        with self._commit_lock:
+            with self._cond:
+                pending, self._pending = self._pending, None
+                self._in_flight = pending
+            if pending is None:
+                return
+            start = time.perf_counter()
+            try:
+                size = self._write(pending)
+            except BaseException:
+                with self._cond:
+                    self._pending = pending if self._pending is None else self._combine(pending, self._pending)
+                    self._in_flight = None
+                raise
+            with self._cond:
+                self._in_flight = None
+            self.latency.add((time.perf_counter() - start) * 1000)
+            self.bytes_written += size
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending is not None or self._closed)
+                if self._closed:
+                    return
+                # Let the rest of the burst arrive, then commit it as one write
+                self._cond.wait_for(lambda: self._closed, timeout=self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error writing {self.path}: {e}")
+
+    def close(self):
+        """Stop the commit thread and commit what is left"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+    def summary(self):
+        latency = self.latency
+        if not latency.count:
+            return f"{self.submitted} writes, none committed"
+        return (f"{self.submitted} writes in {latency.count} commits, {self.bytes_written / 1024:.0f} KiB, "
+                f"latency mean {latency.mean:.1f} ms, p50 {latency.median:.1f} ms, "
+                f"p99 {latency.percentile(99):.1f} ms, max {latency.max:.1f} ms")
+
+class DocumentWriter(GroupCommitWriter):
+    """Replaces a JSON document atomically; of a burst of saves only the last is written.
+
+    The document is serialized on the commit thread, so callers must not
+    modify it after submitting it - hand over a copy.
+    """
+
+    def __init__(self, path, indent=2, **options):
+        super().__init__(path, **options)
+        self.indent = indent
+
+    def _combine(self, older, newer):
+        return newer
+
+    def _write(self, data):
+        text = json.dumps(data, indent=self.indent)
+        policy = self.policy
+        write_atomic(self.path, text, fsync=policy != "never", sync_directory=policy == "always")
+        return len(text)
+
+    def load(self):
+        """A copy of the latest submitted document, whether committed yet or not; None if there is none"""
+        with self._cond:
+            latest = self._pending if self._pending is not None else self._in_flight
+            if latest is not None:
+                # The commit thread may be serializing it; callers get their own to modify
+                return copy.deepcopy(latest)
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, 'r') as file:
+            return json.load(file)
+
+def truncate_partial_line(path):
+    """Cut a torn last line (no trailing newline) off a line-oriented file; returns the bytes removed"""
+    try:
+        file = open(path, 'rb+')
+    except FileNotFoundError:
+        return 0
+    with file:
+        size = file.seek(0, os.SEEK_END)
+        end = size
+        while end > 0:
+            start = max(0, end - 4096)
+            file.seek(start)
+            chunk = file.read(end - start)
+            if end == size and chunk.endswith(b"\n"):
+                return 0
+            newline = chunk.rfind(b"\n")
+            if newline >= 0:
+                end = start + newline + 1
+                break
+            end = start
+        file.truncate(end)
+        return size - end
+
+class AppendWriter(GroupCommitWriter):
+    """Appends lines to a file; the lines of a burst go out in one write.
+
+    A torn last line left by a crash is cut off when the writer is created,
+    so the first append does not get glued onto it.
+    """
+
+    def __init__(self, path, **options):
+        super().__init__(path, **options)
+        removed = truncate_partial_line(path)
+        if removed:
+            print(f"Removed a partially written line ({removed} bytes) from {path}")
+
+    def submit(self, lines, wait=False):
+        super().submit(list(lines), wait)
+
+    def _combine(self, older, newer):
+        older.extend(newer)
+        return older
+
+    def _write(self, lines):
+        text = "".join(lines)
+        with open(self.path, 'a') as file:
+            file.write(text)
+            if self.policy == "always":
+                file.flush()
+                os.fsync(file.fileno())
+        return len(text)
+
+def _get_writer(cls, path):
+    key = (cls, os.path.abspath(path))
+    with writers_lock:
+        writer = writers.get(key)
+        if writer is None:
+            writer = writers[key] = cls(path)
+        return writer
+
+def get_document_writer(path):
+    """Return the process-wide DocumentWriter for `path`"""
+    return _get_writer(DocumentWriter, path)
+
+def get_append_writer(path):
+    """Return the process-wide AppendWriter for `path`"""
+    return _get_writer(AppendWriter, path)
+
+def flush_all():
+    with writers_lock:
+        current = list(writers.values())
+    for writer in current:
+        try:
+            writer.flush()
+        except Exception as e:
+            print(f"Error writing {writer.path}: {e}")
+
+def close_all():
+    with writers_lock:
+        current = list(writers.values())
+    for writer in current:
+        try:
+            writer.close()
+        except Exception as e:
+            print(f"Error writing {writer.path}: {e}")
+
+def write_report():
+    """One line per file written: writes, commits and commit latency"""
+    with writers_lock:
+        current = list(writers.values())
+    return [f"{os.path.basename(writer.path)}: {writer.summary()}" for writer in current if writer.submitted]
+
+# Nothing submitted is lost on a normal exit
+atexit.register(close_all)
@@ -0,0 +1,268 @@
+"""Long-lived scan helper.
+
+The collectors used to fork `ls`, `iwconfig`, `iw` and `sudo iwlist` for every
+scan sample. Instead, one helper process is started with the needed privileges
+(`sudo` is asked once) and answers scan requests over its stdin/stdout pipe,
+one JSON object per line:
+
+    -> {"id": 1, "cmd": "scan"}
+    <- {"id": 1, "ok": true, "interface": "wlan0", "noise_floor": -95, "networks": [...]}
+
+Only the privileged backends (iwlist, iw) and the fake one go through the
+helper; nmcli, netsh and replay scans run in the collector's own process.
+get_scanner() picks the backend from the environment:
+
+    WIFI_SCANNER       backend name (see scanners.py); default netsh on Windows, iwlist elsewhere
+    WIFI_SCAN_REPLAY   replay file; selects the replay backend when WIFI_SCANNER is unset
+    WIFI_SCAN_RATE     replay speed, 1 = real time, 0 = as fast as possible (default: 1)
+
+`python scan_helper.py --backend fake --record scans.jsonl --count 100` records
+a replay file; `--serve --fake` runs a helper that returns synthetic scans.
+"""
+import json
+import math
+import os
+import platform
+import queue
+import random
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from scanners import NOISE_FLOOR_TTL, PRIVILEGED_BACKENDS, SCANNER_BACKENDS, create_scanner
+
+# Seconds to wait for the helper to answer a request
+REQUEST_TIMEOUT = 30
+
+def serve(scanner, infile=sys.stdin, outfile=sys.stdout):
+    """Answer JSON-line requests from infile until it is closed"""
+    for line in infile:
+        line = line.strip()
+        if not line:
+            continue
+        response = {}
+        try:
+            request = json.loads(line)
+            response["id"] = request.get("id")
+            cmd = request.get("cmd")
+            if cmd == "scan":
+                response.update(scanner.scan())
+            elif cmd != "ping":
+                raise ValueError(f"Unknown command: {cmd}")
+            response["ok"] = True
+        except Exception as e:
+            response["ok"] = False
+            response["error"] = str(e)
+        outfile.write(json.dumps(response) + "\n")
+        outfile.flush()
+
+class ScanHelperClient:
+    """Starts the helper process once and sends it scan requests over a pipe.
+
+    The helper is restarted if it dies. Privileged backends run it through
+    `sudo` unless we are already root; the fake helper runs unprivileged.
+    A reader thread moves the helper's answers into a queue, so waiting for
+    one can time out on any OS (select() doesn't take pipes on Windows).
+    """
+
+    def __init__(self, backend="iwlist", command=None):
+        self.backend = backend
+        self.command = command
+        self._process = None
+        self._responses = None
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def _helper_command(self):
+        if self.command:
+            return list(self.command)
+        command = [sys.executable, os.path.abspath(__file__), "--serve", "--backend", self.backend]
+        if self.backend not in PRIVILEGED_BACKENDS:
+            return command
+        if hasattr(os, "geteuid") and os.geteuid() != 0:
+            return ["sudo"] + command
+        return command
+
+    def _ensure_started(self):
+        if self._process is None or self._process.poll() is not None:
+            self.close()
+            self._process = subprocess.Popen(
+                self._helper_command(), stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                universal_newlines=True, bufsize=1)
+            self._responses = queue.Queue()
+            threading.Thread(target=self._read_responses, args=(self._process.stdout, self._responses),
+                             name="scan-helper-reader", daemon=True).start()
+
+    @staticmethod
+    def _read_responses(stdout, responses):
+        """Reader thread: queue each line the helper writes, then None once it exits"""
+        try:
+            for line in stdout:
+                responses.put(line)
+        except (OSError, ValueError):
+            pass
+        responses.put(None)
+
+    def request(self, cmd, timeout=REQUEST_TIMEOUT):
+        with self._lock:
+            self._ensure_started()
+            self._next_id += 1
+            request_id = self._next_id
+            try:
+                self._process.stdin.write(json.dumps({"id": request_id, "cmd": cmd}) + "\n")
+                self._process.stdin.flush()
+                line = self._responses.get(timeout=timeout)
+            except queue.Empty:
+                # A hung helper won't notice its stdin closing
+                self._process.kill()
+                self.close()
+                raise TimeoutError(f"Scan helper did not answer within {timeout}s")
+            except Exception:
+                self.close()
+                raise
+            if line is None:
+                self.close()
+                raise RuntimeError("Scan helper exited")
+        response = json.loads(line)
+        if not response.get("ok"):
+            raise RuntimeError(response.get("error", "Scan helper error"))
+        return response
+
+    def scan(self):
+        """Return the list of network dicts from one scan"""
+        return self.request("scan")["networks"]
+
+    def location(self):
+        return None
+
+    def close(self):
+        if self._process is not None:
+            try:
+                self._process.stdin.close()
+                self._process.wait(timeout=5)
+            except Exception:
+                self._process.kill()
+                self._process.wait()
+            self._process = None
+            self._responses = None
+
+class LocalScanner:
+    """Runs an unprivileged backend in this process, with the same interface as ScanHelperClient"""
+
+    def __init__(self, scanner):
+        self.scanner = scanner
+        self.backend = scanner.name
+
+    def scan(self):
+        """Return the list of network dicts from one scan"""
+        return self.scanner.scan()["networks"]
+
+    def location(self):
+        return self.scanner.location()
+
+    def close(self):
+        self.scanner.close()
+
+scanner = None
+
+def default_backend():
+    if os.environ.get("WIFI_SCANNER"):
+        return os.environ["WIFI_SCANNER"]
+    if os.environ.get("WIFI_SCAN_REPLAY"):
+        return "replay"
+    if os.environ.get("WIFI_SCAN_HELPER") == "fake":
+        return "fake"
+    return "netsh" if platform.system() == "Windows" else "iwlist"
+
+def configure_scanner(backend=None, replay=None, rate=None, loop=False):
+    """Replace the shared scanner; arguments left as None come from the environment"""
+    global scanner
+    if scanner is not None:
+        scanner.close()
+        scanner = None
+    backend = backend or ("replay" if replay else default_backend())
+    if backend not in SCANNER_BACKENDS:
+        raise ValueError(f"Unknown scanner backend: {backend} (choose from {', '.join(SCANNER_BACKENDS)})")
+    if backend in PRIVILEGED_BACKENDS or backend == "fake":
+        scanner = ScanHelperClient(backend)
+    elif backend == "replay":
+        replay = replay or os.environ.get("WIFI_SCAN_REPLAY")
+        if not replay:
+            raise ValueError("The replay backend needs a replay file (WIFI_SCAN_REPLAY or --replay)")
+        if rate is None:
+            rate = float(os.environ.get("WIFI_SCAN_RATE", 1))
+        scanner = LocalScanner(create_scanner("replay", path=replay, rate=rate, loop=loop))
+    else:
+        scanner = LocalScanner(create_scanner(backend))
+    return scanner
+
+def get_scanner():
+    """Return the shared scanner, creating it from the environment on first use"""
+    if scanner is None:
+        configure_scanner()
+    return scanner
+
+def record(backend_scanner, path, count, interval=1.0, latitude=None, longitude=None, walk=0.0, wait=True):
+    """Write `count` scans from a backend to a replay file, `interval` seconds apart.
+
+    With a starting latitude/longitude every scan is tagged with a position,
+    which moves `walk` meters in a random direction between scans.
+    """
+    from geo import METERS_PER_DEGREE
+    start = time.monotonic()
+    with open(path, 'w') as file:
+        for i in range(count):
+            if wait:
+                time.sleep(max(0, start + i * interval - time.monotonic()))
+            result = backend_scanner.scan()
+            entry = {"time": round(i * interval, 3), "timestamp": datetime.now().isoformat()}
+            entry.update(result)
+            if latitude is not None and longitude is not None:
+                entry["latitude"], entry["longitude"] = latitude, longitude
+                if walk:
+                    heading = random.uniform(0, 2 * math.pi)
+                    latitude += walk * math.cos(heading) / METERS_PER_DEGREE
+                    longitude += walk * math.sin(heading) / (METERS_PER_DEGREE * math.cos(math.radians(latitude)))
+            file.write(json.dumps(entry) + "\n")
+    return count
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='WiFi scan helper and replay recorder')
+    parser.add_argument('--serve', action='store_true', help='Answer scan requests on stdin/stdout')
+    parser.add_argument('--backend', choices=sorted(SCANNER_BACKENDS), default=None,
+                        help='Scanner backend (default: netsh on Windows, iwlist elsewhere)')
+    parser.add_argument('--fake', action='store_true', help='Same as --backend fake')
+    parser.add_argument('--seed', type=int, help='Random seed for the fake backend')
+    parser.add_argument('--noise-ttl', type=float, default=NOISE_FLOOR_TTL,
+                        help=f'Seconds between noise floor surveys (default: {NOISE_FLOOR_TTL})')
+    parser.add_argument('--replay', help='Replay file for the replay backend')
+    parser.add_argument('--rate', type=float, default=1.0, help='Replay speed, 0 = as fast as possible (default: 1)')
+    parser.add_argument('--record', metavar='FILE', help='Record scans to a replay file')
+    parser.add_argument('--count', type=int, default=60, help='Scans to record (default: 60)')
+    parser.add_argument('--interval', type=float, default=1.0, help='Seconds between recorded scans (default: 1)')
+    parser.add_argument('--latitude', type=float, help='Tag recorded scans with this starting latitude')
+    parser.add_argument('--longitude', type=float, help='Tag recorded scans with this starting longitude')
+    parser.add_argument('--walk', type=float, default=0.0, help='Meters to move between recorded scans')
+    args = parser.parse_args()
+
+    backend = "fake" if args.fake else (args.backend or ("replay" if args.replay else default_backend()))
+    options = {}
+    if backend == "fake":
+        options["seed"] = args.seed
+    elif backend in PRIVILEGED_BACKENDS:
+        options["noise_ttl"] = args.noise_ttl
+    elif backend == "replay":
+        options.update(path=args.replay, rate=args.rate)
+    backend_scanner = create_scanner(backend, **options)
+
+    if args.serve:
+        serve(backend_scanner)
+    elif args.record:
+        # Synthetic and replayed scans don't need to wait out real time
+        record(backend_scanner, args.record, args.count, args.interval, args.latitude, args.longitude,
+               args.walk, wait=backend not in ("fake", "replay"))
+        print(f"Recorded {args.count} {backend} scans to {args.record}")
+    else:
+        print(json.dumps(backend_scanner.scan(), indent=2))
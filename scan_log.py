@@ -0,0 +1,128 @@
+import json
+import os
+import threading
+from datetime import datetime
+from sqlite_store import SQLiteStore, is_sqlite_path
+from persistence import get_append_writer, get_document_writer
+
+def empty_data():
+    """Return an empty data document in the dynamic_data.json layout"""
+    return {
+        "locations": {},
+        "metadata": {
+            "created": datetime.now().isoformat(),
+            "last_updated": datetime.now().isoformat(),
+            "version": "1.0"
+        }
+    }
+
+def open_storage(path):
+    """Open the storage backend for a data file: SQLite for .db files, else JSON + log"""
+    return SQLiteStore(path) if is_sqlite_path(path) else ScanLog(path)
+
+class ScanLog:
+    """Snapshot file plus an append-only JSONL log of location updates.
+
+    Each scan appends one line to `<snapshot>.log`, so the cost of a write does
+    not depend on how much data has been collected. Loading replays the log on
+    top of the snapshot. Every `compact_every` appends the merged state is
+    written to the snapshot and the log is truncated.
+
+    Appends are group-committed by the log's AppendWriter, and snapshots are
+    replaced atomically (see persistence). A crash can lose at most the
+    appends of the last flush interval and a partially written last line,
+    which is cut off when the log is opened (any other unreadable line is
+    skipped on replay).
+    """
+
+    def __init__(self, snapshot_path, log_path=None, compact_every=100):
+        self.snapshot_path = snapshot_path
+        self.log_path = log_path or f"{snapshot_path}.log"
+        self.compact_every = compact_every
+        self.pending = 0
+        self._lock = threading.Lock()
+        self._snapshot = get_document_writer(self.snapshot_path)
+        self._log = get_append_writer(self.log_path)
+
+    def load(self):
+        """Rebuild the current state from the snapshot and the log tail"""
+        with self._lock:
+            # Appends still waiting for their group commit are part of the state
+            self._log.flush()
+            data = self._snapshot.load()
+            if data is None:
+                data = empty_data()
+            data.setdefault("locations", {})
+            data.setdefault("metadata", {})
+
+            pending = 0
+            if os.path.exists(self.log_path):
+                with open(self.log_path, 'r') as file:
+                    for line in file:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            # A torn write from a crash; the records after it are intact
+                            print(f"Skipping unreadable line in {self.log_path}")
+                            continue
+                        self.apply(data, record)
+                        pending += 1
+            self.pending = pending
+        return data
+
+    @staticmethod
+    def apply(data, record):
+        """Apply one log record to a data document"""
+        op = record.get("op")
+        if op == "upsert":
+            data["locations"][record["key"]] = record["location"]
+        elif op == "delete":
+            data["locations"].pop(record["key"], None)
+        elif op == "metadata":
+            data["metadata"].update(record["metadata"])
+        if "time" in record:
+            data["metadata"]["last_updated"] = record["time"]
+
+    def append(self, record):
+        """Append a record to the log; returns True when a compaction is due"""
+        return self.append_many([record])
+
+    def append_many(self, records):
+        """Append several records with a single write; returns True when a compaction is due"""
+        now = datetime.now().isoformat()
+        lines = []
+        for record in records:
+            record.setdefault("time", now)
+            lines.append(json.dumps(record, separators=(',', ':')) + "\n")
+        with self._lock:
+            self._log.submit(lines)
+            self.pending += len(lines)
+            return bool(self.compact_every) and self.pending >= self.compact_every
+
+    def upsert(self, key, location):
+        return self.append({"op": "upsert", "key": key, "location": location})
+
+    def upsert_many(self, items):
+        """Append an upsert for each (key, location) pair"""
+        return self.append_many([{"op": "upsert", "key": key, "location": location}
+                                 for key, location in items])
+
+    def delete(self, key):
+        return self.append({"op": "delete", "key": key})
+
+    def update_metadata(self, values):
+        return self.append({"op": "metadata", "metadata": values})
+
+    def close(self):
+        """Commit pending appends; the writers themselves are shared and closed at exit"""
+        self._log.flush()
+
+    def compact(self, data):
+        """Write `data` as the new snapshot and truncate the log"""
+        with self._lock:
+            data["metadata"]["last_updated"] = datetime.now().isoformat()
+            self._log.flush()
+            self._snapshot.submit(data, wait=True)
+            # The snapshot already holds every logged record
+            open(self.log_path, 'w').close()
+            self.pending = 0
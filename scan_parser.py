@@ -0,0 +1,351 @@
+"""Parsers for `iwlist <if> scan`, `iw dev <if> scan`, `nmcli -t device wifi list`
+and `netsh wlan show networks mode=bssid` output.
+
+They return the network dicts the collectors store. Besides ssid/signal/auth/
+channel they keep the BSSID, frequency (MHz) and link quality (percent).
+
+iwlist and netsh transcripts are cut into cells on their literal cell
+headers, and each cell is read by one match of a precompiled pattern for the
+layout the tools print. A cell laid out differently (another driver's field
+order, a signal level without dBm) falls back to looking its fields up one
+by one. bench_parser.py compares both with the re.split/re.search parsers
+they replaced.
+"""
+import re
+
+# Default noise floor estimation in dBm
+DEFAULT_NOISE_FLOOR = -95
+
+# One iwlist cell after its "Cell NN - Address: " header, as mac80211 drivers print it
+IWLIST_CELL = re.compile(
+    r"(?P<address>[0-9A-Fa-f:]{17})\s+"
+    r"Channel:(?P<channel>\d+)\s+"
+    r"Frequency:(?P<frequency>[\d.]+) GHz[^\n]*\s+"
+    r"Quality=(?P<quality>\d+)/(?P<quality_max>\d+)\s+"
+    r"Signal level=(?P<level>-?\d+) dBm\s+"
+    r"Encryption key:(?P<encryption>on|off)\s+"
+    r'ESSID:"(?P<ssid>[^"\n]*)"')
+
+# The first WPA/WPA2 information element of an encrypted cell
+IWLIST_WPA_IE = re.compile(r"IE: (?:WPA|IEEE 802\.11i/WPA2|WPA2) Version")
+
+# One netsh network after its "SSID " header, up to its first BSSID's channel
+NETSH_BLOCK = re.compile(
+    r"\d+ : (?P<ssid>[^\n]*)\n"
+    r"[ \t]*Network type[ \t]*:[^\n]*\n"
+    r"[ \t]*Authentication[ \t]*: (?P<auth>[^\n]*)\n"
+    r"[ \t]*Encryption[ \t]*:[^\n]*\n"
+    r"[ \t]*BSSID 1[ \t]*: (?P<bssid>[^\n]*)\n"
+    r"[ \t]*Signal[ \t]*: (?P<signal>\d+)%\n"
+    r"(?:[ \t]*(?:Radio type|Band)[ \t]*:[^\n]*\n)*"
+    r"[ \t]*Channel[ \t]*: (?P<channel>\d+)")
+
+IW_TOKENS = re.compile(
+    r"^(BSS(?= [0-9A-Fa-f:]{17})|\t(?:freq|signal|SSID|capability|RSN|WPA|DS Parameter set))"
+    r":?[ \t]*(.*)",
+    re.M)
+
+# The primary channel in an iw "DS Parameter set" line
+IW_CHANNEL = re.compile(r"channel (\d+)")
+
+# Terse nmcli output separates fields with ':' and escapes literal colons as '\:'
+NMCLI_FIELDS = re.compile(r"(?<!\\):")
+NMCLI_ESCAPE = re.compile(r"\\(.)")
+
+def frequency_to_channel(frequency):
+    """Convert a centre frequency in MHz to an 802.11 channel number (0 if unknown)"""
+    if frequency == 2484:
+        return 14
+    if 2412 <= frequency <= 2472:
+        return (frequency - 2407) // 5
+    if 5955 <= frequency <= 7115:
+        return (frequency - 5950) // 5
+    if 5000 <= frequency <= 5900:
+        return (frequency - 5000) // 5
+    return 0
+
+def channel_to_frequency(channel):
+    """Convert an 802.11 channel number to a centre frequency in MHz (0 if unknown).
+
+    Channels 1-14 are 2.4 GHz; higher numbers are assumed to be 5 GHz.
+    """
+    if channel == 14:
+        return 2484
+    if 1 <= channel <= 13:
+        return 2407 + 5 * channel
+    if 32 <= channel <= 177:
+        return 5000 + 5 * channel
+    return 0
+
+def _noise_for(noise_floor, channel):
+    # A per-channel table (anything with .get(channel)) or a single value
+    return noise_floor.get(channel) if hasattr(noise_floor, "get") else noise_floor
+
+def _field(text, label):
+    """Rest of the line after `label` and its one-character separator, or None"""
+    start = text.find(label)
+    if start < 0:
+        return None
+    start += len(label) + 1
+    end = text.find("\n", start)
+    return text[start:end] if end >= 0 else text[start:]
+
+def _first_word(value):
+    return value.split()[0] if value and value.strip() else None
+
+def _iwlist_signal(level):
+    """dBm from an iwlist "Signal level" value: "-81", or "60/100" on drivers without dBm"""
+    if level.lstrip("-").isdigit():
+        return int(level)
+    numerator, slash, denominator = level.partition("/")
+    try:
+        if slash:
+            # Relative level only: same conversion as netsh, 100% = -50dBm, 0% = -100dBm
+            return int((100 * int(numerator) / int(denominator)) / 2 - 100)
+        return int(float(level))
+    except (ValueError, ZeroDivisionError):
+        return None
+
+def _iwlist_fields(cell):
+    """(address, channel, frequency, quality, quality_max, level, encryption, ssid) of a cell in any layout"""
+    address = cell[:17] if cell[:17].count(":") == 5 else None
+    ssid = _field(cell, "ESSID")
+    if ssid is not None:
+        ssid = ssid[1:ssid.find('"', 1)] if ssid.startswith('"') else ssid.strip()
+    encryption = _field(cell, "Encryption key")
+    quality, _, quality_max = (_first_word(_field(cell, "Quality")) or "").partition("/")
+    return (address, _first_word(_field(cell, "Channel")), _first_word(_field(cell, "Frequency")),
+            quality, quality_max, _first_word(_field(cell, "Signal level")),
+            encryption.strip() if encryption else None, ssid)
+
+def _iwlist_network(cell, fields, noise_floor):
+    address, channel, frequency, quality, quality_max, level, encryption, ssid = fields
+    if ssid is None or level is None:
+        return None
+    signal_dbm = _iwlist_signal(level)
+    if signal_dbm is None:
+        return None
+    channel = int(channel) if channel and channel.isdigit() else 0
+    try:
+        frequency = int(round(float(frequency) * 1000)) if frequency else 0
+    except ValueError:
+        frequency = 0
+    if not channel and frequency:
+        channel = frequency_to_channel(frequency)
+    noise = _noise_for(noise_floor, channel)
+
+    auth_type = "Open"
+    if encryption == "on":
+        auth_ie = IWLIST_WPA_IE.search(cell)
+        if auth_ie:
+            auth_type = "WPA2" if "WPA2" in auth_ie.group() else "WPA"
+        else:
+            auth_type = "WEP"
+
+    network = {
+        "ssid": ssid,
+        "signal": signal_dbm,
+        "signal_percent": max(0, min(100, 2 * (signal_dbm + 100))),
+        "auth": auth_type,
+        "channel": channel,
+        "noise_floor": noise,
+        "snr": signal_dbm - noise
+    }
+    if address:
+        network["bssid"] = address.lower()
+    if frequency or channel:
+        network["frequency"] = frequency or channel_to_frequency(channel)
+    if quality.isdigit() and quality_max.isdigit() and quality_max != "0":
+        network["quality"] = round(100 * int(quality) / int(quality_max))
+    return network
+
+def parse_iwlist(output, noise_floor=DEFAULT_NOISE_FLOOR):
+    """Parse `iwlist <if> scan` output into network dicts, one per cell.
+
+    `noise_floor` is either a single value in dBm or a per-channel table
+    with a .get(channel) method. The first value of each field in a cell
+    wins. Cells whose signal level is neither dBm nor a fraction are skipped.
+    """
+    wifi_data = []
+    match = IWLIST_CELL.match
+    # Each cell starts "Cell NN - Address: <bssid>"; the text before the first is the header
+    for cell in output.split(" - Address: ")[1:]:
+        fields = match(cell)
+        network = _iwlist_network(cell, fields.groups() if fields else _iwlist_fields(cell), noise_floor)
+        if network:
+            wifi_data.append(network)
+    return wifi_data
+
+def _netsh_field(block, label):
+    """Value after the colon on the first line starting with `label`, stripped, or None"""
+    start = block.find(label)
+    if start < 0:
+        return None
+    colon = block.find(":", start)
+    end = block.find("\n", start)
+    if colon < 0 or 0 <= end < colon:
+        return None
+    return block[colon + 1:end].strip() if end >= 0 else block[colon + 1:].strip()
+
+def _netsh_fields(block):
+    """(ssid, auth, bssid, signal, channel) of a network block in any layout"""
+    end = block.find("\n")
+    ssid = block[block.find(":") + 1:end if end >= 0 else len(block)]
+    signal = _netsh_field(block, "Signal")
+    signal = signal[:-1] if signal and signal.endswith("%") else None
+    return (ssid, _netsh_field(block, "Authentication"), _netsh_field(block, "BSSID"),
+            signal, _netsh_field(block, "Channel"))
+
+def _netsh_network(fields, noise_floor):
+    ssid, auth, bssid, signal, channel = fields
+    ssid = ssid.strip()
+    if not ssid or not signal or not signal.isdigit():
+        return None
+    signal_percent = int(signal)
+    # Simple conversion formula: 100% = -50dBm, 0% = -100dBm
+    signal_dbm = int((signal_percent / 2) - 100)
+    channel = int(channel) if channel and channel.isdigit() else 0
+    noise = _noise_for(noise_floor, channel)
+
+    network = {
+        "ssid": ssid,
+        "signal": signal_dbm,
+        "signal_percent": signal_percent,
+        "auth": auth.strip() if auth else "Unknown",
+        "channel": channel,
+        "noise_floor": noise,
+        "snr": signal_dbm - noise,
+        # netsh's Signal percentage is the link quality
+        "quality": signal_percent
+    }
+    if bssid:
+        network["bssid"] = bssid.strip().lower()
+    if channel:
+        network["frequency"] = channel_to_frequency(channel)
+    return network
+
+def parse_netsh(output, noise_floor=DEFAULT_NOISE_FLOOR):
+    """Parse `netsh wlan show networks mode=bssid` output into network dicts.
+
+    One entry per SSID, using the first BSSID's signal, channel and address.
+    Hidden networks (empty SSID) are skipped.
+    """
+    wifi_data = []
+    match = NETSH_BLOCK.match
+    # SSID headers start a line; the indented "BSSID N" lines never match
+    for block in output.replace("\r", "").split("\nSSID ")[1:]:
+        fields = match(block)
+        network = _netsh_network(fields.groups() if fields else _netsh_fields(block), noise_floor)
+        if network:
+            wifi_data.append(network)
+    return wifi_data
+
+def _iw_network(bss, noise_floor):
+    if "\tSSID" not in bss or "\tsignal" not in bss:
+        return None
+    try:
+        signal_dbm = int(float(bss["\tsignal"].split()[0]))
+    except (ValueError, IndexError):
+        return None
+    try:
+        frequency = int(float(bss["\tfreq"])) if "\tfreq" in bss else 0
+    except ValueError:
+        frequency = 0
+    channel_match = IW_CHANNEL.search(bss.get("\tDS Parameter set", ""))
+    channel = int(channel_match.group(1)) if channel_match else frequency_to_channel(frequency)
+    noise = _noise_for(noise_floor, channel)
+
+    if "\tRSN" in bss:
+        auth_type = "WPA2"
+    elif "\tWPA" in bss:
+        auth_type = "WPA"
+    elif "Privacy" in bss.get("\tcapability", ""):
+        auth_type = "WEP"
+    else:
+        auth_type = "Open"
+
+    network = {
+        "ssid": bss["\tSSID"],
+        "signal": signal_dbm,
+        "signal_percent": max(0, min(100, 2 * (signal_dbm + 100))),
+        "auth": auth_type,
+        "channel": channel,
+        "noise_floor": noise,
+        "snr": signal_dbm - noise,
+        "bssid": bss["BSS"][:17].lower()
+    }
+    if frequency or channel:
+        network["frequency"] = frequency or channel_to_frequency(channel)
+    return network
+
+def parse_iw(output, noise_floor=DEFAULT_NOISE_FLOOR):
+    """Parse `iw dev <if> scan` output into network dicts, one per BSS"""
+    wifi_data = []
+    bss = None
+    for field, value in IW_TOKENS.findall(output):
+        if field == "BSS":
+            if bss is not None:
+                network = _iw_network(bss, noise_floor)
+                if network:
+                    wifi_data.append(network)
+            bss = {"BSS": value}
+        elif bss is not None and field not in bss:
+            bss[field] = value.strip()
+
+    if bss is not None:
+        network = _iw_network(bss, noise_floor)
+        if network:
+            wifi_data.append(network)
+    return wifi_data
+
+def _nmcli_auth(security):
+    # nmcli lists every supported scheme, e.g. "WPA1 WPA2 802.1X"
+    if not security or security == "--":
+        return "Open"
+    for scheme, name in (("WPA3", "WPA3"), ("WPA2", "WPA2"), ("WPA1", "WPA"), ("WEP", "WEP")):
+        if scheme in security:
+            return f"{name}-Enterprise" if "802.1X" in security else name
+    return security
+
+def parse_nmcli(output, noise_floor=DEFAULT_NOISE_FLOOR):
+    """Parse `nmcli -t -f BSSID,SSID,CHAN,FREQ,SIGNAL,SECURITY device wifi list` output.
+
+    Hidden networks (empty SSID) are skipped.
+    """
+    wifi_data = []
+    for line in output.splitlines():
+        fields = [NMCLI_ESCAPE.sub(r"\1", field) for field in NMCLI_FIELDS.split(line)]
+        if len(fields) < 6 or not fields[1] or not fields[4].isdigit():
+            continue
+        bssid, ssid, channel, frequency, signal, security = fields[:6]
+        signal_percent = int(signal)
+        # Same conversion as netsh: 100% = -50dBm, 0% = -100dBm
+        signal_dbm = int((signal_percent / 2) - 100)
+        channel = int(channel) if channel.isdigit() else 0
+        noise = _noise_for(noise_floor, channel)
+        network = {
+            "ssid": ssid,
+            "signal": signal_dbm,
+            "signal_percent": signal_percent,
+            "auth": _nmcli_auth(security),
+            "channel": channel,
+            "noise_floor": noise,
+            "snr": signal_dbm - noise,
+            "quality": signal_percent
+        }
+        if bssid:
+            network["bssid"] = bssid.lower()
+        frequency = frequency.split()[0] if frequency else ""
+        if frequency.isdigit():
+            network["frequency"] = int(frequency)
+        elif channel:
+            network["frequency"] = channel_to_frequency(channel)
+        wifi_data.append(network)
+    return wifi_data
+
+PARSERS = {
+    "iwlist": parse_iwlist,
+    "iw": parse_iw,
+    "nmcli": parse_nmcli,
+    "netsh": parse_netsh,
+}
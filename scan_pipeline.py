@@ -0,0 +1,119 @@
+import queue
+import threading
+import time
+
+class ScanPipeline:
+    """Run scanning and persistence on separate threads.
+
+    A producer thread calls `produce()` on fixed ticks (start + k * interval
+    on the monotonic clock), so slow writes never push later scans back. If a
+    scan overruns one or more ticks, those ticks are skipped rather than run
+    back to back. Records go onto a bounded queue; when it is full the oldest
+    record is dropped so the scanner never blocks on the writer. A scan that
+    raises is counted in `errors` and its tick skipped; EOFError means there
+    is nothing left to scan (e.g. a replayed recording ran out) and ends the
+    run like reaching `duration`.
+
+    The consumer runs in the thread that calls run(). It takes records off the
+    queue in batches of up to `batch_size`, waiting at most `flush_interval`
+    seconds for the first one, and hands each batch to `consume_batch()`.
+    """
+
+    def __init__(self, produce, consume_batch, interval, max_queue=100,
+                 batch_size=20, flush_interval=1.0):
+        self.produce = produce
+        self.consume_batch = consume_batch
+        self.interval = interval
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.produced = 0
+        self.consumed = 0
+        self.dropped = 0
+        self.missed_ticks = 0
+        self.errors = 0
+        self._stop = threading.Event()
+
+    def stop(self):
+        self._stop.set()
+
+    def _enqueue(self, record):
+        while True:
+            try:
+                self.queue.put_nowait(record)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def _producer(self, duration):
+        start = time.monotonic()
+        tick = 0
+        try:
+            while not self._stop.is_set():
+                if duration and time.monotonic() - start >= duration:
+                    break
+
+                try:
+                    record = self.produce()
+                except EOFError:
+                    break
+                except Exception as e:
+                    self.errors += 1
+                    print(f"Error during scan: {e}")
+                    record = None
+                if record is not None:
+                    self._enqueue(record)
+                    self.produced += 1
+
+                tick += 1
+                now = time.monotonic()
+                if start + tick * self.interval <= now:
+                    # The scan overran; realign to the next tick still ahead of us
+                    next_tick = int((now - start) // self.interval) + 1 if self.interval else tick
+                    self.missed_ticks += next_tick - tick
+                    tick = next_tick
+                self._stop.wait(max(0, start + tick * self.interval - time.monotonic()))
+        finally:
+            self._stop.set()
+
+    def _next_batch(self):
+        try:
+            batch = [self.queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self, duration=None, stop_event=None):
+        """Scan until `duration` seconds pass, stop() is called or stop_event is set.
+
+        Records still queued when scanning stops are written before returning.
+        """
+        producer = threading.Thread(target=self._producer, args=(duration,), daemon=True)
+        producer.start()
+        try:
+            while producer.is_alive() or not self.queue.empty():
+                if stop_event and stop_event.is_set():
+                    self._stop.set()
+                batch = self._next_batch()
+                if batch:
+                    self.consume_batch(batch)
+                    self.consumed += len(batch)
+        finally:
+            self._stop.set()
+            producer.join()
+            # Flush whatever the producer queued while we were shutting down
+            batch = self._next_batch() if not self.queue.empty() else []
+            while batch:
+                self.consume_batch(batch)
+                self.consumed += len(batch)
+                batch = self._next_batch() if not self.queue.empty() else []
+        return self.consumed
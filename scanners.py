@@ -0,0 +1,396 @@
+"""Scanner backends.
+
+Every backend has a scan() method returning one scan as
+{"interface": ..., "noise_floor": ..., "networks": [...]}, and a location()
+method returning (latitude, longitude, description) when the backend knows
+where the scan was taken, else None.
+
+    iwlist, iw  - Linux wireless-tools / nl80211; need root, so they run in the scan helper
+    nmcli       - NetworkManager; unprivileged
+    netsh       - Windows
+    fake        - synthetic access points whose signals random-walk
+    replay      - scans recorded to a JSON-lines file, streamed back at a chosen rate
+
+A replay file has one scan per line: either {"networks": [...]} as stored by
+the collectors, or {"format": "iwlist", "output": "<raw transcript>"}. Each
+line may carry "time" (seconds) or an ISO "timestamp" to pace the replay,
+and "latitude"/"longitude" for where it was taken. `python scan_helper.py
+--record FILE` writes one from any backend.
+"""
+import json
+import os
+import random
+import re
+import subprocess
+import time
+from datetime import datetime
+from scan_parser import DEFAULT_NOISE_FLOOR, PARSERS, frequency_to_channel, parse_iw, parse_iwlist, parse_nmcli, parse_netsh
+
+# Seconds before the per-channel noise floor table is re-read
+NOISE_FLOOR_TTL = 60
+
+SYS_CLASS_NET = "/sys/class/net"
+
+def wireless_interfaces():
+    """Return the wireless interfaces listed in sysfs (those with a wireless/ or phy80211/ entry)"""
+    try:
+        names = sorted(os.listdir(SYS_CLASS_NET))
+    except OSError:
+        return []
+    return [name for name in names
+            if os.path.isdir(os.path.join(SYS_CLASS_NET, name, "wireless"))
+            or os.path.exists(os.path.join(SYS_CLASS_NET, name, "phy80211"))]
+
+class InterfaceCache:
+    """Remembers the wireless interface to scan with.
+
+    Discovery reads sysfs directly instead of running iwconfig on every
+    interface. The cached choice is dropped when the set of network
+    interfaces changes (an adapter is plugged in or removed) or when
+    invalidate() is called after a failed scan.
+    """
+
+    def __init__(self):
+        self._names = None
+        self._interface = None
+
+    def get(self):
+        try:
+            names = os.listdir(SYS_CLASS_NET)
+        except OSError:
+            names = []
+        names = sorted(names)
+        if names != self._names:
+            self._names = names
+            interfaces = wireless_interfaces()
+            self._interface = interfaces[0] if interfaces else None
+        return self._interface
+
+    def invalidate(self):
+        self._names = None
+        self._interface = None
+
+SURVEY_BLOCK = re.compile(r"frequency:\s*(\d+)\s*MHz(?P<in_use>\s*\[in use\])?(?P<body>.*?)(?=frequency:|\Z)", re.S)
+SURVEY_NOISE = re.compile(r"noise:\s*(-?\d+)")
+
+def parse_survey_dump(output):
+    """Parse `iw dev <if> survey dump` into ({channel: noise_dbm}, in_use_noise)"""
+    noise_by_channel = {}
+    in_use_noise = None
+    for match in SURVEY_BLOCK.finditer(output):
+        noise_match = SURVEY_NOISE.search(match.group("body"))
+        if not noise_match:
+            continue
+        noise = int(noise_match.group(1))
+        noise_by_channel[frequency_to_channel(int(match.group(1)))] = noise
+        if match.group("in_use"):
+            in_use_noise = noise
+    return noise_by_channel, in_use_noise
+
+class NoiseFloorTable:
+    """Per-channel noise floor from `iw survey dump`, refreshed every `ttl` seconds.
+
+    Channels the survey did not report fall back to the noise on the channel
+    in use, then to DEFAULT_NOISE_FLOOR.
+    """
+
+    def __init__(self, ttl=NOISE_FLOOR_TTL):
+        self.ttl = ttl
+        self.interface = None
+        self.noise_by_channel = {}
+        self.default = DEFAULT_NOISE_FLOOR
+        self._refreshed = None
+
+    def refresh(self, interface):
+        self.interface = interface
+        self._refreshed = time.monotonic()
+        try:
+            survey_output = subprocess.check_output(["iw", "dev", interface, "survey", "dump"],
+                                                    stderr=subprocess.DEVNULL).decode()
+        except Exception:
+            self.noise_by_channel = {}
+            self.default = DEFAULT_NOISE_FLOOR
+            return
+        self.noise_by_channel, in_use_noise = parse_survey_dump(survey_output)
+        self.default = in_use_noise if in_use_noise is not None else DEFAULT_NOISE_FLOOR
+
+    def for_interface(self, interface):
+        """Return the table for `interface`, re-reading it if stale or for another interface"""
+        if (interface != self.interface or self._refreshed is None
+                or time.monotonic() - self._refreshed >= self.ttl):
+            self.refresh(interface)
+        return self
+
+    def get(self, channel):
+        return self.noise_by_channel.get(channel, self.default)
+
+class Scanner:
+    """Base class for scanner backends"""
+
+    name = None
+
+    def scan(self):
+        raise NotImplementedError
+
+    def location(self):
+        return None
+
+    def close(self):
+        pass
+
+class IwlistScanner(Scanner):
+    """Scans with iwlist; must run with the privileges iwlist scan needs"""
+
+    name = "iwlist"
+
+    def __init__(self, noise_ttl=NOISE_FLOOR_TTL):
+        self.interfaces = InterfaceCache()
+        self.noise = NoiseFloorTable(noise_ttl)
+
+    def command(self, interface):
+        return ["iwlist", interface, "scan"]
+
+    def parse(self, output, noise):
+        return parse_iwlist(output, noise)
+
+    def scan(self):
+        interface = self.interfaces.get()
+        if interface is None:
+            raise RuntimeError("No wireless interface found")
+        noise = self.noise.for_interface(interface)
+        try:
+            output = subprocess.check_output(self.command(interface)).decode()
+        except Exception:
+            # The interface may have gone away; look it up again next time
+            self.interfaces.invalidate()
+            raise
+        return {
+            "interface": interface,
+            "noise_floor": noise.default,
+            "networks": self.parse(output, noise)
+        }
+
+class IwScanner(IwlistScanner):
+    """Scans with `iw dev <if> scan` (nl80211); needs the same privileges as iwlist"""
+
+    name = "iw"
+
+    def command(self, interface):
+        return ["iw", "dev", interface, "scan"]
+
+    def parse(self, output, noise):
+        return parse_iw(output, noise)
+
+class NmcliScanner(Scanner):
+    """Scans through NetworkManager, which needs no root privileges"""
+
+    name = "nmcli"
+
+    COMMAND = ["nmcli", "-t", "-f", "BSSID,SSID,CHAN,FREQ,SIGNAL,SECURITY",
+               "device", "wifi", "list", "--rescan", "yes"]
+
+    def scan(self):
+        output = subprocess.check_output(self.COMMAND, stderr=subprocess.DEVNULL).decode()
+        return {
+            "interface": None,
+            "noise_floor": DEFAULT_NOISE_FLOOR,
+            "networks": parse_nmcli(output)
+        }
+
+class NetshScanner(Scanner):
+    """Scans with netsh on Windows"""
+
+    name = "netsh"
+
+    COMMAND = "netsh wlan show networks mode=bssid"
+
+    def scan(self):
+        # The first call makes Windows refresh its list of visible networks
+        subprocess.run(self.COMMAND, shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        output = subprocess.check_output(self.COMMAND, shell=True).decode(errors="replace")
+        return {
+            "interface": None,
+            "noise_floor": DEFAULT_NOISE_FLOOR,
+            "networks": parse_netsh(output)
+        }
+
+class FakeScanner(Scanner):
+    """Synthetic scans for testing without radio hardware.
+
+    A fixed set of access points whose signals random-walk between scans.
+    """
+
+    name = "fake"
+
+    AUTH_TYPES = ["WPA2", "WPA2", "WPA", "Open", "WPA2-Enterprise"]
+    CHANNELS = [1, 6, 11, 36, 40, 44, 48, 149, 153, 157, 161]
+
+    def __init__(self, networks=12, seed=None):
+        self.random = random.Random(seed)
+        self.access_points = []
+        for i in range(networks):
+            self.access_points.append({
+                "ssid": f"FakeNet-{i:02d}",
+                "signal": self.random.randint(-90, -40),
+                "auth": self.random.choice(self.AUTH_TYPES),
+                "channel": self.random.choice(self.CHANNELS)
+            })
+
+    def scan(self):
+        noise_floor = DEFAULT_NOISE_FLOOR
+        networks = []
+        for ap in self.access_points:
+            ap["signal"] = max(-100, min(-30, ap["signal"] + self.random.randint(-3, 3)))
+            # Weak networks are sometimes missed, as with a real radio
+            if ap["signal"] < -85 and self.random.random() < 0.3:
+                continue
+            signal_dbm = ap["signal"]
+            networks.append({
+                "ssid": ap["ssid"],
+                "signal": signal_dbm,
+                "signal_percent": max(0, min(100, 2 * (signal_dbm + 100))),
+                "auth": ap["auth"],
+                "channel": ap["channel"],
+                "noise_floor": noise_floor,
+                "snr": signal_dbm - noise_floor
+            })
+        return {"interface": "fake0", "noise_floor": noise_floor, "networks": networks}
+
+class ReplayScanner(Scanner):
+    """Streams scans back from a JSON-lines replay file.
+
+    Scans are paced by their recorded times divided by `rate`: rate=1 is real
+    time, rate=10 ten times faster, and rate=0 returns them as fast as they
+    are asked for. Lines without a time are `interval` seconds apart. With
+    `loop` the file starts over when it runs out; otherwise scan() raises
+    EOFError.
+
+    Consecutive lines recorded at the same position are one point. A
+    collector calls location() once per point and then takes as many scans
+    as it samples, so location() moves on to the next point, skipping any
+    scans of the previous one the collector didn't take, and scan() repeats
+    the point's last scan if it asks for more than were recorded there.
+    That keeps every point's scans and position in step.
+    """
+
+    name = "replay"
+
+    def __init__(self, path, rate=1.0, loop=False, interval=1.0):
+        self.path = path
+        self.rate = rate
+        self.loop = loop
+        self.interval = interval
+        self.replayed = 0
+        self._file = open(path, 'r')
+        self._pending = None
+        self._point = None
+        self._last = None
+        self._first_time = None
+        self._last_time = None
+        self._offset = 0.0
+        self._started = None
+
+    def _read(self):
+        for line in self._file:
+            line = line.strip()
+            if line:
+                return json.loads(line)
+        if not self.loop or self._first_time is None:
+            return None
+        # Start the file over, continuing the timeline one interval after its end
+        self._file.seek(0)
+        self._offset += self._last_time - self._first_time + self.interval
+        self._last_time = None
+        for line in self._file:
+            line = line.strip()
+            if line:
+                return json.loads(line)
+        return None
+
+    def _record_time(self, record):
+        if "time" in record:
+            return float(record["time"])
+        if "timestamp" in record:
+            try:
+                return datetime.fromisoformat(record["timestamp"]).timestamp()
+            except (TypeError, ValueError):
+                pass
+        return self._last_time + self.interval if self._last_time is not None else 0.0
+
+    def _peek(self):
+        if self._pending is None:
+            self._pending = self._read()
+        return self._pending
+
+    @staticmethod
+    def _position(record):
+        if record.get("latitude") is None or record.get("longitude") is None:
+            return None
+        return record["latitude"], record["longitude"]
+
+    def location(self):
+        """Where the next point to be replayed was taken, if it was recorded"""
+        record = self._peek()
+        while record is not None and self._point is not None and self._position(record) == self._point:
+            # Scans of the previous point the collector didn't sample
+            self._pending = None
+            record = self._peek()
+        self._point = self._position(record) if record is not None else None
+        self._last = None
+        if self._point is None:
+            return None
+        return self._point[0], self._point[1], f"Replayed from {os.path.basename(self.path)}"
+
+    def scan(self):
+        record = self._peek()
+        if self._point is not None and self._last is not None and (
+                record is None or self._position(record) != self._point):
+            # No more scans were recorded at this point
+            return self._result(self._last)
+        self._pending = None
+        if record is None:
+            raise EOFError(f"Replay {self.path} finished after {self.replayed} scans")
+
+        record_time = self._record_time(record)
+        if self._first_time is None:
+            self._first_time = record_time
+            self._started = time.monotonic()
+        self._last_time = record_time
+        if self.rate:
+            due = self._started + (self._offset + record_time - self._first_time) / self.rate
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+        self._last = record
+        self.replayed += 1
+        return self._result(record)
+
+    def _result(self, record):
+        noise_floor = record.get("noise_floor", DEFAULT_NOISE_FLOOR)
+        if "networks" in record:
+            networks = record["networks"]
+        else:
+            networks = PARSERS[record.get("format", "iwlist")](record.get("output", ""), noise_floor)
+        return {"interface": record.get("interface", "replay"), "noise_floor": noise_floor, "networks": networks}
+
+    def close(self):
+        self._file.close()
+
+SCANNER_BACKENDS = {
+    "iwlist": IwlistScanner,
+    "iw": IwScanner,
+    "nmcli": NmcliScanner,
+    "netsh": NetshScanner,
+    "fake": FakeScanner,
+    "replay": ReplayScanner,
+}
+
+# Backends that need root and therefore run inside the scan helper process
+PRIVILEGED_BACKENDS = ("iwlist", "iw")
+
+def create_scanner(backend, **options):
+    """Create a scanner backend by name, e.g. create_scanner("replay", path="scans.jsonl", rate=10)"""
+    if backend not in SCANNER_BACKENDS:
+        raise ValueError(f"Unknown scanner backend: {backend} (choose from {', '.join(SCANNER_BACKENDS)})")
+    return SCANNER_BACKENDS[backend](**options)
@@ -0,0 +1,82 @@
+"""Persistent {key: value} map for copy-on-write snapshots.
+
+ShardedMap splits its entries into shards by key hash. updated() returns
+a new map that shares every shard a batch of changes doesn't touch, so
+moving a large map to its next version costs the size of the touched
+shards rather than of the whole map, and the previous version stays
+valid for whoever still holds it.
+"""
+from collections.abc import ItemsView, Mapping, ValuesView
+
+DEFAULT_SHARDS = 64
+
+class ShardedMap(Mapping):
+    """Read-only mapping whose updated() copies only the shards a change lands in"""
+
+    __slots__ = ("_shards", "_len")
+
+    def __init__(self, items=(), shards=DEFAULT_SHARDS):
+        self._shards = [{} for _ in range(shards)]
+        for key, value in dict(items).items():
+            self._shards[hash(key) % shards][key] = value
+        self._len = sum(len(shard) for shard in self._shards)
+
+    def __getitem__(self, key):
+        return self._shards[hash(key) % len(self._shards)][key]
+
+    def __contains__(self, key):
+        return key in self._shards[hash(key) % len(self._shards)]
+
+    def __iter__(self):
+        for shard in self._shards:
+            yield from shard
+
+    def __len__(self):
+        return self._len
+
+    def items(self):
+        return _ShardedItems(self)
+
+    def values(self):
+        return _ShardedValues(self)
+
+    def shared_shards(self, other):
+        """Number of shards this map shares with `other`"""
+        return sum(mine is theirs for mine, theirs in zip(self._shards, other._shards))
+
+    def updated(self, changes):
+        """A new map with {key: value, or None to delete} applied"""
+        shards = list(self._shards)
+        copied = set()
+        length = self._len
+        for key, value in changes.items():
+            i = hash(key) % len(shards)
+            if i not in copied:
+                shards[i] = dict(shards[i])
+                copied.add(i)
+            length -= key in shards[i]
+            if value is None:
+                shards[i].pop(key, None)
+            else:
+                shards[i][key] = value
+                length += 1
+        result = ShardedMap.__new__(ShardedMap)
+        result._shards = shards
+        result._len = length
+        return result
+
+    def to_dict(self):
+        result = {}
+        for shard in self._shards:
+            result.update(shard)
+        return result
+
+class _ShardedItems(ItemsView):
+    def __iter__(self):
+        for shard in self._mapping._shards:
+            yield from shard.items()
+
+class _ShardedValues(ValuesView):
+    def __iter__(self):
+        for shard in self._mapping._shards:
+            yield from shard.values()
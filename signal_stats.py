@@ -0,0 +1,185 @@
+import math
+import time
+
+class RunningStats:
+    """Streaming count/mean/stdev/min/max (Welford) plus percentiles.
+
+    Percentiles come from a histogram of values rounded to `resolution`
+    (1 dB by default). Signal levels span roughly -100..-20 dBm, so the
+    histogram holds at most a few dozen bins however many samples are
+    added, and the median is exact to within one bin.
+    """
+
+    __slots__ = ("count", "mean", "m2", "min", "max", "resolution", "histogram")
+
+    def __init__(self, resolution=1):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+        self.resolution = resolution
+        self.histogram = {}
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        bucket = round(value / self.resolution)
+        self.histogram[bucket] = self.histogram.get(bucket, 0) + 1
+
+    @property
+    def variance(self):
+        """Sample variance (n - 1), or None with fewer than two values"""
+        return self.m2 / (self.count - 1) if self.count > 1 else None
+
+    @property
+    def stdev(self):
+        variance = self.variance
+        return math.sqrt(variance) if variance is not None else None
+
+    def percentile(self, p):
+        """Nearest-rank p-th percentile (0-100) from the histogram"""
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(p / 100 * self.count))
+        seen = 0
+        for bucket in sorted(self.histogram):
+            seen += self.histogram[bucket]
+            if seen >= rank:
+                return bucket * self.resolution
+        return self.max
+
+    @property
+    def standard_error(self):
+        """Standard error of the mean, or None with fewer than two values"""
+        stdev = self.stdev
+        return stdev / math.sqrt(self.count) if stdev is not None else None
+
+    @property
+    def median(self):
+        return self.percentile(50)
+
+class NetworkSamples:
+    """Running statistics for one BSSID across the samples of a scan point"""
+
+    __slots__ = ("ssid", "signal", "snr", "strongest")
+
+    def __init__(self, ssid):
+        self.ssid = ssid
+        self.signal = RunningStats()
+        self.snr = RunningStats()
+        self.strongest = None
+
+    def add(self, network):
+        self.signal.add(network["signal"])
+        self.snr.add(network.get("snr", 0))
+        # Only the strongest sample's dict is kept, for its auth/channel/etc.
+        if self.strongest is None or network["signal"] > self.strongest["signal"]:
+            self.strongest = network
+
+    def to_dict(self):
+        strongest = self.strongest
+        network_data = {
+            "ssid": self.ssid,
+            "signal": int(self.signal.mean),
+            "signal_percent": strongest.get("signal_percent", 0),
+            "auth": strongest.get("auth", "Unknown"),
+            "channel": strongest.get("channel", 0),
+            "noise_floor": strongest.get("noise_floor", -95),
+            "snr": int(self.snr.mean),
+            "samples": self.signal.count
+        }
+
+        # Identify the strongest BSSID when the scanner reported one
+        for key in ("bssid", "frequency", "quality"):
+            if key in strongest:
+                network_data[key] = strongest[key]
+
+        if self.signal.count > 1:
+            stdev = int(self.signal.stdev)
+            if stdev:
+                network_data["signal_variance"] = stdev
+            network_data["signal_min"] = self.signal.min
+            network_data["signal_max"] = self.signal.max
+            network_data["signal_median"] = self.signal.median
+            network_data["signal_p10"] = self.signal.percentile(10)
+            network_data["signal_p90"] = self.signal.percentile(90)
+            network_data["signal_stderr"] = round(self.signal.standard_error, 2)
+        return network_data
+
+class SampleAggregator:
+    """Aggregates repeated scans of one point as they arrive.
+
+    Networks are tracked per BSSID (per SSID when the scanner gives no
+    BSSID) in O(1) memory each, without keeping the raw samples. results()
+    returns one entry per SSID - its access point with the strongest mean
+    signal - sorted by signal, which is the shape stored for a location.
+    """
+
+    def __init__(self):
+        # Scans that returned networks, and scans taken in total
+        self.samples = 0
+        self.scans = 0
+        self.networks = {}
+
+    def add_sample(self, networks):
+        self.scans += 1
+        if not networks:
+            return
+        self.samples += 1
+        for network in networks:
+            key = network.get("bssid") or network["ssid"]
+            accumulator = self.networks.get(key)
+            if accumulator is None:
+                accumulator = self.networks[key] = NetworkSamples(network["ssid"])
+            accumulator.add(network)
+
+    def converged(self, tolerance):
+        """True once every network's signal standard error is at most `tolerance` dB.
+
+        Networks seen in only one sample have no estimate yet and don't hold
+        sampling open, so an AP that flickers in once is not waited on.
+        """
+        for accumulator in self.networks.values():
+            standard_error = accumulator.signal.standard_error
+            if standard_error is not None and standard_error > tolerance:
+                return False
+        return True
+
+    def results(self):
+        best = {}
+        for accumulator in self.networks.values():
+            current = best.get(accumulator.ssid)
+            if current is None or accumulator.signal.mean > current.signal.mean:
+                best[accumulator.ssid] = accumulator
+        result = [accumulator.to_dict() for accumulator in best.values()]
+        return sorted(result, key=lambda n: n["signal"], reverse=True)
+
+def collect_samples(scan, samples=3, delay=0.2, tolerance=None, max_samples=20, max_time=None):
+    """Scan one point repeatedly and return the SampleAggregator.
+
+    Without a tolerance this takes exactly `samples` scans. With one, `samples`
+    is the minimum and scanning stops as soon as the aggregator has converged
+    to `tolerance` dB, or after `max_samples` scans or `max_time` seconds.
+    """
+    aggregator = SampleAggregator()
+    start = time.monotonic()
+    while True:
+        aggregator.add_sample(scan())
+        if tolerance is None:
+            if aggregator.scans >= samples:
+                break
+        elif aggregator.scans >= samples and aggregator.converged(tolerance):
+            break
+        elif aggregator.scans >= max(samples, max_samples):
+            break
+        elif max_time is not None and time.monotonic() - start >= max_time:
+            break
+        time.sleep(delay)
+    return aggregator
@@ -0,0 +1,471 @@
+"""Interpolated RSSI surfaces over the surveyed area.
+
+A surface is a regular latitude/longitude grid of predicted signal (dBm)
+for one SSID, or for the strongest network at each point when no SSID is
+given. Grids are interpolated from the stored scan points with vectorized
+inverse-distance weighting, or optionally a Gaussian process (simple
+kriging with a squared-exponential covariance). Cells farther than
+`radius` meters from every scan point are left empty (NaN) rather than
+extrapolated.
+
+SurfaceEngine serves one dataset version: it extracts the samples once
+and caches the surfaces it builds. The static apps make a new engine when
+the data file changes; the collector's snapshots derive the next version's
+engine with updated(), which shares the samples of every SSID a batch
+doesn't touch. Surface.predict() reads a point off a built grid by
+bilinear interpolation in a few microseconds.
+"""
+import base64
+import collections
+import math
+import threading
+import numpy as np
+from geo import METERS_PER_DEGREE
+from sharded_map import ShardedMap
+
+METHODS = ("idw", "gp")
+
+# The whole Web Mercator world as (south, west, north, east); boxes are clamped to it
+WORLD_BBOX = (-85.0511, -180.0, 85.0511, 180.0)
+
+# Default grid cell size in meters
+SURFACE_RESOLUTION = 5.0
+
+# Larger requests are coarsened to fit
+MAX_GRID_CELLS = 250000
+
+# Meters added around the scan points for the default extent
+SURFACE_MARGIN = 20.0
+
+# Cells farther than this (meters) from every scan point have no value
+SURFACE_RADIUS = 60.0
+
+IDW_POWER = 2
+IDW_NEIGHBOURS = 8
+
+# Gaussian process: correlation length (m), measurement noise (dB), and the
+# most scan points it is fitted to (the solve is cubic in this)
+GP_LENGTH_SCALE = 25.0
+GP_NOISE = 4.0
+GP_MAX_SAMPLES = 2000
+
+# Surfaces kept per engine
+SURFACE_CACHE_SIZE = 64
+
+# Grid values are sent as int8 dBm; this marks cells without a value
+NODATA = -128
+
+# Upper bound on grid-cell x sample distances held in memory at once
+CHUNK_ELEMENTS = 2000000
+
+def location_samples(location):
+    """{ssid: signal} of a location's strongest entry per SSID, plus the strongest overall under None"""
+    if location is None or location.get("latitude") is None or location.get("longitude") is None:
+        return {}
+    strongest = {}
+    for network in location.get("networks", ()):
+        signal = network.get("signal")
+        if signal is None:
+            continue
+        for ssid in (network.get("ssid"), None):
+            if strongest.get(ssid, -math.inf) < signal:
+                strongest[ssid] = signal
+    return strongest
+
+def sample_points(locations):
+    """{ssid: {key: (lat, lon, signal)}} from a {key: location} mapping; None holds the strongest per location"""
+    points = collections.defaultdict(dict)
+    points[None] = {}
+    for key, location in locations.items():
+        for ssid, signal in location_samples(location).items():
+            points[ssid][key] = (location["latitude"], location["longitude"], signal)
+    return {ssid: ShardedMap(ssid_points) for ssid, ssid_points in points.items()}
+
+def point_columns(points):
+    """(lats, lons, signals) arrays of one SSID's {key: (lat, lon, signal)} points"""
+    columns = np.array(list(points.values()), dtype=float).reshape(-1, 3)
+    return columns[:, 0], columns[:, 1], columns[:, 2]
+
+def signal_samples(locations):
+    """Per-SSID sample arrays from a {key: location} mapping.
+
+    Returns {ssid: (lats, lons, signals)}, plus the strongest signal at
+    each location under the key None. A location listing an SSID more
+    than once contributes its strongest entry.
+    """
+    return {ssid: point_columns(points) for ssid, points in sample_points(locations).items()}
+
+def parse_bbox(text):
+    """Parse "west,south,east,north" (the order of Leaflet's toBBoxString) into (south, west, north, east).
+
+    The box is clamped to WORLD_BBOX; a zoomed-out map reports longitudes
+    beyond +-180.
+    """
+    try:
+        west, south, east, north = (float(v) for v in text.split(","))
+    except ValueError:
+        raise ValueError("bbox must be west,south,east,north in degrees")
+    if not all(math.isfinite(v) for v in (west, south, east, north)):
+        raise ValueError("bbox must be finite numbers")
+    world_south, world_west, world_north, world_east = WORLD_BBOX
+    south, north = max(south, world_south), min(north, world_north)
+    west, east = max(west, world_west), min(east, world_east)
+    if not (south < north and west < east):
+        raise ValueError("bbox must have west < east and south < north within the world")
+    return south, west, north, east
+
+def parse_surface_args(args):
+    """Validate /surface query parameters into SurfaceEngine.surface() keyword arguments"""
+    method = args.get("method", "idw")
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {', '.join(METHODS)}")
+    bbox = args.get("bbox")
+    resolution = args.get("resolution")
+    try:
+        resolution = float(resolution) if resolution else SURFACE_RESOLUTION
+    except ValueError:
+        raise ValueError("resolution must be a number of meters")
+    if not 0 < resolution < math.inf:
+        raise ValueError("resolution must be a positive number of meters")
+    return {
+        "ssid": args.get("ssid") or None,
+        "bbox": parse_bbox(bbox) if bbox else None,
+        "resolution": resolution,
+        "method": method
+    }
+
+def _chunks(total, samples):
+    step = max(1, CHUNK_ELEMENTS // max(1, samples))
+    for start in range(0, total, step):
+        yield start, min(total, start + step)
+
+def idw(xs, ys, values, qx, qy, power=IDW_POWER, neighbours=IDW_NEIGHBOURS, radius=SURFACE_RADIUS):
+    """Inverse-distance weighted values at (qx, qy) from the `neighbours` nearest samples within `radius`"""
+    out = np.full(len(qx), np.nan)
+    n = len(xs)
+    if n == 0:
+        return out
+    k = min(neighbours, n)
+    for start, end in _chunks(len(qx), n):
+        d2 = (qx[start:end, None] - xs) ** 2 + (qy[start:end, None] - ys) ** 2
+        if k < n:
+            nearest = np.argpartition(d2, k - 1, axis=1)[:, :k]
+            d2 = np.take_along_axis(d2, nearest, axis=1)
+            neighbour_values = values[nearest]
+        else:
+            neighbour_values = np.broadcast_to(values, d2.shape)
+        # A sample on the cell itself dominates instead of dividing by zero
+        weights = np.where(d2 <= radius * radius, np.maximum(d2, 1e-6) ** (-power / 2), 0.0)
+        total = weights.sum(axis=1)
+        covered = total > 0
+        out[start:end][covered] = (weights * neighbour_values).sum(axis=1)[covered] / total[covered]
+    return out
+
+def gaussian_process(xs, ys, values, qx, qy, length_scale=GP_LENGTH_SCALE, noise=GP_NOISE,
+                     radius=SURFACE_RADIUS, max_samples=GP_MAX_SAMPLES):
+    """Gaussian-process (simple kriging) mean at (qx, qy), empty beyond `radius` of every sample"""
+    out = np.full(len(qx), np.nan)
+    if len(xs) == 0:
+        return out
+    if len(xs) > max_samples:
+        keep = np.linspace(0, len(xs) - 1, max_samples).astype(int)
+        fit_x, fit_y, fit_values = xs[keep], ys[keep], values[keep]
+    else:
+        fit_x, fit_y, fit_values = xs, ys, values
+    mean = fit_values.mean()
+    variance = max(fit_values.var(), 1.0)
+    scale = -0.5 / (length_scale * length_scale)
+
+    d2 = (fit_x[:, None] - fit_x) ** 2 + (fit_y[:, None] - fit_y) ** 2
+    covariance = variance * np.exp(scale * d2) + noise * noise * np.eye(len(fit_x))
+    alpha = np.linalg.solve(covariance, fit_values - mean)
+
+    for start, end in _chunks(len(qx), len(fit_x)):
+        d2 = (qx[start:end, None] - fit_x) ** 2 + (qy[start:end, None] - fit_y) ** 2
+        predicted = mean + (variance * np.exp(scale * d2)) @ alpha
+        covered = d2.min(axis=1) <= radius * radius
+        out[start:end][covered] = predicted[covered]
+    return out
+
+def sample_grid(grid, lats, lons):
+    """Vectorized bilinear lookup in a (south, west, lat_step, lon_step, values) grid.
+
+    Works on arrays of any (broadcastable) shape; NaN outside the grid or
+    where the surrounding nodes have no data. Corners without data are
+    left out and the rest reweighted, as in Surface.predict().
+    """
+    south, west, lat_step, lon_step, values = grid
+    rows, cols = values.shape
+    lats, lons = np.broadcast_arrays(np.asarray(lats, dtype=float), np.asarray(lons, dtype=float))
+    r = (lats - south) / lat_step
+    c = (lons - west) / lon_step
+    inside = (r >= 0) & (r <= rows - 1) & (c >= 0) & (c <= cols - 1)
+    r0 = np.clip(np.floor(r), 0, rows - 2).astype(int)
+    c0 = np.clip(np.floor(c), 0, cols - 2).astype(int)
+    fr = np.clip(r - r0, 0, 1)
+    fc = np.clip(c - c0, 0, 1)
+    total = np.zeros(lats.shape)
+    weight_sum = np.zeros(lats.shape)
+    for dr, wr in ((0, 1 - fr), (1, fr)):
+        for dc, wc in ((0, 1 - fc), (1, fc)):
+            value = values[r0 + dr, c0 + dc]
+            weight = np.where(np.isnan(value), 0.0, wr * wc)
+            total += np.where(weight > 0, value, 0.0) * weight
+            weight_sum += weight
+    return np.where(inside & (weight_sum > 0), total / np.where(weight_sum > 0, weight_sum, 1), np.nan)
+
+class Surface:
+    """A gridded signal surface.
+
+    Grid nodes are at (south + row * lat_step, west + col * lon_step) for
+    rows x cols nodes; values[row, col] is the predicted dBm, NaN where
+    there is no data.
+    """
+
+    __slots__ = ("ssid", "method", "south", "west", "lat_step", "lon_step", "resolution", "values", "_rows")
+
+    def __init__(self, ssid, method, south, west, lat_step, lon_step, resolution, values):
+        self.ssid = ssid
+        self.method = method
+        self.south = south
+        self.west = west
+        self.lat_step = lat_step
+        self.lon_step = lon_step
+        self.resolution = resolution
+        self.values = values
+        # Plain lists: indexing them is several times faster than indexing numpy scalars
+        self._rows = [[None if v != v else v for v in row] for row in values.tolist()]
+
+    @property
+    def rows(self):
+        return self.values.shape[0]
+
+    @property
+    def cols(self):
+        return self.values.shape[1]
+
+    @property
+    def grid(self):
+        """(south, west, lat_step, lon_step, values): everything sample_grid() needs, cheap to pickle"""
+        return self.south, self.west, self.lat_step, self.lon_step, self.values
+
+    def sample(self, lats, lons):
+        return sample_grid(self.grid, lats, lons)
+
+    @property
+    def bbox(self):
+        """(west, south, east, north) of the grid nodes"""
+        return (self.west, self.south,
+                self.west + (self.cols - 1) * self.lon_step, self.south + (self.rows - 1) * self.lat_step)
+
+    def predict(self, lat, lon):
+        """Bilinear signal at a point, or None outside the grid or where it has no data"""
+        r = (lat - self.south) / self.lat_step
+        c = (lon - self.west) / self.lon_step
+        rows = self._rows
+        if not (0 <= r <= len(rows) - 1 and 0 <= c <= len(rows[0]) - 1):
+            return None
+        r0 = min(int(r), len(rows) - 2) if len(rows) > 1 else 0
+        c0 = min(int(c), len(rows[0]) - 2) if len(rows[0]) > 1 else 0
+        fr = r - r0
+        fc = c - c0
+        total = weight_sum = 0.0
+        for dr, wr in ((0, 1 - fr), (1, fr)):
+            if not wr:
+                continue
+            row = rows[r0 + dr]
+            for dc, wc in ((0, 1 - fc), (1, fc)):
+                value = row[c0 + dc] if wc else None
+                if value is not None:
+                    total += wr * wc * value
+                    weight_sum += wr * wc
+        # Corners without data are left out and the rest reweighted
+        return total / weight_sum if weight_sum else None
+
+    def to_dict(self):
+        """Compact JSON form: metadata plus the grid as base64 int8 dBm, row-major from the south-west"""
+        grid = np.where(np.isnan(self.values), NODATA, np.clip(np.round(self.values), -127, 127)).astype(np.int8)
+        return {
+            "ssid": self.ssid,
+            "method": self.method,
+            "bbox": list(self.bbox),
+            "rows": self.rows,
+            "cols": self.cols,
+            "lat_step": self.lat_step,
+            "lon_step": self.lon_step,
+            "resolution": self.resolution,
+            "encoding": "int8",
+            "nodata": NODATA,
+            "values": base64.b64encode(grid.tobytes()).decode("ascii")
+        }
+
+class SurfaceEngine:
+    """Builds and caches the surfaces of one version of a dataset"""
+
+    def __init__(self, locations, version=None, cache_size=SURFACE_CACHE_SIZE):
+        self.locations = locations
+        self.version = version
+        self.cache_size = cache_size
+        self.hits = 0
+        self.builds = 0
+        self._points = None
+        self._columns = {}
+        self._surfaces = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _sample_points(self):
+        if self._points is None:
+            with self._lock:
+                if self._points is None:
+                    self._points = sample_points(self.locations)
+        return self._points
+
+    def samples(self, ssid=None):
+        """(lats, lons, signals) for an SSID, or the strongest network per point for None"""
+        points = self._sample_points().get(ssid)
+        if points is None:
+            return None
+        columns = self._columns.get(ssid)
+        if columns is None:
+            columns = point_columns(points)
+            with self._lock:
+                self._columns[ssid] = columns
+        return columns
+
+    def ssids(self):
+        return sorted(ssid for ssid in self._sample_points() if ssid is not None)
+
+    def updated(self, locations, changes, version=None):
+        """The engine for the next version: `locations` after applying {key: location or None} `changes`.
+
+        The samples of SSIDs the changes don't touch are shared with this
+        engine rather than extracted again; surfaces are built afresh.
+        """
+        engine = SurfaceEngine(locations, version, self.cache_size)
+        if self._points is None:
+            return engine
+        moved = collections.defaultdict(dict)
+        for key, location in changes.items():
+            before = location_samples(self.locations.get(key))
+            after = location_samples(location)
+            for ssid in before.keys() - after.keys():
+                moved[ssid][key] = None
+            for ssid, signal in after.items():
+                moved[ssid][key] = (location["latitude"], location["longitude"], signal)
+        points = dict(self._points)
+        for ssid, ssid_changes in moved.items():
+            points[ssid] = points.get(ssid, ShardedMap()).updated(ssid_changes)
+            if not points[ssid] and ssid is not None:
+                del points[ssid]
+        engine._points = points
+        engine._columns = {ssid: columns for ssid, columns in self._columns.items() if ssid not in moved}
+        return engine
+
+    def default_bbox(self, ssid=None):
+        """(south, west, north, east) around an SSID's scan points plus SURFACE_MARGIN"""
+        lats, lons, _ = self.samples(ssid)
+        margin_lat = SURFACE_MARGIN / METERS_PER_DEGREE
+        margin_lon = margin_lat / max(math.cos(math.radians(float(lats.mean()))), 0.01)
+        return (float(lats.min()) - margin_lat, float(lons.min()) - margin_lon,
+                float(lats.max()) + margin_lat, float(lons.max()) + margin_lon)
+
+    def surface(self, ssid=None, bbox=None, resolution=SURFACE_RESOLUTION, method="idw"):
+        """The surface for an SSID (None = strongest network) over a (south, west, north, east) box.
+
+        Returns None if the SSID has no scan points. Results are cached, so
+        repeated requests for the same view cost a dictionary lookup.
+        """
+        samples = self.samples(ssid)
+        if samples is None or not len(samples[0]):
+            return None
+        key = (ssid, bbox, resolution, method)
+        with self._lock:
+            surface = self._surfaces.get(key)
+            if surface is not None:
+                self._surfaces.move_to_end(key)
+                self.hits += 1
+                return surface
+
+        surface = self._build(samples, ssid, bbox or self.default_bbox(ssid), resolution, method)
+        with self._lock:
+            self.builds += 1
+            self._surfaces[key] = surface
+            while len(self._surfaces) > self.cache_size:
+                self._surfaces.popitem(last=False)
+        return surface
+
+    def _build(self, samples, ssid, bbox, resolution, method):
+        lats, lons, signals = samples
+        south, west, north, east = bbox
+        lon_scale = METERS_PER_DEGREE * max(math.cos(math.radians((south + north) / 2)), 0.01)
+        height = (north - south) * METERS_PER_DEGREE
+        width = (east - west) * lon_scale
+        # Coarsen until the grid fits the cell budget
+        resolution = max(resolution, math.sqrt(height * width / MAX_GRID_CELLS))
+        rows = max(2, int(round(height / resolution)) + 1)
+        cols = max(2, int(round(width / resolution)) + 1)
+        lat_step = (north - south) / (rows - 1)
+        lon_step = (east - west) / (cols - 1)
+
+        # Interpolate in local meters around the box's south-west corner
+        xs = (lons - west) * lon_scale
+        ys = (lats - south) * METERS_PER_DEGREE
+        grid_y, grid_x = np.meshgrid(np.arange(rows) * lat_step * METERS_PER_DEGREE,
+                                     np.arange(cols) * lon_step * lon_scale, indexing="ij")
+        qx, qy = grid_x.ravel(), grid_y.ravel()
+
+        # Scan points too far outside the box cannot influence it
+        reach = SURFACE_RADIUS
+        nearby = (xs >= -reach) & (xs <= width + reach) & (ys >= -reach) & (ys <= height + reach)
+        xs, ys, values = xs[nearby], ys[nearby], signals[nearby]
+        if method == "gp":
+            grid = gaussian_process(xs, ys, values, qx, qy)
+        else:
+            grid = idw(xs, ys, values, qx, qy)
+        return Surface(ssid, method, south, west, lat_step, lon_step, resolution, grid.reshape(rows, cols))
+
+    def predict(self, lat, lon, ssid=None, method="idw"):
+        """Predicted signal at a point from the SSID's full-extent surface (built once)"""
+        surface = self.surface(ssid, method=method)
+        return surface.predict(lat, lon) if surface is not None else None
+
+    def stats(self):
+        return {"version": self.version, "surfaces": len(self._surfaces), "hits": self.hits, "builds": self.builds}
+
+def surface_response(engine, args):
+    """(body, status) for a /surface request against `engine`"""
+    try:
+        query = parse_surface_args(args)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    surface = engine.surface(**query)
+    if surface is None:
+        return {"error": "Network not found"}, 404
+    body = surface.to_dict()
+    body["version"] = engine.version
+    return body, 200
+
+def point_response(engine, args):
+    """(body, status) for a /surface/point request: the predicted signal at lat/lon"""
+    try:
+        lat = float(args["lat"])
+        lon = float(args["lon"])
+    except (KeyError, ValueError):
+        return {"error": "lat and lon must be given in degrees"}, 400
+    if not (math.isfinite(lat) and math.isfinite(lon)):
+        return {"error": "lat and lon must be given in degrees"}, 400
+    try:
+        query = parse_surface_args(args)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    ssid = query["ssid"]
+    if engine.samples(ssid) is None:
+        return {"error": "Network not found"}, 404
+    return {
+        "ssid": ssid,
+        "latitude": lat,
+        "longitude": lon,
+        "signal": engine.predict(lat, lon, ssid, query["method"]),
+        "method": query["method"],
+        "version": engine.version
+    }, 200
@@ -0,0 +1,126 @@
+import threading
+from sharded_map import ShardedMap
+from spatial_index import build_location_index
+from signal_surface import SurfaceEngine
+from location_clusters import LocationClusters
+from ssid_index import build_observation_index
+
+# Shards of a snapshot's locations map; a batch copies only the shards it touches
+LOCATION_SHARDS = 1024
+
+class Snapshot:
+    """One published version of the collected data.
+
+    Snapshots are immutable by contract: neither the writer nor readers may
+    modify `data`, its locations map or the location dicts in it once
+    published. Derived views (the spatial index, signal surfaces, location
+    clusters, the SSID observation index) are built lazily by whichever
+    reader needs them first. Once built, each is carried forward to later
+    snapshots as a copy-on-write successor with the batch applied, so the
+    views of a snapshot hold exactly its own locations for as long as
+    anyone reads it.
+    """
+
+    __slots__ = ("version", "data", "networks", "_index", "_surfaces", "_clusters", "_observations", "_lock")
+
+    def __init__(self, version, data, networks=None):
+        self.version = version
+        self.data = data
+        self.networks = networks if networks is not None else []
+        self._index = None
+        self._surfaces = None
+        self._clusters = None
+        self._observations = None
+        self._lock = threading.Lock()
+
+    @property
+    def locations(self):
+        return self.data["locations"]
+
+    def document(self):
+        """The data as a plain JSON-serializable dict"""
+        return dict(self.data, locations=self.locations.to_dict())
+
+    def location_index(self):
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    self._index = build_location_index(self.locations)
+        return self._index
+
+    def surface_engine(self):
+        if self._surfaces is None:
+            with self._lock:
+                if self._surfaces is None:
+                    self._surfaces = SurfaceEngine(self.locations, version=self.version)
+        return self._surfaces
+
+    def location_clusters(self):
+        if self._clusters is None:
+            with self._lock:
+                if self._clusters is None:
+                    self._clusters = LocationClusters(self.locations, version=self.version)
+        return self._clusters
+
+    def observation_index(self):
+        if self._observations is None:
+            with self._lock:
+                if self._observations is None:
+                    self._observations = build_observation_index(self.locations)
+        return self._observations
+
+def _sharded(data):
+    if isinstance(data.get("locations"), ShardedMap):
+        return data
+    return dict(data, locations=ShardedMap(data.get("locations", {}), LOCATION_SHARDS))
+
+class SnapshotStore:
+    """Read-copy-update store shared by the collector and the web threads.
+
+    Readers call get() and work on the snapshot it returns; it is a single
+    reference read, so readers never lock and never see a half-applied
+    batch. The writer calls update() with the locations it changed: the
+    next locations map shares every shard the batch doesn't touch, the
+    derived views already built are copied and moved forward by the
+    changes alone, and the new snapshot is swapped in with the next
+    version number.
+    Changed locations must be new dicts, not the published ones modified
+    in place.
+    """
+
+    def __init__(self, data, networks=None):
+        self._snapshot = Snapshot(1, _sharded(data), networks)
+        self._write_lock = threading.Lock()
+
+    def get(self):
+        return self._snapshot
+
+    @property
+    def version(self):
+        return self._snapshot.version
+
+    def publish(self, data, networks=None):
+        """Replace the whole document, e.g. after the store is cleared"""
+        with self._write_lock:
+            self._snapshot = Snapshot(self._snapshot.version + 1, _sharded(data), networks)
+            return self._snapshot
+
+    def update(self, changes, networks=None):
+        """Publish a snapshot with `changes` ({key: location, or None to delete}) applied"""
+        with self._write_lock:
+            current = self._snapshot
+            data = dict(current.data)
+            data["locations"] = current.locations.updated(changes)
+            snapshot = Snapshot(current.version + 1, data,
+                                current.networks if networks is None else networks)
+            with current._lock:
+                if current._index is not None:
+                    snapshot._index = current._index.updated(changes)
+                if current._clusters is not None:
+                    snapshot._clusters = current._clusters.updated(changes, snapshot.version)
+                if current._observations is not None:
+                    snapshot._observations = current._observations.updated(changes)
+                if current._surfaces is not None:
+                    snapshot._surfaces = current._surfaces.updated(data["locations"], changes, snapshot.version)
+            self._snapshot = snapshot
+            return snapshot
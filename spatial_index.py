@@ -0,0 +1,250 @@
+import itertools
+import math
+import threading
+import numpy as np
+from geo import EARTH_RADIUS, METERS_PER_DEGREE, haversine, haversine_one_to_many, radius_degrees
+
+# Below this many candidates the scalar loop beats building arrays
+VECTORIZE_MIN_POINTS = 32
+
+class SpatialIndex:
+    """Grid index over (latitude, longitude) points for radius and k-nearest queries.
+
+    Points are bucketed into square cells of `cell_size` meters of latitude.
+    A query only visits the cells overlapping its search radius, so the cost
+    depends on local density rather than on the total number of points.
+
+    Coordinates live in contiguous float64 columns, one slot per point, that
+    insert and remove update in place; cells hold slot numbers, so a query
+    gathers its candidates straight from the columns.
+
+    copy() and updated() give the new index its own columns and maps; the
+    slot set of each cell is shared until either index changes it. An
+    index that readers still hold is never modified by its successor's
+    changes.
+    """
+
+    def __init__(self, cell_size=50):
+        self.cell_size = cell_size
+        self.cell_deg = cell_size / METERS_PER_DEGREE
+        self._cells = {}
+        self._slots = {}
+        self._keys = []
+        self._payloads = []
+        self._slot_cells = []
+        self._free = []
+        self._lats = np.empty(0, dtype=np.float64)
+        self._lons = np.empty(0, dtype=np.float64)
+        # Cells whose slot sets are shared with a copy of this index
+        self._shared_cells = set()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, key):
+        return key in self._slots
+
+    def _cell(self, lat, lon):
+        return (int(math.floor(lat / self.cell_deg)), int(math.floor(lon / self.cell_deg)))
+
+    def _bucket(self, cell):
+        """The slot set of a cell for modification, copied first if a copy of the index shares it"""
+        bucket = self._cells.get(cell)
+        if bucket is None:
+            bucket = self._cells[cell] = set()
+        elif cell in self._shared_cells:
+            self._shared_cells.discard(cell)
+            bucket = self._cells[cell] = set(bucket)
+        return bucket
+
+    def _allocate(self):
+        if self._free:
+            return self._free.pop()
+        slot = len(self._keys)
+        if slot == len(self._lats):
+            # Grow the columns geometrically so inserts stay amortized O(1)
+            capacity = max(64, 2 * slot)
+            self._lats = np.resize(self._lats, capacity)
+            self._lons = np.resize(self._lons, capacity)
+        self._keys.append(None)
+        self._payloads.append(None)
+        self._slot_cells.append(None)
+        return slot
+
+    def insert(self, key, lat, lon, payload=None):
+        """Add a point, replacing any previous point stored under the same key."""
+        with self._lock:
+            if key in self._slots:
+                self.remove(key)
+            cell = self._cell(lat, lon)
+            slot = self._allocate()
+            self._lats[slot] = lat
+            self._lons[slot] = lon
+            self._keys[slot] = key
+            self._payloads[slot] = payload
+            self._slot_cells[slot] = cell
+            self._slots[key] = slot
+            self._bucket(cell).add(slot)
+
+    def remove(self, key):
+        """Remove a point; unknown keys are ignored."""
+        with self._lock:
+            slot = self._slots.pop(key, None)
+            if slot is None:
+                return
+            cell = self._slot_cells[slot]
+            bucket = self._bucket(cell)
+            bucket.discard(slot)
+            if not bucket:
+                del self._cells[cell]
+            self._keys[slot] = self._payloads[slot] = self._slot_cells[slot] = None
+            self._free.append(slot)
+
+    def apply(self, changes):
+        """Apply {key: location_data, or None to remove} in one step, so queries see all of it or none.
+
+        Locations without coordinates are removed.
+        """
+        with self._lock:
+            for key, location_data in changes.items():
+                lat = location_data.get("latitude") if location_data is not None else None
+                lon = location_data.get("longitude") if location_data is not None else None
+                if lat is None or lon is None:
+                    self.remove(key)
+                else:
+                    self.insert(key, lat, lon, location_data)
+
+    def copy(self):
+        """An index with the same points that can be changed independently of this one"""
+        with self._lock:
+            index = SpatialIndex(self.cell_size)
+            index._cells = dict(self._cells)
+            index._slots = dict(self._slots)
+            index._keys = list(self._keys)
+            index._payloads = list(self._payloads)
+            index._slot_cells = list(self._slot_cells)
+            index._free = list(self._free)
+            index._lats = self._lats.copy()
+            index._lons = self._lons.copy()
+            self._shared_cells = set(self._cells)
+            index._shared_cells = set(self._cells)
+            return index
+
+    def updated(self, changes):
+        """A copy of the index with `changes` applied as by apply(); this index is left as it was"""
+        index = self.copy()
+        index.apply(changes)
+        return index
+
+    def clear(self):
+        with self._lock:
+            self._cells.clear()
+            self._shared_cells.clear()
+            self._slots.clear()
+            self._keys = []
+            self._payloads = []
+            self._slot_cells = []
+            self._free = []
+            self._lats = np.empty(0, dtype=np.float64)
+            self._lons = np.empty(0, dtype=np.float64)
+
+    def get(self, key):
+        """Return (lat, lon, payload) for a key, or None."""
+        with self._lock:
+            slot = self._slots.get(key)
+            if slot is None:
+                return None
+            return float(self._lats[slot]), float(self._lons[slot]), self._payloads[slot]
+
+    def _candidates(self, i_min, i_max, j_min, j_max):
+        """Array of the slots in the cells of a block; callers hold the lock"""
+        if (i_max - i_min + 1) * (j_max - j_min + 1) > len(self._cells):
+            # Sparse grid: walking the occupied cells is cheaper than the block
+            buckets = [bucket for (i, j), bucket in self._cells.items()
+                       if i_min <= i <= i_max and j_min <= j <= j_max]
+        else:
+            cells = self._cells
+            buckets = [cells[(i, j)] for i in range(i_min, i_max + 1)
+                       for j in range(j_min, j_max + 1) if (i, j) in cells]
+        count = sum(len(bucket) for bucket in buckets)
+        return np.fromiter(itertools.chain.from_iterable(buckets), dtype=np.intp, count=count)
+
+    def _spans(self, lat, radius):
+        """Cells to search on each side of the query cell, in latitude and longitude.
+
+        The spans cover geo.radius_degrees of the radius; one extra cell
+        covers points that sit just across a cell boundary.
+        """
+        lat_deg, lon_deg = radius_degrees(lat, radius)
+        span_lat = int(math.ceil(lat_deg / self.cell_deg)) + 1
+        span_lon = int(math.ceil(lon_deg / self.cell_deg)) + 1
+        return span_lat, span_lon
+
+    def within_radius(self, lat, lon, radius):
+        """Return [(distance, key, payload)] for all points within `radius` meters, nearest first."""
+        span_lat, span_lon = self._spans(lat, radius)
+        ci, cj = self._cell(lat, lon)
+        results = []
+        with self._lock:
+            slots = self._candidates(ci - span_lat, ci + span_lat, cj - span_lon, cj + span_lon)
+            if len(slots) >= VECTORIZE_MIN_POINTS:
+                distances = haversine_one_to_many(lat, lon, self._lats[slots], self._lons[slots])
+                hits = (distances <= radius).nonzero()[0]
+                hits = hits[np.argsort(distances[hits], kind="stable")]
+                keys, payloads = self._keys, self._payloads
+                return [(dist, keys[slot], payloads[slot])
+                        for dist, slot in zip(distances[hits].tolist(), slots[hits].tolist())]
+            for slot in slots.tolist():
+                dist = haversine(lat, lon, float(self._lats[slot]), float(self._lons[slot]))
+                if dist <= radius:
+                    results.append((dist, self._keys[slot], self._payloads[slot]))
+        results.sort(key=lambda r: r[0])
+        return results
+
+    def within_bbox(self, south, west, north, east):
+        """Return [(key, lat, lon, payload)] for all points inside a box, in no particular order."""
+        i_min, j_min = self._cell(south, west)
+        i_max, j_max = self._cell(north, east)
+        with self._lock:
+            slots = self._candidates(i_min, i_max, j_min, j_max)
+            lats = self._lats[slots]
+            lons = self._lons[slots]
+            inside = (lats >= south) & (lats <= north) & (lons >= west) & (lons <= east)
+            keys, payloads = self._keys, self._payloads
+            return [(keys[slot], lat, lon, payloads[slot])
+                    for slot, lat, lon in zip(slots[inside].tolist(), lats[inside].tolist(), lons[inside].tolist())]
+
+    def nearest(self, lat, lon, max_distance):
+        """Return (distance, key, payload) of the nearest point within max_distance, or None."""
+        # Search a small radius first; dense data rarely needs the full circle
+        radius = min(self.cell_size, max_distance)
+        while True:
+            results = self.within_radius(lat, lon, radius)
+            if results:
+                return results[0]
+            if radius >= max_distance:
+                return None
+            radius = min(radius * 2, max_distance)
+
+    def k_nearest(self, lat, lon, k, max_distance=None):
+        """Return up to k (distance, key, payload) tuples, nearest first."""
+        if k <= 0:
+            return []
+        if max_distance is not None:
+            return self.within_radius(lat, lon, max_distance)[:k]
+
+        # Grow the search radius until it holds k points; every point inside the
+        # radius has been seen, so the first k of them are the exact answer
+        radius = self.cell_size
+        while True:
+            found = self.within_radius(lat, lon, radius)
+            if len(found) >= k or len(found) == len(self._slots) or radius > math.pi * EARTH_RADIUS:
+                return found[:k]
+            radius *= 2
+
+def build_location_index(locations, cell_size=50):
+    """Build a SpatialIndex from a {key: location_data} mapping."""
+    index = SpatialIndex(cell_size)
+    index.apply(locations)
+    return index
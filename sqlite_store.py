@@ -0,0 +1,376 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from geo import haversine, radius_degrees
+from persistence import fsync_policy
+
+# File extensions that select the SQLite backend instead of JSON
+SQLITE_EXTENSIONS = ('.db', '.sqlite', '.sqlite3')
+
+# Degrees added around nearest()'s search box; the R*Tree keeps 32-bit floats (about 1e-5 degrees)
+BOX_MARGIN = 1e-4
+
+# PRAGMA synchronous for each persistence fsync policy; every transaction is a snapshot
+SYNCHRONOUS_MODES = {"always": "EXTRA", "snapshots": "FULL", "never": "OFF"}
+
+# Observation fields stored as columns, in the order they appear in the JSON
+OBSERVATION_FIELDS = ("ssid", "signal", "signal_percent", "auth", "channel",
+                      "noise_floor", "snr", "samples", "signal_variance", "bssid")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS metadata (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS sections (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS locations (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,
+    name TEXT,
+    latitude REAL NOT NULL,
+    longitude REAL NOT NULL,
+    timestamp TEXT,
+    note TEXT,
+    extra TEXT
+);
+CREATE TABLE IF NOT EXISTS observations (
+    id INTEGER PRIMARY KEY,
+    location_id INTEGER NOT NULL REFERENCES locations(id) ON DELETE CASCADE,
+    ssid TEXT,
+    signal INTEGER,
+    signal_percent INTEGER,
+    auth TEXT,
+    channel INTEGER,
+    noise_floor INTEGER,
+    snr INTEGER,
+    samples INTEGER,
+    signal_variance INTEGER,
+    extra TEXT,
+    bssid TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_locations_timestamp ON locations(timestamp);
+CREATE INDEX IF NOT EXISTS idx_observations_ssid ON observations(ssid);
+CREATE INDEX IF NOT EXISTS idx_observations_location ON observations(location_id);
+"""
+
+# Created after migrate_schema() has added the columns they cover
+INDEX_SCHEMA = """
+CREATE INDEX IF NOT EXISTS idx_observations_bssid ON observations(bssid);
+"""
+
+RTREE_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS location_rtree USING rtree(
+    id, min_lat, max_lat, min_lon, max_lon
+);
+"""
+
+# Used when SQLite was built without the R*Tree module
+FALLBACK_SCHEMA = """
+CREATE INDEX IF NOT EXISTS idx_locations_lat_lon ON locations(latitude, longitude);
+"""
+
+def is_sqlite_path(path):
+    """Return True if the path names a SQLite database rather than a JSON file"""
+    return str(path).lower().endswith(SQLITE_EXTENSIONS)
+
+class SQLiteStore:
+    """SQLite storage for WiFi survey data.
+
+    Locations and their network observations are kept in normalized tables,
+    with an R*Tree over location coordinates for bounding-box and nearest
+    queries. load() and save() exchange the same document layout as the JSON
+    files, so the store can stand in for them behind the existing entry points.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.snapshot_path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        self._conn.execute(f"PRAGMA synchronous = {SYNCHRONOUS_MODES[fsync_policy()]}")
+        self._conn.executescript(SCHEMA)
+        self._migrate_schema()
+        self._conn.executescript(INDEX_SCHEMA)
+        try:
+            self._conn.executescript(RTREE_SCHEMA)
+            self.has_rtree = True
+        except sqlite3.OperationalError:
+            self._conn.executescript(FALLBACK_SCHEMA)
+            self.has_rtree = False
+        self._conn.commit()
+
+    def _migrate_schema(self):
+        """Add columns that databases created by earlier versions lack"""
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(observations)")}
+        if "bssid" in columns:
+            return
+        self._conn.execute("ALTER TABLE observations ADD COLUMN bssid TEXT")
+        # Earlier versions kept the BSSID with the other unknown fields
+        rows = self._conn.execute("SELECT id, extra FROM observations WHERE extra LIKE '%\"bssid\"%'").fetchall()
+        updates = []
+        for row in rows:
+            extra = json.loads(row["extra"])
+            bssid = extra.pop("bssid", None)
+            updates.append((bssid, json.dumps(extra) if extra else None, row["id"]))
+        self._conn.executemany("UPDATE observations SET bssid = ?, extra = ? WHERE id = ?", updates)
+
+    def close(self):
+        self._conn.close()
+
+    # Writing
+
+    def _insert_location(self, key, location):
+        known = ("name", "latitude", "longitude", "timestamp", "note", "networks")
+        extra = {k: v for k, v in location.items() if k not in known}
+        lat = location.get("latitude")
+        lon = location.get("longitude")
+        if lat is None or lon is None:
+            return
+
+        self._delete_location(key)
+        cursor = self._conn.execute(
+            "INSERT INTO locations (key, name, latitude, longitude, timestamp, note, extra) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, location.get("name"), lat, lon, location.get("timestamp"),
+             location.get("note"), json.dumps(extra) if extra else None))
+        location_id = cursor.lastrowid
+        if self.has_rtree:
+            self._conn.execute(
+                "INSERT INTO location_rtree VALUES (?, ?, ?, ?, ?)",
+                (location_id, lat, lat, lon, lon))
+
+        rows = []
+        for network in location.get("networks", []):
+            extra = {k: v for k, v in network.items() if k not in OBSERVATION_FIELDS}
+            rows.append((location_id,) + tuple(network.get(f) for f in OBSERVATION_FIELDS) +
+                        (json.dumps(extra) if extra else None,))
+        self._conn.executemany(
+            "INSERT INTO observations (location_id, %s, extra) VALUES (?, %s, ?)" %
+            (", ".join(OBSERVATION_FIELDS), ", ".join("?" * len(OBSERVATION_FIELDS))),
+            rows)
+
+    def _delete_location(self, key):
+        row = self._conn.execute("SELECT id FROM locations WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return
+        self._conn.execute("DELETE FROM observations WHERE location_id = ?", (row["id"],))
+        if self.has_rtree:
+            self._conn.execute("DELETE FROM location_rtree WHERE id = ?", (row["id"],))
+        self._conn.execute("DELETE FROM locations WHERE id = ?", (row["id"],))
+
+    def _set_metadata(self, metadata):
+        self._conn.execute("DELETE FROM metadata")
+        self._conn.executemany(
+            "INSERT INTO metadata (key, value) VALUES (?, ?)",
+            [(k, json.dumps(v)) for k, v in metadata.items()])
+
+    def _set_sections(self, data):
+        # Top-level sections other than locations/metadata (e.g. signal_history)
+        self._conn.execute("DELETE FROM sections")
+        self._conn.executemany(
+            "INSERT INTO sections (key, value) VALUES (?, ?)",
+            [(k, json.dumps(v)) for k, v in data.items() if k not in ("locations", "metadata")])
+
+    def upsert(self, key, location):
+        """Insert or replace a single location. Always returns False (no compaction needed)"""
+        with self._lock, self._conn:
+            self._insert_location(key, location)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO metadata (key, value) VALUES ('last_updated', ?)",
+                (json.dumps(datetime.now().isoformat()),))
+        return False
+
+    def upsert_many(self, items):
+        """Insert or replace several (key, location) pairs in one transaction"""
+        with self._lock, self._conn:
+            for key, location in items:
+                self._insert_location(key, location)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO metadata (key, value) VALUES ('last_updated', ?)",
+                (json.dumps(datetime.now().isoformat()),))
+        return False
+
+    def delete(self, key):
+        with self._lock, self._conn:
+            self._delete_location(key)
+        return False
+
+    def update_metadata(self, values):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO metadata (key, value) VALUES (?, ?)",
+                [(k, json.dumps(v)) for k, v in values.items()])
+        return False
+
+    def save(self, data):
+        """Replace the whole store with a JSON-layout document"""
+        data.setdefault("metadata", {})["last_updated"] = datetime.now().isoformat()
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM observations")
+            if self.has_rtree:
+                self._conn.execute("DELETE FROM location_rtree")
+            self._conn.execute("DELETE FROM locations")
+            for key, location in data.get("locations", {}).items():
+                self._insert_location(key, location)
+            self._set_metadata(data["metadata"])
+            self._set_sections(data)
+
+    # The JSON backend compacts its log on save; here both are the same operation
+    compact = save
+
+    # Reading
+
+    def _location_from_row(self, row):
+        location = {
+            "name": row["name"],
+            "latitude": row["latitude"],
+            "longitude": row["longitude"],
+            "timestamp": row["timestamp"],
+            "networks": [],
+            "note": row["note"]
+        }
+        location = {k: v for k, v in location.items() if v is not None}
+        if row["extra"]:
+            location.update(json.loads(row["extra"]))
+        return location
+
+    def _network_from_row(self, row):
+        network = {f: row[f] for f in OBSERVATION_FIELDS if row[f] is not None}
+        if row["extra"]:
+            network.update(json.loads(row["extra"]))
+        return network
+
+    def _load_networks(self, locations_by_id):
+        if not locations_by_id:
+            return
+        ids = list(locations_by_id)
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            rows = self._conn.execute(
+                "SELECT * FROM observations WHERE location_id IN (%s) ORDER BY id" %
+                ", ".join("?" * len(chunk)), chunk)
+            for row in rows:
+                locations_by_id[row["location_id"]]["networks"].append(self._network_from_row(row))
+
+    def load(self):
+        """Return the whole store as a document in the JSON file layout.
+
+        Location entries without coordinates are not stored, so they are
+        missing from the result.
+        """
+        with self._lock:
+            metadata = {row["key"]: json.loads(row["value"])
+                        for row in self._conn.execute("SELECT key, value FROM metadata")}
+            locations = {}
+            by_id = {}
+            for row in self._conn.execute("SELECT * FROM locations ORDER BY id"):
+                location = self._location_from_row(row)
+                locations[row["key"]] = location
+                by_id[row["id"]] = location
+            self._load_networks(by_id)
+            data = {"locations": locations, "metadata": metadata}
+            for row in self._conn.execute("SELECT key, value FROM sections"):
+                data[row["key"]] = json.loads(row["value"])
+        return data
+
+    def get_location(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM locations WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            location = self._location_from_row(row)
+            self._load_networks({row["id"]: location})
+        return location
+
+    def within_bbox(self, min_lat, min_lon, max_lat, max_lon):
+        """Return {key: location} for locations inside a bounding box"""
+        if self.has_rtree:
+            sql = ("SELECT l.* FROM location_rtree r JOIN locations l ON l.id = r.id "
+                   "WHERE r.max_lat >= ? AND r.min_lat <= ? AND r.max_lon >= ? AND r.min_lon <= ?")
+        else:
+            sql = ("SELECT * FROM locations "
+                   "WHERE latitude >= ? AND latitude <= ? AND longitude >= ? AND longitude <= ?")
+        with self._lock:
+            rows = self._conn.execute(sql, (min_lat, max_lat, min_lon, max_lon)).fetchall()
+            locations = {}
+            by_id = {}
+            for row in rows:
+                location = self._location_from_row(row)
+                locations[row["key"]] = location
+                by_id[row["id"]] = location
+            self._load_networks(by_id)
+        return locations
+
+    def nearest(self, lat, lon, max_distance):
+        """Return (distance, key, location) of the nearest location within max_distance meters, or None"""
+        d_lat, d_lon = radius_degrees(lat, max_distance)
+        # A little slack so rounding never drops a point on the edge of the radius
+        d_lat += BOX_MARGIN
+        d_lon += BOX_MARGIN
+        candidates = self.within_bbox(lat - d_lat, lon - d_lon, lat + d_lat, lon + d_lon)
+        best = None
+        for key, location in candidates.items():
+            dist = haversine(lat, lon, location["latitude"], location["longitude"])
+            if dist <= max_distance and (best is None or dist < best[0]):
+                best = (dist, key, location)
+        return best
+
+    def ssid_observations(self, ssid, since=None, until=None, offset=0, limit=None):
+        """Return (total, [(location, network)]) for observations of an SSID or BSSID.
+
+        Matching, filtering and paging follow SSIDObservationIndex.lookup.
+        """
+        where = "(o.ssid = ? OR o.bssid = ?)"
+        params = [ssid, ssid]
+        if since:
+            where += " AND l.timestamp >= ?"
+            params.append(since)
+        if until:
+            where += " AND l.timestamp < ?"
+            params.append(until + "\uffff")
+        with self._lock:
+            total = self._conn.execute(
+                "SELECT COUNT(*) FROM observations o JOIN locations l ON l.id = o.location_id "
+                "WHERE " + where, params).fetchone()[0]
+            rows = self._conn.execute(
+                "SELECT o.*, l.name AS l_name, l.latitude, l.longitude, l.timestamp "
+                "FROM observations o JOIN locations l ON l.id = o.location_id "
+                "WHERE " + where + " ORDER BY l.timestamp, o.id LIMIT ? OFFSET ?",
+                params + [-1 if limit is None else limit, offset]).fetchall()
+        return total, [({"name": row["l_name"], "latitude": row["latitude"],
+                  "longitude": row["longitude"], "timestamp": row["timestamp"]},
+                 self._network_from_row(row)) for row in rows]
+
+def migrate_json(json_path, db_path):
+    """Copy a wifi_data.json / dynamic_data.json document into a SQLite database"""
+    with open(json_path, 'r') as file:
+        data = json.load(file)
+    store = SQLiteStore(db_path)
+    metadata = dict(data.get("metadata", {}))
+    store.save(data)
+    # save() stamps last_updated; keep the source file's value instead
+    if "last_updated" in metadata:
+        with store._conn:
+            store._set_metadata(metadata)
+    count = len(data.get("locations", {}))
+    store.close()
+    return count
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Migrate a WiFi data JSON file into a SQLite database')
+    parser.add_argument('json_file', help='Source JSON file (e.g. wifi_data.json)')
+    parser.add_argument('db_file', nargs='?', help='Target database (default: same name with .db)')
+    args = parser.parse_args()
+
+    db_file = args.db_file or os.path.splitext(args.json_file)[0] + '.db'
+    count = migrate_json(args.json_file, db_file)
+    print(f"Migrated {count} locations from {args.json_file} to {db_file}")
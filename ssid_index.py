@@ -0,0 +1,384 @@
+import bisect
+import threading
+
+class SSIDAggregate:
+    """Running min/max signal and location count for one SSID.
+
+    Signals are kept as a value -> count histogram so that removing an
+    observation can update min/max without rescanning the stored locations.
+    """
+
+    __slots__ = ("ssid", "locations", "min_signal", "max_signal", "signal_counts")
+
+    def __init__(self, ssid):
+        self.ssid = ssid
+        self.locations = 0
+        self.min_signal = None
+        self.max_signal = None
+        self.signal_counts = {}
+
+    def add(self, signal):
+        self.locations += 1
+        self.signal_counts[signal] = self.signal_counts.get(signal, 0) + 1
+        if self.min_signal is None or signal < self.min_signal:
+            self.min_signal = signal
+        if self.max_signal is None or signal > self.max_signal:
+            self.max_signal = signal
+
+    def remove(self, signal):
+        count = self.signal_counts.get(signal)
+        if not count:
+            return
+        self.locations -= 1
+        if count == 1:
+            del self.signal_counts[signal]
+            if signal == self.min_signal or signal == self.max_signal:
+                self.min_signal = min(self.signal_counts) if self.signal_counts else None
+                self.max_signal = max(self.signal_counts) if self.signal_counts else None
+        else:
+            self.signal_counts[signal] = count - 1
+
+    def to_dict(self):
+        return {
+            "ssid": self.ssid,
+            "min_signal": self.min_signal,
+            "max_signal": self.max_signal,
+            "locations": self.locations
+        }
+
+def _count(counter, key, delta):
+    value = counter.get(key, 0) + delta
+    if value > 0:
+        counter[key] = value
+    else:
+        counter.pop(key, None)
+
+class SSIDAggregates:
+    """Per-SSID signal aggregates plus auth and channel counters.
+
+    Updated as locations are added, replaced or removed, so /get_all_wifi and
+    /stats cost O(#SSIDs) instead of a walk over every stored network.
+    """
+
+    def __init__(self):
+        self._ssids = {}
+        self.auth_counts = {}
+        self.channel_counts = {}
+        self.version = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._ssids)
+
+    def _apply(self, networks, delta):
+        for network in networks:
+            ssid = network.get("ssid")
+            if not ssid:
+                continue
+            signal = network.get("signal", 0)
+            aggregate = self._ssids.get(ssid)
+            if delta > 0:
+                if aggregate is None:
+                    aggregate = self._ssids[ssid] = SSIDAggregate(ssid)
+                aggregate.add(signal)
+            elif aggregate is not None:
+                aggregate.remove(signal)
+                if not aggregate.locations:
+                    del self._ssids[ssid]
+            _count(self.auth_counts, network.get("auth", "Unknown"), delta)
+            _count(self.channel_counts, network.get("channel", 0), delta)
+
+    def add_location(self, location_data):
+        with self._lock:
+            self._apply(location_data.get("networks", []), 1)
+            self.version += 1
+
+    def remove_location(self, location_data):
+        with self._lock:
+            self._apply(location_data.get("networks", []), -1)
+            self.version += 1
+
+    def replace_location(self, old_networks, location_data):
+        """Swap a location's previous networks for its current ones"""
+        with self._lock:
+            self._apply(old_networks or [], -1)
+            self._apply(location_data.get("networks", []), 1)
+            self.version += 1
+
+    def update_locations(self, previous, current):
+        """Move the aggregates from one {key: location_data} mapping to the next.
+
+        Only locations that were removed, added or changed are applied, in
+        one step under the lock. Returns the number of locations applied.
+        """
+        changed = 0
+        with self._lock:
+            for location_key, location_data in previous.items():
+                if location_key not in current:
+                    self.remove_location(location_data)
+                    changed += 1
+            for location_key, location_data in current.items():
+                old = previous.get(location_key)
+                if old is None:
+                    self.add_location(location_data)
+                    changed += 1
+                elif old != location_data:
+                    self.replace_location(old.get("networks", []), location_data)
+                    changed += 1
+        return changed
+
+    def clear(self):
+        with self._lock:
+            self._ssids.clear()
+            self.auth_counts.clear()
+            self.channel_counts.clear()
+            self.version += 1
+
+    def networks(self):
+        """Return [{ssid, min_signal, max_signal, locations}] for every SSID"""
+        with self._lock:
+            return [aggregate.to_dict() for aggregate in self._ssids.values()]
+
+    def ssids(self):
+        with self._lock:
+            return list(self._ssids)
+
+    def strongest_network(self):
+        with self._lock:
+            if not self._ssids:
+                return None
+            return max(self._ssids.values(), key=lambda a: a.max_signal).ssid
+
+    def summary(self):
+        """Return the SSID counts used by /stats"""
+        with self._lock:
+            return {
+                "unique_networks": len(self._ssids),
+                "networks_by_auth": dict(self.auth_counts),
+                "networks_by_channel": {str(k): v for k, v in self.channel_counts.items()},
+                "strongest_network": self.strongest_network()
+            }
+
+def build_ssid_aggregates(locations):
+    """Build SSIDAggregates from a {key: location_data} mapping"""
+    aggregates = SSIDAggregates()
+    for location_data in locations.values():
+        aggregates.add_location(location_data)
+    return aggregates
+
+def diff_networks(before, after):
+    """(new or changed entries, SSIDs gone) between two SSIDAggregates.networks() lists"""
+    previous = {network["ssid"]: network for network in before}
+    changed = [network for network in after if previous.get(network["ssid"]) != network]
+    current = {network["ssid"] for network in after}
+    return changed, [ssid for ssid in previous if ssid not in current]
+
+def compute_ssid_aggregates(locations):
+    """Recompute the aggregates by walking every network at every location.
+
+    This is the original per-request computation, kept to verify the
+    incrementally maintained SSIDAggregates.
+    """
+    ssid_data = {}
+    auth_counts = {}
+    for location_data in locations.values():
+        for network in location_data.get("networks", []):
+            ssid = network.get("ssid")
+            if not ssid:
+                continue
+            signal = network.get("signal", 0)
+            auth_type = network.get("auth", "Unknown")
+            auth_counts[auth_type] = auth_counts.get(auth_type, 0) + 1
+            if ssid not in ssid_data:
+                ssid_data[ssid] = {"ssid": ssid, "min_signal": signal, "max_signal": signal, "locations": 1}
+            else:
+                ssid_data[ssid]["min_signal"] = min(ssid_data[ssid]["min_signal"], signal)
+                ssid_data[ssid]["max_signal"] = max(ssid_data[ssid]["max_signal"], signal)
+                ssid_data[ssid]["locations"] += 1
+    return ssid_data, auth_counts
+
+def verify_ssid_aggregates(aggregates, locations):
+    """Return True if `aggregates` matches a full rebuild over `locations`"""
+    ssid_data, auth_counts = compute_ssid_aggregates(locations)
+    current = {n["ssid"]: n for n in aggregates.networks()}
+    return current == ssid_data and aggregates.auth_counts == auth_counts
+
+class SSIDObservationIndex:
+    """Inverted index from SSID (and BSSID, when scans record one) to observations.
+
+    SSIDs are interned to small integer ids. Each id maps to a list of
+    (timestamp, location_key, position) references, kept sorted by timestamp
+    so time ranges are found by bisection; `position` is the network's index
+    in the location's "networks" list.
+
+    copy() and updated() share each postings list with the new index until
+    either changes it, so an index that readers still hold is never
+    modified by its successor's changes.
+    """
+
+    def __init__(self):
+        self._ids = {}
+        self._names = []
+        self._postings = {}
+        self._by_location = {}
+        # Ids whose postings lists are shared with a copy of this index
+        self._shared = set()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._postings)
+
+    def intern(self, name):
+        """Return the integer id for an SSID/BSSID, assigning one if needed"""
+        name_id = self._ids.get(name)
+        if name_id is None:
+            name_id = self._ids[name] = len(self._names)
+            self._names.append(name)
+        return name_id
+
+    def _writable(self, name_id):
+        """The postings list of an id for modification, copied first if a copy of the index shares it"""
+        postings = self._postings.get(name_id)
+        if postings is None:
+            postings = self._postings[name_id] = []
+        elif name_id in self._shared:
+            self._shared.discard(name_id)
+            postings = self._postings[name_id] = list(postings)
+        return postings
+
+    def add_location(self, location_key, location_data):
+        timestamp = location_data.get("timestamp") or ""
+        with self._lock:
+            if location_key in self._by_location:
+                self.remove_location(location_key)
+            entries = []
+            for position, network in enumerate(location_data.get("networks", [])):
+                for name in (network.get("ssid"), network.get("bssid")):
+                    if not name:
+                        continue
+                    name_id = self.intern(name)
+                    posting = (timestamp, location_key, position)
+                    bisect.insort(self._writable(name_id), posting)
+                    entries.append((name_id, posting))
+            self._by_location[location_key] = entries
+
+    def remove_location(self, location_key):
+        with self._lock:
+            for name_id, posting in self._by_location.pop(location_key, ()):
+                if name_id not in self._postings:
+                    continue
+                postings = self._writable(name_id)
+                i = bisect.bisect_left(postings, posting)
+                if i < len(postings) and postings[i] == posting:
+                    del postings[i]
+                if not postings:
+                    del self._postings[name_id]
+
+    def clear(self):
+        with self._lock:
+            self._postings.clear()
+            self._by_location.clear()
+            self._shared.clear()
+
+    def copy(self):
+        """An index with the same observations that can be changed independently of this one"""
+        with self._lock:
+            index = SSIDObservationIndex()
+            index._ids = dict(self._ids)
+            index._names = list(self._names)
+            index._postings = dict(self._postings)
+            index._by_location = dict(self._by_location)
+            self._shared = set(self._postings)
+            index._shared = set(self._postings)
+            return index
+
+    def updated(self, changes):
+        """A copy of the index with {key: location_data, or None to remove} applied; this index is left as it was"""
+        index = self.copy()
+        for location_key, location_data in changes.items():
+            if location_data is None:
+                index.remove_location(location_key)
+            else:
+                index.add_location(location_key, location_data)
+        return index
+
+    def update_locations(self, previous, current):
+        """Move the index from one {key: location_data} mapping to the next.
+
+        Only locations that were removed, added or changed are touched, so a
+        reload that changed a few locations costs a comparison per location
+        instead of a rebuild. Returns the number of locations re-indexed.
+        """
+        changed = 0
+        with self._lock:
+            for location_key in previous:
+                if location_key not in current:
+                    self.remove_location(location_key)
+            for location_key, location_data in current.items():
+                if previous.get(location_key) != location_data:
+                    self.add_location(location_key, location_data)
+                    changed += 1
+        return changed
+
+    def lookup(self, name, since=None, until=None, offset=0, limit=None):
+        """Return (total, [(location_key, position)]) for an SSID or BSSID.
+
+        `since`/`until` are inclusive ISO timestamps or prefixes of one (e.g. a
+        date). Results are ordered by timestamp and sliced by offset/limit
+        after filtering.
+        """
+        with self._lock:
+            name_id = self._ids.get(name)
+            postings = self._postings.get(name_id, []) if name_id is not None else []
+            start = bisect.bisect_left(postings, (since,)) if since else 0
+            # Appending \uffff makes `until` match every timestamp it prefixes,
+            # so until=2025-04-10 includes that whole day
+            end = bisect.bisect_left(postings, (until + "\uffff",)) if until else len(postings)
+            end = max(start, end)
+            total = end - start
+            begin = min(start + offset, end)
+            stop = end if limit is None else min(begin + limit, end)
+            return total, [(p[1], p[2]) for p in postings[begin:stop]]
+
+def parse_observation_args(args):
+    """Validate /network/<ssid> query parameters into (since, until, offset, limit)"""
+    try:
+        offset = max(0, int(args.get('offset', 0)))
+        limit = args.get('limit')
+        limit = max(0, int(limit)) if limit is not None else None
+    except ValueError:
+        raise ValueError("offset and limit must be integers")
+    return args.get('since'), args.get('until'), offset, limit
+
+def observations_response(ssid, total, matches, offset, limit):
+    """(body, status) for /network/<ssid> from a lookup's total and [(location, network)] page"""
+    if not total:
+        return {"error": "Network not found"}, 404
+    network_data = []
+    for location_data, network in matches:
+        network_data.append({
+            "location": {
+                "name": location_data.get("name", "Unknown"),
+                "latitude": location_data.get("latitude"),
+                "longitude": location_data.get("longitude"),
+                "timestamp": location_data.get("timestamp")
+            },
+            "signal": network.get("signal"),
+            "auth": network.get("auth"),
+            "channel": network.get("channel"),
+            "snr": network.get("snr")
+        })
+    return {
+        "ssid": ssid,
+        "locations": total,
+        "offset": offset,
+        "limit": limit,
+        "data": network_data
+    }, 200
+
+def build_observation_index(locations):
+    """Build an SSIDObservationIndex from a {key: location_data} mapping"""
+    index = SSIDObservationIndex()
+    for location_key, location_data in locations.items():
+        index.add_location(location_key, location_data)
+    return index
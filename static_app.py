@@ -1,66 +1,189 @@
-import json
 import os
+import threading
 import webbrowser
 from datetime import datetime
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, Response, render_template, jsonify, request
+from spatial_index import build_location_index
+from data_cache import CachedJSONFile
+from scan_log import ScanLog
+from sqlite_store import SQLiteStore, is_sqlite_path
+from columnar_store import is_columnar_path, read_columnar
+from location_clusters import LocationClusters, locations_response
+from heatmap_tiles import TILE_CACHE_DIR, TileServer, parse_ssid
+from signal_surface import SurfaceEngine, point_response, surface_response
+from ssid_index import (build_ssid_aggregates, build_observation_index, observations_response,
+                        parse_observation_args, verify_ssid_aggregates)
 
 # File containing stored WiFi data
 WIFI_DATA_FILE = 'wifi_data.json'
 
+# Parsed copy of WIFI_DATA_FILE, re-read only when the file changes on disk
+data_cache = None
+
+# Open database when WIFI_DATA_FILE is a SQLite file
+sqlite_store = None
+
+# Spatial index over stored locations, rebuilt whenever the cached data reloads
+location_index = None
+location_index_source = None
+
+# Held while the index, surface engine and clusters are rebuilt, so a reload builds each once
+derived_lock = threading.Lock()
+
+# Per-SSID aggregates, updated with the changes whenever the cached data reloads
+ssid_aggregates = None
+ssid_aggregates_source = None
+aggregates_lock = threading.Lock()
+
+# Inverted SSID/BSSID -> observation index, updated with the changes whenever the cached data reloads.
+# The lock keeps it in step with the locations its references point into.
+observation_index = None
+observation_index_source = None
+observation_lock = threading.Lock()
+
+# Interpolated signal surfaces, rebuilt whenever the cached data reloads
+surface_engine = None
+surface_engine_source = None
+
+# Location summaries for the map's viewport queries, rebuilt whenever the cached data reloads
+location_clusters = None
+location_clusters_source = None
+
+# Heatmap tiles; the pyramid of each data version is rendered in the background once enabled
+tile_server = None
+PRECOMPUTE_TILES = False
+
 app = Flask(__name__)
 
+def get_sqlite_store():
+    """Return the SQLite store for WIFI_DATA_FILE, or None for JSON files"""
+    global sqlite_store
+    if not is_sqlite_path(WIFI_DATA_FILE):
+        return None
+    if sqlite_store is None or sqlite_store.path != WIFI_DATA_FILE:
+        sqlite_store = SQLiteStore(WIFI_DATA_FILE)
+    return sqlite_store
+
+def get_data_cache():
+    """Return the cache for WIFI_DATA_FILE, recreating it if the path changed"""
+    global data_cache
+    if data_cache is None or data_cache.path != WIFI_DATA_FILE:
+        if is_sqlite_path(WIFI_DATA_FILE):
+            data_cache = CachedJSONFile(WIFI_DATA_FILE, loader=lambda path: get_sqlite_store().load())
+        elif is_columnar_path(WIFI_DATA_FILE):
+            data_cache = CachedJSONFile(WIFI_DATA_FILE, loader=read_columnar)
+        else:
+            # Merges from dynamic.py are appended to a log next to the snapshot
+            log = ScanLog(WIFI_DATA_FILE)
+            data_cache = CachedJSONFile(WIFI_DATA_FILE, loader=lambda path: log.load(),
+                                        watch_paths=[log.log_path])
+    return data_cache
+
 def load_data():
-    """Load WiFi data from the static JSON file"""
+    """Load WiFi data from the static JSON file.
+
+    The parsed document is cached and shared between requests, so callers
+    must not modify it.
+    """
     try:
-        if os.path.exists(WIFI_DATA_FILE):
-            with open(WIFI_DATA_FILE, 'r') as file:
-                return json.load(file)
+        data = get_data_cache().get()
+        if data is not None:
+            return data
     except Exception as e:
         print(f"Error loading data: {e}")
         return {"locations": {}, "metadata": {"error": str(e)}}
     
     return {"locations": {}, "metadata": {"message": "No data file found"}}
 
-def calculate_distance(lat1, lon1, lat2, lon2):
-    """Calculate distance between two coordinates in meters"""
-    import math
-    R = 6371000  # Earth's radius in meters
-    φ1 = math.radians(lat1)
-    φ2 = math.radians(lat2)
-    Δφ = math.radians(lat2 - lat1)
-    Δλ = math.radians(lon2 - lon1)
-
-    a = math.sin(Δφ/2) * math.sin(Δφ/2) + \
-        math.cos(φ1) * math.cos(φ2) * \
-        math.sin(Δλ/2) * math.sin(Δλ/2)
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-    return R * c
+def get_location_index():
+    """Return the spatial index over stored locations, building it on first use"""
+    global location_index, location_index_source
+    data = load_data()
+    with derived_lock:
+        if location_index is None or location_index_source is not data:
+            location_index = build_location_index(data["locations"])
+            location_index_source = data
+        return location_index
+
+def get_ssid_aggregates():
+    """Return the per-SSID aggregates for the stored data.
+
+    They are built on first use; after a reload only the locations that
+    changed are applied.
+    """
+    global ssid_aggregates, ssid_aggregates_source
+    data = load_data()
+    with aggregates_lock:
+        if ssid_aggregates is None:
+            ssid_aggregates = build_ssid_aggregates(data["locations"])
+            ssid_aggregates_source = data
+        elif ssid_aggregates_source is not data:
+            ssid_aggregates.update_locations(ssid_aggregates_source["locations"], data["locations"])
+            ssid_aggregates_source = data
+        return ssid_aggregates
+
+def get_observation_index():
+    """Return (locations, SSID -> observation index) for the stored data, both from the same load.
+
+    The index is built on first use; after a reload only the locations
+    that changed are re-indexed. Callers hold observation_lock until they
+    are done with the index, so a reload can't move it past `locations`.
+    """
+    global observation_index, observation_index_source
+    data = load_data()
+    if observation_index is None:
+        observation_index = build_observation_index(data["locations"])
+        observation_index_source = data
+    elif observation_index_source is not data:
+        observation_index.update_locations(observation_index_source["locations"], data["locations"])
+        observation_index_source = data
+    return data["locations"], observation_index
+
+def get_surface_engine():
+    """Return the signal surface engine for the stored data, recreating it when the data reloads"""
+    global surface_engine, surface_engine_source
+    data = load_data()
+    with derived_lock:
+        if surface_engine is None or surface_engine_source is not data:
+            surface_engine = SurfaceEngine(data["locations"], version=get_data_cache().version)
+            surface_engine_source = data
+            if PRECOMPUTE_TILES:
+                get_tile_server().precompute(surface_engine)
+        return surface_engine
+
+def get_location_clusters():
+    """Return the viewport/cluster index over stored locations, building it on first use"""
+    global location_clusters, location_clusters_source
+    data = load_data()
+    with derived_lock:
+        if location_clusters is None or location_clusters_source is not data:
+            location_clusters = LocationClusters(data["locations"], version=get_data_cache().version)
+            location_clusters_source = data
+        return location_clusters
+
+def get_tile_server():
+    """Return the heatmap tile server, creating it on first use"""
+    global tile_server
+    if tile_server is None:
+        tile_server = TileServer(TILE_CACHE_DIR, namespace="static")
+    return tile_server
 
 def find_nearest_location(target_lat, target_lon, max_distance=100):
     """Find the nearest stored location within max_distance (meters)."""
-    data = load_data()
-    nearest = None
-    min_dist = float('inf')
-    
-    for location_key, location_data in data["locations"].items():
-        lat = location_data.get("latitude")
-        lon = location_data.get("longitude")
-        
-        if lat is None or lon is None:
-            continue
-            
-        # Calculate distance
-        dist = calculate_distance(lat, lon, target_lat, target_lon)
-        
-        if dist < min_dist and dist < max_distance:
-            min_dist = dist
-            nearest = {
-                "key": location_key,
-                "distance": dist,
-                "location_data": location_data
-            }
-    
-    return nearest
+    store = get_sqlite_store()
+    if store is not None:
+        match = store.nearest(target_lat, target_lon, max_distance)
+    else:
+        match = get_location_index().nearest(target_lat, target_lon, max_distance)
+    if match is None:
+        return None
+
+    dist, location_key, location_data = match
+    return {
+        "key": location_key,
+        "distance": dist,
+        "location_data": location_data
+    }
 
 @app.route('/')
 def index():
@@ -104,30 +227,7 @@ def get_wifi():
 @app.route('/get_all_wifi', methods=['GET'])
 def get_all_wifi():
     """Return all unique SSIDs and their signal strength ranges"""
-    data = load_data()
-    ssid_data = {}
-    
-    for location_key, location_data in data["locations"].items():
-        for network in location_data.get("networks", []):
-            ssid = network.get("ssid")
-            if not ssid:
-                continue
-            
-            signal = network.get("signal", 0)
-            
-            if ssid not in ssid_data:
-                ssid_data[ssid] = {
-                    "ssid": ssid,
-                    "min_signal": signal,
-                    "max_signal": signal,
-                    "locations": 1
-                }
-            else:
-                ssid_data[ssid]["min_signal"] = min(ssid_data[ssid]["min_signal"], signal)
-                ssid_data[ssid]["max_signal"] = max(ssid_data[ssid]["max_signal"], signal)
-                ssid_data[ssid]["locations"] += 1
-    
-    networks = list(ssid_data.values())
+    networks = get_ssid_aggregates().networks()
     return jsonify({
         "networks": networks,
         "count": len(networks)
@@ -141,104 +241,102 @@ def get_data_for_download():
 
 @app.route('/get_all_locations', methods=['GET'])
 def get_all_locations():
-    """Return all stored location coordinates"""
-    locations = []
-    try:
-        data = load_data()
-        for loc_key, loc_data in data["locations"].items():
-            if "latitude" in loc_data and "longitude" in loc_data:
-                locations.append({
-                    "latitude": loc_data["latitude"],
-                    "longitude": loc_data["longitude"],
-                    "name": loc_data.get("name", "Unknown Location"),
-                    "timestamp": loc_data.get("timestamp", "")
-                })
-    except Exception as e:
-        print(f"Error loading locations: {e}")
-    
-    return jsonify({"locations": locations})
+    """Return the stored locations in a viewport, clustered below POINTS_MIN_ZOOM, a page at a time
+
+    Query parameters: bbox=west,south,east,north, zoom, limit and the
+    cursor of the previous page (see location_clusters).
+    """
+    body, status = locations_response(get_location_clusters(), request.args)
+    return jsonify(body), status
 
 @app.route('/stats', methods=['GET'])
 def get_stats():
-    """Return statistics about the collected data"""
+    """Return statistics about the collected data and the data cache counters
+
+    Pass ?verify=1 to also check the SSID aggregates against a full rebuild.
+    """
     data = load_data()
-    
-    # Count networks
-    total_locations = len(data["locations"])
-    unique_ssids = set()
-    network_counts = {}
-    signal_ranges = {}
-    
-    for location_key, location_data in data["locations"].items():
-        networks = location_data.get("networks", [])
-        
-        for network in networks:
-            ssid = network.get("ssid")
-            if not ssid:
-                continue
-                
-            unique_ssids.add(ssid)
-            
-            # Count occurrence by auth type
-            auth_type = network.get("auth", "Unknown")
-            if auth_type not in network_counts:
-                network_counts[auth_type] = 0
-            network_counts[auth_type] += 1
-            
-            # Track signal strength ranges
-            signal = network.get("signal", 0)
-            if ssid not in signal_ranges:
-                signal_ranges[ssid] = {"min": signal, "max": signal}
-            else:
-                signal_ranges[ssid]["min"] = min(signal_ranges[ssid]["min"], signal)
-                signal_ranges[ssid]["max"] = max(signal_ranges[ssid]["max"], signal)
+    aggregates = get_ssid_aggregates()
+    summary = aggregates.summary()
     
     # Get metadata
     created = data.get("metadata", {}).get("created", "Unknown")
     last_updated = data.get("metadata", {}).get("last_updated", "Unknown")
     
-    return jsonify({
-        "total_locations": total_locations,
-        "unique_networks": len(unique_ssids),
-        "networks_by_auth": network_counts,
+    result = {
+        "total_locations": len(data["locations"]),
+        "unique_networks": summary["unique_networks"],
+        "networks_by_auth": summary["networks_by_auth"],
+        "networks_by_channel": summary["networks_by_channel"],
         "created": created,
         "last_updated": last_updated,
-        "strongest_network": max(signal_ranges.items(), key=lambda x: x[1]["max"])[0] if signal_ranges else None
-    })
+        "strongest_network": summary["strongest_network"],
+        "cache": get_data_cache().stats()
+    }
+    if request.args.get('verify'):
+        result["aggregates_verified"] = verify_ssid_aggregates(aggregates, data["locations"])
+    return jsonify(result)
 
 @app.route('/network/<ssid>', methods=['GET'])
 def get_network_details(ssid):
-    """Get details for a specific network"""
-    data = load_data()
-    network_data = []
-    
-    for location_key, location_data in data["locations"].items():
-        for network in location_data.get("networks", []):
-            if network.get("ssid") == ssid:
-                network_data.append({
-                    "location": {
-                        "name": location_data.get("name", "Unknown"),
-                        "latitude": location_data.get("latitude"),
-                        "longitude": location_data.get("longitude"),
-                        "timestamp": location_data.get("timestamp")
-                    },
-                    "signal": network.get("signal"),
-                    "auth": network.get("auth"),
-                    "channel": network.get("channel"),
-                    "snr": network.get("snr")
-                })
-    
-    if not network_data:
+    """Get details for a specific network (SSID or BSSID)
+
+    Observations are ordered by timestamp. Optional query parameters:
+    since/until (ISO timestamps, inclusive) and offset/limit for paging.
+    """
+    try:
+        since, until, offset, limit = parse_observation_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    store = get_sqlite_store()
+    if store is not None:
+        # Indexed lookup on observations.ssid / observations.bssid
+        total, matches = store.ssid_observations(ssid, since, until, offset, limit)
+    else:
+        with observation_lock:
+            locations, index = get_observation_index()
+            total, refs = index.lookup(ssid, since, until, offset, limit)
+        matches = [(locations[key], locations[key]["networks"][position]) for key, position in refs]
+
+    body, status = observations_response(ssid, total, matches, offset, limit)
+    return jsonify(body), status
+
+@app.route('/surface', methods=['GET'])
+def get_surface():
+    """Interpolated signal grid for an SSID, or the strongest network with no SSID
+
+    Query parameters: ssid, bbox (west,south,east,north), resolution (meters)
+    and method (idw or gp).
+    """
+    body, status = surface_response(get_surface_engine(), request.args)
+    return jsonify(body), status
+
+@app.route('/surface/point', methods=['GET'])
+def get_surface_point():
+    """Predicted signal at lat/lon, read off the SSID's precomputed surface"""
+    body, status = point_response(get_surface_engine(), request.args)
+    return jsonify(body), status
+
+@app.route('/tiles/<path:ssid>/<int:z>/<int:x>/<int:y>.png', methods=['GET'])
+def get_tile(ssid, z, x, y):
+    """Heatmap tile of an SSID's signal surface ("_all" for the strongest network at each point)"""
+    if not (0 <= z <= 22 and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        return jsonify({"error": "No such tile"}), 404
+    engine = get_surface_engine()
+    png = get_tile_server().tile(engine, parse_ssid(ssid), z, x, y)
+    if png is None:
         return jsonify({"error": "Network not found"}), 404
-    
-    return jsonify({
-        "ssid": ssid,
-        "locations": len(network_data),
-        "data": network_data
-    })
+    # Tile URLs don't change with the data, so browsers revalidate against the version
+    response = Response(png, mimetype='image/png')
+    response.set_etag(f"{engine.version}-{ssid}-{z}-{x}-{y}")
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
 
 def main(port=5000):
     """Run the Flask application"""
+    global PRECOMPUTE_TILES
+    PRECOMPUTE_TILES = True
     print(f"Starting static WiFi data viewer on port {port}")
     print(f"Data source: {WIFI_DATA_FILE}")
     
@@ -251,6 +349,9 @@ def main(port=5000):
             data = load_data()
             location_count = len(data["locations"])
             print(f"Found {location_count} locations in data file")
+            get_location_index()
+            # Starts rendering the heatmap tile pyramid
+            get_surface_engine()
         except Exception as e:
             print(f"Error loading data: {e}")
     
@@ -266,7 +367,7 @@ if __name__ == "__main__":
     parser.add_argument('--port', '-p', type=int, default=5000, 
                         help='Port for web interface (default: 5000)')
     parser.add_argument('--data-file', '-f', default='wifi_data.json',
-                        help='JSON file containing WiFi data (default: wifi_data.json)')
+                        help='JSON file, SQLite .db or columnar .wfc containing WiFi data (default: wifi_data.json)')
     args = parser.parse_args()
     
     # Update global variable
@@ -0,0 +1,23 @@
+import json
+import app
+from spatial_index import SpatialIndex
+
+def test_download_reads_the_stored_data_without_writing(tmp_path, monkeypatch):
+    path = tmp_path / "dynamic_data.json"
+    data = {"locations": {"Location_tsj0v4ezq": {"name": "Location_tsj0v4ezq", "latitude": 23.21,
+                                                 "longitude": 72.68, "networks": [{"ssid": "A", "signal": -60}]}},
+            "metadata": {}}
+    path.write_text(json.dumps(data))
+    monkeypatch.setattr(app, "DATA_FILE", str(path))
+    monkeypatch.setattr(app, "wifi_locations", {})
+    monkeypatch.setattr(app, "location_labels", {})
+    monkeypatch.setattr(app, "location_index", SpatialIndex())
+    assert app.load_existing_data()
+    assert list(app.wifi_locations) == ["23.210000,72.680000"]
+
+    response = app.app.test_client().get("/get_data_for_download")
+    assert response.get_json()["locations"] == data["locations"]
+    assert json.loads(path.read_text()) == data
+    assert not (tmp_path / "dynamic_data.json.log").exists() or not (tmp_path / "dynamic_data.json.log").read_text()
+    app.get_storage().close()
+    monkeypatch.setattr(app, "storage", None)
@@ -0,0 +1,79 @@
+import json
+import pytest
+from columnar_store import ColumnarFile, columnar_to_json, json_to_columnar, read_columnar, write_columnar
+
+def document():
+    return {
+        "locations": {
+            "23.21,72.68": {
+                "name": "Lab", "latitude": 23.21, "longitude": 72.68, "timestamp": "2024-01-01 10:00:00",
+                "networks": [
+                    {"ssid": "Office", "signal": -60, "auth": "WPA2", "channel": 6, "bssid": "aa:bb:cc:dd:ee:ff",
+                     "frequency": 2437, "signal_stderr": 1.25, "samples": 4},
+                    {"ssid": "Café ☕", "signal": -81, "signal_percent": 38, "auth": "Open"},
+                ],
+            },
+            "23.22,72.69": {
+                "name": "Hall", "latitude": 23.22, "longitude": 72.69, "timestamp": "2024-01-01 10:05:00",
+                "note": "upstairs", "networks": [{"ssid": "Office", "signal": -70}],
+            },
+        },
+        "metadata": {"created": "2024-01-01", "version": "1.0"},
+        "signal_history": {"Office": [[-60, "2024-01-01 10:00:00"]]},
+    }
+
+def round_trip(tmp_path, data):
+    path = str(tmp_path / "data.wfc")
+    write_columnar(path, data)
+    return read_columnar(path)
+
+def test_round_trip(tmp_path):
+    assert round_trip(tmp_path, document()) == document()
+
+def test_values_that_do_not_fit_their_column_round_trip(tmp_path):
+    data = document()
+    networks = data["locations"]["23.21,72.68"]["networks"]
+    networks[0].update(signal=-60.5, channel=70000, signal_stderr=0.125, vendor="Acme", quality=None)
+    networks[1].update(signal=True, snr=-32768, bssid=7)
+    data["locations"]["23.22,72.69"].update(latitude=None, floor=2, name=3)
+    assert round_trip(tmp_path, data) == data
+
+def test_locations_without_a_network_list_round_trip(tmp_path):
+    data = document()
+    data["locations"]["bare"] = {"name": "Bare", "latitude": 1.0, "longitude": 2.0}
+    data["locations"]["odd"] = {"name": "Odd", "networks": "none"}
+    data["locations"]["mixed"] = {"networks": [{"ssid": "x"}, "y"]}
+    data["locations"]["empty"] = {"networks": []}
+    assert round_trip(tmp_path, data) == data
+
+def test_empty_document_round_trips(tmp_path):
+    assert round_trip(tmp_path, {"locations": {}, "metadata": {}}) == {"locations": {}, "metadata": {}}
+
+def test_columns_are_read_only_views(tmp_path):
+    path = str(tmp_path / "data.wfc")
+    write_columnar(path, document())
+    with ColumnarFile(path) as columnar:
+        assert columnar.location_count == 2 and columnar.observation_count == 3
+        signals = columnar.column("observation.signal")
+        assert signals.tolist() == [-60, -81, -70]
+        assert not signals.flags.writeable
+        assert columnar.column("observation.noise_floor") is None
+        rows, locations = columnar.observations_of("Office")
+        assert rows.tolist() == [0, 2] and locations.tolist() == [0, 1]
+        rows, _ = columnar.observations_of("Nowhere")
+        assert len(rows) == 0
+        del signals
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "data.wfc"
+    path.write_bytes(b"not a columnar file")
+    with pytest.raises(ValueError):
+        ColumnarFile(str(path))
+
+def test_json_conversion_round_trip(tmp_path):
+    json_path, columnar_path, back_path = tmp_path / "a.json", tmp_path / "a.wfc", tmp_path / "b.json"
+    json_path.write_text(json.dumps(document()))
+    count, size = json_to_columnar(str(json_path), str(columnar_path))
+    assert count == 2 and size == columnar_path.stat().st_size
+    assert columnar_to_json(str(columnar_path), str(back_path))[0] == 2
+    assert json.loads(back_path.read_text()) == document()
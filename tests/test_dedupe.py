@@ -0,0 +1,57 @@
+from dedupe import dedupe_file, dedupe_locations, location_label
+from geo import location_key
+from scan_log import ScanLog
+
+LAT, LON = 23.211987018585205, 72.68681287765503
+
+def location(name, timestamp, lat=LAT, lon=LON, **extra):
+    return dict({"name": name, "latitude": lat, "longitude": lon, "timestamp": timestamp, "networks": []}, **extra)
+
+def test_location_label():
+    assert location_label({"name": "Location_1700000000_1700000000"}) is None
+    assert location_label({"name": "Dynamic_Scan_20250410_090000"}) is None
+    assert location_label({"name": "Survey_Scan_3"}) is None
+    assert location_label({"name": "library"}) == "library"
+    assert location_label({"name": "Location_x", "label": "cafe"}) == "cafe"
+    assert location_label({}) is None
+
+def test_duplicates_collapse_onto_the_newest_entry():
+    locations = {
+        "Location_1_1": location("Location_1_1", "2025-04-10T09:00:00"),
+        "Location_2_2": location("Location_2_2", "2025-04-11T09:00:00"),
+        "Location_3_3": location("Location_3_3", "2025-04-09T09:00:00"),
+        "Dynamic_Scan_4": location("Dynamic_Scan_4", "2025-04-08T09:00:00", lat=LAT + 0.001),
+        "library": location("library", "2025-04-07T09:00:00"),
+        "no_fix": {"name": "no_fix", "networks": []},
+    }
+    result = dedupe_locations(locations)
+    assert sorted(result) == sorted([location_key(LAT, LON), location_key(LAT + 0.001, LON),
+                                     "library_ts5sn18gt", "no_fix"])
+    assert result[location_key(LAT, LON)]["timestamp"] == "2025-04-11T09:00:00"
+    # Labels are recorded so later saves key the location the same way
+    assert result["library_ts5sn18gt"]["label"] == "library"
+    assert "label" not in locations["library"]
+    assert result["no_fix"] is locations["no_fix"]
+    # Running it again changes nothing
+    assert dedupe_locations(result) == result
+
+def test_dedupe_file_rewrites_the_snapshot_and_log(tmp_path):
+    path = str(tmp_path / "data.json")
+    log = ScanLog(path)
+    for i in range(5):
+        log.upsert(f"Location_{i}_{i}", location(f"Location_{i}_{i}", f"2025-04-1{i}T09:00:00"))
+    log.close()
+
+    assert dedupe_file(path, dry_run=True) == (5, 1)
+    assert len(ScanLog(path).load()["locations"]) == 5
+
+    output = str(tmp_path / "deduped.json")
+    assert dedupe_file(path, output) == (5, 1)
+    assert len(ScanLog(path).load()["locations"]) == 5
+    data = ScanLog(output).load()
+    assert list(data["locations"]) == [location_key(LAT, LON)]
+    assert data["metadata"]["location_count"] == 1
+
+    assert dedupe_file(path) == (5, 1)
+    assert list(ScanLog(path).load()["locations"]) == [location_key(LAT, LON)]
+    assert (tmp_path / "data.json.log").read_text() == ""
@@ -0,0 +1,52 @@
+import json
+from event_stream import RETRY_MS, EventBroadcaster, Subscription, format_event
+
+def test_format_event():
+    assert format_event("scan", {"a": [1, 2]}, event_id=7) == 'id: 7\nevent: scan\ndata: {"a":[1,2]}\n\n'
+    assert format_event("reset", {}) == "event: reset\ndata: {}\n\n"
+
+def test_lagging_subscription_gets_one_resync():
+    subscription = Subscription(queue_size=2)
+    for i in range(5):
+        subscription.put(f"m{i}")
+    message = subscription.get(0)
+    assert message.startswith("event: resync\n")
+    assert json.loads(message.split("data: ")[1]) == {"reason": "lagged"}
+    assert subscription.dropped == 5
+    assert subscription.get(0) is None
+    subscription.put("m5")
+    assert subscription.get(0) == "m5"
+
+def test_closed_subscription_returns_none():
+    subscription = Subscription()
+    subscription.close()
+    assert subscription.get(1) is None and subscription.closed
+
+def test_stream_carries_events_published_before_it_starts():
+    broadcaster = EventBroadcaster(heartbeat=0.01)
+    subscription = broadcaster.subscribe()
+    # Published between the route's version check and the first read of the stream
+    assert broadcaster.publish("scan", {"version": 2}, event_id=2) == 1
+    stream = broadcaster.stream(format_event("resync", {"version": 1}), subscription)
+    assert next(stream) == f"retry: {RETRY_MS}\n\n"
+    assert next(stream).startswith("event: resync")
+    assert next(stream) == format_event("scan", {"version": 2}, event_id=2)
+    assert next(stream) == ": keep-alive\n\n"
+    stream.close()
+    assert len(broadcaster) == 0 and subscription.closed
+
+def test_unstarted_stream_can_be_unsubscribed():
+    broadcaster = EventBroadcaster()
+    subscription = broadcaster.subscribe()
+    broadcaster.stream(None, subscription)
+    broadcaster.unsubscribe(subscription)
+    assert len(broadcaster) == 0
+    assert broadcaster.publish("scan", {}) == 0
+
+def test_close_ends_every_stream():
+    broadcaster = EventBroadcaster(heartbeat=5)
+    stream = broadcaster.stream()
+    next(stream)
+    broadcaster.close()
+    assert list(stream) == []
+    assert broadcaster.stats() == {"clients": 0, "published": 0, "dropped": 0}
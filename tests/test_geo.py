@@ -0,0 +1,23 @@
+from geo import geohash, location_key
+
+def test_geohash_known_points():
+    assert geohash(57.64911, 10.40744, 11) == "u4pruydqqvj"
+    assert geohash(-25.382708, -49.265506, 8) == "6gkzwgjz"
+    # Shorter hashes are prefixes of longer ones
+    assert geohash(57.64911, 10.40744, 5) == "u4pru"
+
+def test_geohash_cell_edges():
+    assert geohash(0, 0, 1) == "s"
+    assert geohash(-0.000001, -0.000001, 1) == "7"
+    assert geohash(90, 180, 3) == "zzz"
+    assert geohash(-90, -180, 3) == "000"
+
+def test_location_key_is_stable_within_a_cell():
+    # A precision-9 cell spans 180 / 2**22 degrees of latitude and 360 / 2**23 of longitude
+    cell_lat, cell_lon = 180 / 2 ** 22, 360 / 2 ** 23
+    lat, lon = 23.211987018585205, 72.68681287765503
+    assert location_key(lat, lon) == "Location_ts5sn18gt"
+    assert location_key(lat + 0.3 * cell_lat, lon - 0.3 * cell_lon) == "Location_ts5sn18gt"
+    assert location_key(lat, lon, "library") == "library_ts5sn18gt"
+    assert location_key(lat + cell_lat, lon) == "Location_ts5sn18gv"
+    assert location_key(lat, lon, precision=6) == "Location_ts5sn1"
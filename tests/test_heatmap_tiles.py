@@ -0,0 +1,81 @@
+import os
+import threading
+import time
+from concurrent.futures import Future
+from heatmap_tiles import EMPTY_TILE, TileServer, tile_range
+from signal_surface import SurfaceEngine
+
+LOCATIONS = {
+    f"k{i}": {"latitude": 23.21 + i * 2e-4, "longitude": 72.68 + (i % 3) * 2e-4,
+              "networks": [{"ssid": "A", "signal": -50 - i}]}
+    for i in range(9)
+}
+
+def surface_tiles(engine, z):
+    west, south, east, north = engine.surface(None).bbox
+    xs, ys = tile_range((south, west, north, east), z)
+    return [(z, x, y) for x in xs for y in ys]
+
+def disk_tiles(server):
+    return sorted(os.path.relpath(os.path.join(root, name), server.directory)
+                  for root, _, names in os.walk(server.directory) for name in names)
+
+def test_tiles_outside_the_surface_are_not_cached(tmp_path):
+    server = TileServer(str(tmp_path), namespace="t")
+    engine = SurfaceEngine(LOCATIONS, version=1)
+    assert server.tile(engine, None, 16, 0, 0) is EMPTY_TILE
+    assert server.tile(engine, None, 3, 0, 7) is EMPTY_TILE
+    assert disk_tiles(server) == [] and server.renders == 0
+
+    z, x, y = surface_tiles(engine, 16)[0]
+    png = server.tile(engine, None, z, x, y)
+    assert png is not EMPTY_TILE
+    assert disk_tiles(server) == [os.path.join("1", "_all", str(z), str(x), f"{y}.png")]
+
+def test_disk_cache_keeps_the_newest_tiles(tmp_path):
+    server = TileServer(str(tmp_path), namespace="t", disk_cache_size=3)
+    engine = SurfaceEngine(LOCATIONS, version=1)
+    tiles = surface_tiles(engine, 19)
+    assert len(tiles) > 3
+    for z, x, y in tiles:
+        server.tile(engine, None, z, x, y)
+    assert disk_tiles(server) == sorted(os.path.join("1", "_all", str(z), str(x), f"{y}.png")
+                                        for z, x, y in tiles[-3:])
+
+class InlinePool:
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+    def shutdown(self, **kwargs):
+        pass
+
+def test_pyramid_stays_within_the_disk_budget(tmp_path):
+    engine = SurfaceEngine(LOCATIONS, version=1)
+    low = len(surface_tiles(engine, 14)) + len(surface_tiles(engine, 15))
+    server = TileServer(str(tmp_path), namespace="t", zooms=range(14, 20), disk_cache_size=low)
+    server._pool = InlinePool()
+    server._render_pyramid(engine, (None,))
+    assert {path.split(os.sep)[2] for path in disk_tiles(server)} <= {"14", "15"}
+
+def test_precompute_waits_for_a_quiet_period(tmp_path):
+    server = TileServer(str(tmp_path), namespace="t", quiet_period=0.3)
+    rendered = []
+    done = threading.Event()
+
+    def render(engine, ssids):
+        rendered.append((engine.version, time.monotonic()))
+        done.set()
+
+    server._render_pyramid = render
+    server._prune = lambda version: None
+    start = time.monotonic()
+    for version in range(1, 4):
+        server.precompute(SurfaceEngine(LOCATIONS, version=version))
+        time.sleep(0.1)
+    assert not rendered
+    assert done.wait(5)
+    server.close()
+    assert [version for version, _ in rendered] == [3]
+    assert rendered[0][1] - start >= 0.5
@@ -0,0 +1,83 @@
+import random
+import pytest
+from location_clusters import (POINTS_MIN_ZOOM, LocationClusters, decode_cursor, encode_cursor,
+                               locations_response)
+
+def make_locations(count, seed=3):
+    rng = random.Random(seed)
+    return {f"k{i:04d}": {"name": f"L{i}", "latitude": 23.21 + rng.uniform(-0.02, 0.02),
+                          "longitude": 72.68 + rng.uniform(-0.02, 0.02),
+                          "networks": [{"ssid": "A", "signal": rng.randint(-90, -40)}]}
+            for i in range(count)}
+
+def pages(clusters, cursor=None, **query):
+    while True:
+        page = clusters.query(cursor=cursor, **query)
+        yield page
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return
+
+def test_location_pages_cover_every_location_once_in_key_order():
+    locations = make_locations(250)
+    clusters = LocationClusters(locations, version=1)
+    keys = [location["key"] for page in pages(clusters, limit=60) for location in page["locations"]]
+    assert keys == sorted(locations)
+    assert all(page["total"] == 250 for page in pages(clusters, limit=60))
+    assert len(list(pages(clusters, limit=60))) == 5
+
+def test_cluster_pages_cover_every_location_once():
+    clusters = LocationClusters(make_locations(500), version=1)
+    all_pages = list(pages(clusters, zoom=14, limit=7))
+    found = [cluster for page in all_pages for cluster in page["clusters"]]
+    assert all(page["clustered"] for page in all_pages)
+    assert len(found) == all_pages[0]["total"] > 7
+    assert sum(cluster["count"] for cluster in found) == 500
+    assert found == clusters.query(zoom=14, limit=5000)["clusters"]
+
+def test_cursor_resumes_after_changes_between_pages():
+    locations = make_locations(100)
+    clusters = LocationClusters(locations, version=1)
+    first = clusters.query(limit=40)
+    seen = [location["key"] for location in first["locations"]]
+    clusters.apply({seen[0]: None, "k0000a": locations["k0001"], "k9999": locations["k0002"]}, version=2)
+    rest = [location["key"] for page in pages(clusters, limit=40, cursor=first["next_cursor"])
+            for location in page["locations"]]
+    # Keys after the cursor are still served once, in order; keys before it are not repeated
+    assert rest == sorted(key for key in set(locations) | {"k0000a", "k9999"} if key > seen[-1])
+
+def test_later_pages_reuse_the_ordered_viewport(monkeypatch):
+    clusters = LocationClusters(make_locations(300), version=1)
+    builds = []
+    within_bbox, cluster_cells = clusters.index.within_bbox, clusters._clusters
+    monkeypatch.setattr(clusters.index, "within_bbox", lambda *box: builds.append(box) or within_bbox(*box))
+    monkeypatch.setattr(clusters, "_clusters", lambda *args: builds.append(args) or cluster_cells(*args))
+
+    bbox = (23.19, 72.66, 23.23, 72.70)
+    keys = [location["key"] for page in pages(clusters, bbox=bbox, limit=50) for location in page["locations"]]
+    assert len(keys) == 300 and len(builds) == 1
+    assert len(list(pages(clusters, bbox=bbox, zoom=14, limit=5))) > 1 and len(builds) == 2
+
+    # Changes drop the cached viewports
+    clusters.apply({keys[0]: None}, version=2)
+    assert clusters.query(bbox=bbox, limit=50)["total"] == 299 and len(builds) == 3
+
+def test_cursor_must_match_the_zoom_level():
+    clusters = LocationClusters(make_locations(50), version=1)
+    cursor = clusters.query(zoom=12, limit=1)["next_cursor"]
+    with pytest.raises(ValueError):
+        clusters.query(zoom=13, limit=1, cursor=cursor)
+    with pytest.raises(ValueError):
+        clusters.query(zoom=POINTS_MIN_ZOOM, limit=1, cursor=cursor)
+    # Zoom levels from POINTS_MIN_ZOOM on page individual locations with the same cursors
+    cursor = clusters.query(zoom=POINTS_MIN_ZOOM, limit=1)["next_cursor"]
+    assert clusters.query(limit=1, cursor=cursor)["locations"]
+
+def test_bad_cursors_are_client_errors():
+    clusters = LocationClusters(make_locations(10), version=1)
+    assert decode_cursor(encode_cursor(None, "k0003")) == (None, "k0003")
+    for cursor, zoom in (("!!!", ""), ("bm90IGpzb24", ""), (encode_cursor(None, 5), ""),
+                         (encode_cursor(12, "k0001"), "12"), (encode_cursor(12, 3), "")):
+        body, status = locations_response(clusters, {"cursor": cursor, "zoom": zoom})
+        assert status == 400 and "cursor" in body["error"]
+    assert locations_response(clusters, {"limit": "0"})[1] == 400
@@ -0,0 +1,46 @@
+import threading
+from location_service import LocationService, LocationSource, SocketSource
+
+class ManualSource(LocationSource):
+    """Publishes the fixes a test hands it"""
+
+    name = "manual"
+    max_age = None
+
+    def __init__(self):
+        self.publish = None
+        self.started = threading.Event()
+
+    def run(self, publish, stop):
+        self.publish = publish
+        self.started.set()
+        stop.wait()
+
+def test_sources_with_the_same_name_keep_their_own_fixes():
+    first, second = SocketSource("gps-a", protocol="gpsd"), SocketSource("gps-b", protocol="gpsd")
+    service = LocationService([first, second])
+    service.publish(second.fix(23.2, 72.6, 5), second)
+    assert service.current().latitude == 23.2
+    service.publish(first.fix(23.1, 72.6, 5), first)
+    assert service.current().latitude == 23.1
+    service.publish(second.fix(23.3, 72.6, 5), second)
+    assert service.current().latitude == 23.1
+
+def test_fallback_starts_only_without_a_fix():
+    primary, fallback = ManualSource(), ManualSource()
+    service = LocationService([primary], [fallback], fallback_delay=0.2).start()
+    try:
+        assert primary.started.wait(1)
+        primary.publish(primary.fix(23.2, 72.6))
+        assert not fallback.started.wait(0.5)
+    finally:
+        service.stop()
+
+    primary, fallback = ManualSource(), ManualSource()
+    service = LocationService([primary], [fallback], fallback_delay=0.1).start()
+    try:
+        assert fallback.started.wait(1)
+        fallback.publish(fallback.fix(23.3, 72.6))
+        assert service.current().latitude == 23.3
+    finally:
+        service.stop()
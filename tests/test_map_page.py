@@ -0,0 +1,80 @@
+import json
+import re
+import shutil
+import subprocess
+import pytest
+import static_app
+
+# Runs the page script against stub Leaflet/DOM objects and the app's real
+# JSON responses; any error thrown or logged by the page fails the test
+HARNESS = r"""
+const fs = require('fs');
+const vm = require('vm');
+const script = fs.readFileSync(process.argv[2], 'utf8');
+const responses = JSON.parse(fs.readFileSync(process.argv[3], 'utf8'));
+const errors = [];
+
+function stub() {
+    const target = function() {};
+    const proxy = new Proxy(target, {
+        get(t, key) {
+            if (key === 'then') return undefined;
+            if (key === Symbol.toPrimitive) return () => '';
+            return proxy;
+        },
+        set() { return true; },
+        apply() { return proxy; },
+        construct() { return proxy; },
+    });
+    return proxy;
+}
+
+function fetch(url) {
+    const body = responses[url.split('?')[0]];
+    if (body === undefined) return Promise.reject(new Error('unexpected fetch ' + url));
+    return Promise.resolve({json: () => Promise.resolve(body)});
+}
+
+const context = vm.createContext({
+    L: stub(), document: stub(), window: stub(), Chart: stub(), EventSource: stub(),
+    Blob: stub(), URL: stub(), alert: () => {}, fetch,
+    setTimeout: () => 0, setInterval: () => 0,
+    console: {log: () => {}, error: (...args) => errors.push(args.map(String).join(' '))},
+});
+process.on('unhandledRejection', error => errors.push(String(error)));
+try {
+    vm.runInContext(script, context);
+    const scan = responses['/get_wifi'];
+    context.performWiFiScan(scan.latitude, scan.longitude);
+    context.showSignalChart(scan.wifi[0].ssid, scan.wifi[0].signal);
+    context.applyScanEvent({networks: responses['/get_all_wifi'].networks.slice(0, 2), removed_networks: [],
+                            locations: [{latitude: scan.latitude, longitude: scan.longitude}]});
+} catch (error) {
+    errors.push(String(error));
+}
+setTimeout.call(null, () => {
+    console.log(JSON.stringify(errors));
+}, 50);
+"""
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="needs node")
+def test_map_page_script_runs(tmp_path):
+    client = static_app.app.test_client()
+    page = client.get("/").get_data(as_text=True)
+    script = re.findall(r"<script>(.*?)</script>", page, re.S)[-1]
+    scan = client.post("/get_wifi", json={"lat": 23.20993867, "lon": 72.68369603}).get_json()
+    assert scan["is_stored_data"] and scan["wifi"]
+    clusters = client.get("/get_all_locations?zoom=12").get_json()
+    assert clusters["clusters"]
+    responses = {
+        "/get_wifi": scan,
+        "/get_all_wifi": client.get("/get_all_wifi").get_json(),
+        "/get_all_locations": clusters,
+    }
+    (tmp_path / "page.js").write_text(script)
+    (tmp_path / "responses.json").write_text(json.dumps(responses))
+    (tmp_path / "harness.js").write_text(HARNESS)
+    result = subprocess.run(["node", str(tmp_path / "harness.js"), str(tmp_path / "page.js"),
+                             str(tmp_path / "responses.json")], capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert json.loads(result.stdout) == []
@@ -0,0 +1,39 @@
+import json
+import threading
+from persistence import DocumentWriter
+
+def test_load_returns_a_copy_of_the_pending_document(tmp_path):
+    writer = DocumentWriter(str(tmp_path / "data.json"), flush_interval=60)
+    document = {"locations": {"a": {"networks": []}}}
+    writer.submit(document)
+    loaded = writer.load()
+    loaded["locations"]["b"] = {}
+    loaded["locations"]["a"]["networks"].append("x")
+    assert document == {"locations": {"a": {"networks": []}}}
+    writer.close()
+    assert json.loads((tmp_path / "data.json").read_text()) == document
+
+class SlowWriter(DocumentWriter):
+    def __init__(self, path):
+        super().__init__(path, flush_interval=0)
+        self.writing = threading.Event()
+        self.release = threading.Event()
+
+    def _write(self, data):
+        self.writing.set()
+        self.release.wait(5)
+        return super()._write(data)
+
+def test_load_during_a_commit_returns_a_copy_of_the_in_flight_document(tmp_path):
+    writer = SlowWriter(str(tmp_path / "data.json"))
+    document = {"locations": {"a": {}}}
+    committer = threading.Thread(target=writer.submit, args=(document,))
+    committer.start()
+    assert writer.writing.wait(5)
+    loaded = writer.load()
+    assert loaded == document and loaded is not document
+    loaded["locations"].clear()
+    writer.release.set()
+    committer.join()
+    assert writer._in_flight is None
+    assert json.loads((tmp_path / "data.json").read_text()) == {"locations": {"a": {}}}
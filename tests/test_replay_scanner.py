@@ -0,0 +1,40 @@
+import json
+import pytest
+from scanners import ReplayScanner
+
+def write_replay(path, records):
+    path.write_text("".join(json.dumps(record) + "\n" for record in records))
+    return str(path)
+
+def scan(n, lat=None):
+    record = {"networks": [{"ssid": f"scan{n}", "signal": -60}]}
+    if lat is not None:
+        record.update(latitude=lat, longitude=72.68)
+    return record
+
+def ssids(result):
+    return [network["ssid"] for network in result["networks"]]
+
+def test_one_scan_per_point_is_repeated_for_every_sample(tmp_path):
+    replay = ReplayScanner(write_replay(tmp_path / "walk.jsonl", [scan(i, 23.0 + i) for i in range(3)]), rate=0)
+    for i in range(3):
+        assert replay.location()[:2] == (23.0 + i, 72.68)
+        assert [ssids(replay.scan()) for _ in range(3)] == [[f"scan{i}"]] * 3
+    assert replay.location() is None
+    with pytest.raises(EOFError):
+        replay.scan()
+
+def test_unsampled_scans_of_a_point_are_skipped(tmp_path):
+    records = [scan(0, 23.0), scan(1, 23.0), scan(2, 23.0), scan(3, 24.0), scan(4, 24.0)]
+    replay = ReplayScanner(write_replay(tmp_path / "points.jsonl", records), rate=0)
+    assert replay.location()[0] == 23.0
+    assert ssids(replay.scan()) == ["scan0"]
+    assert replay.location()[0] == 24.0
+    assert [ssids(replay.scan()) for _ in range(3)] == [["scan3"], ["scan4"], ["scan4"]]
+
+def test_scans_without_positions_stream_in_order(tmp_path):
+    replay = ReplayScanner(write_replay(tmp_path / "plain.jsonl", [scan(i) for i in range(4)]), rate=0)
+    assert replay.location() is None
+    assert [ssids(replay.scan()) for _ in range(4)] == [[f"scan{i}"] for i in range(4)]
+    with pytest.raises(EOFError):
+        replay.scan()
@@ -0,0 +1,49 @@
+import io
+import json
+import sys
+import pytest
+from scan_helper import ScanHelperClient, serve
+from scanners import create_scanner
+
+HELPER = [sys.executable, "scan_helper.py", "--serve", "--fake", "--seed", "1"]
+
+def test_serve_answers_each_request_line():
+    requests = "\n".join(json.dumps(r) for r in ({"id": 1, "cmd": "ping"}, {"id": 2, "cmd": "scan"},
+                                                 {"id": 3, "cmd": "reboot"})) + "\nnot json\n"
+    out = io.StringIO()
+    serve(create_scanner("fake", seed=1), io.StringIO(requests), out)
+    responses = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert [r["ok"] for r in responses] == [True, True, False, False]
+    assert [r.get("id") for r in responses[:3]] == [1, 2, 3]
+    assert responses[1]["networks"] and "Unknown command" in responses[2]["error"]
+
+def test_client_talks_to_a_fake_helper_and_restarts_it():
+    client = ScanHelperClient("fake", command=HELPER)
+    try:
+        assert client.request("ping", timeout=10)["ok"]
+        assert client.scan()
+        first = client._process
+        # The helper crashes between requests; the next one starts a new helper
+        first.kill()
+        first.wait()
+        assert client.scan()
+        assert client._process is not first
+        with pytest.raises(RuntimeError, match="Unknown command"):
+            client.request("reboot", timeout=10)
+    finally:
+        client.close()
+
+def test_helper_exiting_mid_request_is_an_error_and_restarts():
+    client = ScanHelperClient("fake", command=[sys.executable, "-c", "import sys; sys.stdin.readline()"])
+    with pytest.raises(RuntimeError, match="exited"):
+        client.request("ping", timeout=10)
+    assert client._process is None
+    client.command = HELPER
+    assert client.request("ping", timeout=10)["ok"]
+    client.close()
+
+def test_silent_helper_times_out():
+    client = ScanHelperClient("fake", command=[sys.executable, "-c", "import time; time.sleep(30)"])
+    with pytest.raises(TimeoutError):
+        client.request("ping", timeout=0.5)
+    assert client._process is None
@@ -0,0 +1,34 @@
+import json
+from scan_log import ScanLog
+
+def location(lat):
+    return {"name": "L", "latitude": lat, "longitude": 72.68, "networks": []}
+
+def test_replays_log_on_top_of_snapshot(tmp_path):
+    log = ScanLog(str(tmp_path / "data.json"), compact_every=3)
+    assert not log.upsert("a", location(23.1))
+    assert not log.upsert("b", location(23.2))
+    assert log.delete("a")
+    data = log.load()
+    assert list(data["locations"]) == ["b"]
+    assert log.pending == 3
+
+    log.compact(data)
+    assert log.pending == 0
+    assert (tmp_path / "data.json.log").read_text() == ""
+    log.upsert("c", location(23.3))
+    assert sorted(ScanLog(str(tmp_path / "data.json")).load()["locations"]) == ["b", "c"]
+
+def test_torn_last_line_does_not_swallow_later_appends(tmp_path):
+    path = tmp_path / "data.json"
+    good = json.dumps({"op": "upsert", "key": "before", "location": location(23.1)})
+    (tmp_path / "data.json.log").write_text(good + "\n" + '{"op":"upsert","key":"torn"')
+
+    log = ScanLog(str(path))
+    log.upsert("after", location(23.2))
+    assert sorted(log.load()["locations"]) == ["after", "before"]
+
+def test_unreadable_line_is_skipped(tmp_path):
+    lines = [json.dumps({"op": "upsert", "key": key, "location": location(23.1)}) for key in ("a", "b")]
+    (tmp_path / "data.json.log").write_text(lines[0] + "\nnot json\n" + lines[1] + "\n")
+    assert sorted(ScanLog(str(tmp_path / "data.json")).load()["locations"]) == ["a", "b"]
@@ -0,0 +1,91 @@
+import os
+from scan_parser import parse_iw, parse_iwlist, parse_netsh
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fixtures", "scan_output")
+
+def fixture(name):
+    with open(os.path.join(FIXTURE_DIR, name)) as file:
+        return file.read()
+
+IWLIST_RELATIVE = """wlan0     Scan completed :
+          Cell 01 - Address: 00:1A:1E:4C:22:10
+                    ESSID:"relative"
+                    Mode:Master
+                    Frequency:2.437 GHz
+                    Quality:60/100  Signal level:60/100  Noise level:0/100
+                    Encryption key:on
+                    IE: WPA Version 1
+          Cell 02 - Address: 00:1A:1E:4C:22:11
+                    ESSID:"unreadable"
+                    Quality=0/70  Signal level=unknown
+                    Encryption key:off
+"""
+
+IW_ODD = """BSS 00:1a:1e:4c:22:10(on wlan0)
+\tfreq: 2437.0
+\tcapability: ESS Privacy (0x0411)
+\tsignal: -67.00 dBm
+\tSSID: campus
+\tRSN:\t * Version: 1
+\tDS Parameter set: channel 6
+BSS 00:1a:1e:4c:22:11(on wlan0)
+\tfreq: unknown
+\tsignal: -71.00 dBm
+\tSSID: no-freq
+BSS 00:1a:1e:4c:22:12(on wlan0)
+\tfreq: 2412
+\tsignal: n/a
+\tSSID: bad-signal
+BSS 00:1a:1e:4c:22:13(on wlan0)
+\tfreq: 2412
+\tsignal:
+\tSSID: empty-signal
+"""
+
+def test_iwlist_fixture():
+    networks = parse_iwlist(fixture("iwlist_campus.txt"))
+    first = networks[0]
+    assert first["ssid"] == "IITGN-SSO"
+    assert first["signal"] == -81
+    assert first["auth"] == "WPA2"
+    assert first["channel"] == 48
+    assert first["frequency"] == 5240
+    assert first["bssid"] == "00:1a:1e:4c:22:10"
+    assert first["quality"] == 41
+    assert parse_iwlist(fixture("iwlist_empty.txt")) == []
+
+def test_iwlist_relative_signal_level_and_other_layouts():
+    networks = parse_iwlist(IWLIST_RELATIVE)
+    assert [n["ssid"] for n in networks] == ["relative"]
+    relative = networks[0]
+    assert relative["signal"] == -70
+    assert relative["channel"] == 6
+    assert relative["auth"] == "WPA"
+    assert relative["quality"] == 60
+
+def test_reordered_cell_matches_the_canonical_one():
+    text = fixture("iwlist_campus.txt")
+    canonical = parse_iwlist(text)
+    # Move each cell's ESSID line to the top so the one-match layout no longer applies
+    lines = text.splitlines(keepends=True)
+    for i, line in enumerate(lines):
+        if "ESSID" in line:
+            j = max(k for k in range(i) if "Address" in lines[k])
+            lines.insert(j + 1, lines.pop(i))
+    assert parse_iwlist("".join(lines)) == canonical
+
+def test_netsh_fixture_skips_hidden_networks():
+    networks = parse_netsh(fixture("netsh_campus.txt"))
+    assert all(n["ssid"] for n in networks)
+    first = networks[0]
+    assert (first["ssid"], first["signal"], first["auth"], first["channel"]) == ("IITGN-SSO", -79, "WPA2-Enterprise", 48)
+    assert first["bssid"] == "00:1a:1e:4c:22:10"
+    assert parse_netsh(fixture("netsh_campus.txt").replace("\n", "\r\n")) == networks
+
+def test_iw_skips_unreadable_signals_and_frequencies():
+    networks = parse_iw(IW_ODD)
+    assert [n["ssid"] for n in networks] == ["campus", "no-freq"]
+    campus, no_freq = networks
+    assert (campus["signal"], campus["channel"], campus["frequency"], campus["auth"]) == (-67, 6, 2437, "WPA2")
+    assert (no_freq["signal"], no_freq["channel"]) == (-71, 0)
+    assert "frequency" not in no_freq
@@ -0,0 +1,34 @@
+from scan_pipeline import ScanPipeline
+
+def test_failed_scans_are_counted_and_skipped():
+    calls = []
+
+    def produce():
+        calls.append(len(calls))
+        if len(calls) == 6:
+            raise EOFError
+        if len(calls) % 2:
+            raise RuntimeError("scanner busy")
+        return {"scan": len(calls)}
+
+    batches = []
+    pipeline = ScanPipeline(produce, batches.append, interval=0, flush_interval=0.01)
+    assert pipeline.run(duration=5) == 2
+    assert pipeline.errors == 3
+    assert pipeline.produced == 2
+    assert [record["scan"] for batch in batches for record in batch] == [2, 4]
+
+def test_consumer_sees_records_in_order():
+    counter = iter(range(50))
+
+    def produce():
+        value = next(counter, None)
+        if value is None:
+            raise EOFError
+        return value
+
+    batches = []
+    pipeline = ScanPipeline(produce, batches.append, interval=0, batch_size=7, flush_interval=0.01)
+    pipeline.run(duration=5)
+    assert [record for batch in batches for record in batch] == list(range(50))
+    assert all(len(batch) <= 7 for batch in batches)
@@ -0,0 +1,85 @@
+import os
+import subprocess
+import scanners
+from scan_parser import DEFAULT_NOISE_FLOOR
+from scanners import InterfaceCache, NoiseFloorTable, parse_survey_dump
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fixtures", "scan_output")
+
+def fixture(name):
+    with open(os.path.join(FIXTURE_DIR, name)) as file:
+        return file.read()
+
+def test_parse_survey_dump():
+    noise, in_use = parse_survey_dump(fixture("iw_survey_campus.txt"))
+    # 2462 MHz reported no noise, so channel 11 is left out
+    assert noise == {1: -92, 6: -89, 36: -101}
+    assert in_use == -89
+    assert parse_survey_dump("") == ({}, None)
+
+def add_interface(root, name, wireless):
+    os.makedirs(root / name / ("wireless" if wireless else "statistics"))
+
+def test_interface_cache_rediscovers_only_when_interfaces_change(tmp_path, monkeypatch):
+    monkeypatch.setattr(scanners, "SYS_CLASS_NET", str(tmp_path))
+    discoveries = []
+    discover = scanners.wireless_interfaces
+    monkeypatch.setattr(scanners, "wireless_interfaces", lambda: discoveries.append(1) or discover())
+    add_interface(tmp_path, "eth0", False)
+    cache = InterfaceCache()
+    assert cache.get() is None
+
+    add_interface(tmp_path, "wlan1", True)
+    assert cache.get() == "wlan1"
+    assert cache.get() == "wlan1"
+    assert len(discoveries) == 2
+
+    # An adapter plugged in changes the set, so the choice is made again
+    add_interface(tmp_path, "wlan0", True)
+    assert cache.get() == "wlan0"
+    assert len(discoveries) == 3
+
+    # A failed scan drops the cached choice even if nothing changed
+    cache.invalidate()
+    assert cache.get() == "wlan0"
+    assert len(discoveries) == 4
+
+def test_noise_floor_table_refreshes_after_its_ttl(monkeypatch):
+    now = [100.0]
+    surveys = []
+
+    def check_output(command, stderr=None):
+        surveys.append(command)
+        return fixture("iw_survey_campus.txt").encode()
+
+    monkeypatch.setattr(scanners.time, "monotonic", lambda: now[0])
+    monkeypatch.setattr(scanners.subprocess, "check_output", check_output)
+    table = NoiseFloorTable(ttl=60)
+    assert table.for_interface("wlan0").get(1) == -92
+    now[0] += 59
+    table.for_interface("wlan0")
+    assert len(surveys) == 1
+    now[0] += 1
+    table.for_interface("wlan0")
+    assert len(surveys) == 2
+    # Another interface is surveyed at once
+    table.for_interface("wlan1")
+    assert surveys[-1] == ["iw", "dev", "wlan1", "survey", "dump"]
+
+def test_noise_floor_falls_back_for_unknown_channels(monkeypatch):
+    monkeypatch.setattr(scanners.subprocess, "check_output", lambda *a, **k: fixture("iw_survey_campus.txt").encode())
+    table = NoiseFloorTable().for_interface("wlan0")
+    # Unreported channels get the noise on the channel in use
+    assert table.get(11) == -89 and table.get(149) == -89 and table.get(None) == -89
+
+    def fail(*args, **kwargs):
+        raise subprocess.CalledProcessError(1, "iw")
+
+    monkeypatch.setattr(scanners.subprocess, "check_output", fail)
+    table.refresh("wlan0")
+    assert table.get(6) == DEFAULT_NOISE_FLOOR
+
+    no_in_use = "\n".join(line for line in fixture("iw_survey_campus.txt").splitlines() if "[in use]" not in line)
+    monkeypatch.setattr(scanners.subprocess, "check_output", lambda *a, **k: no_in_use.encode())
+    table.refresh("wlan0")
+    assert table.get(36) == -101 and table.get(11) == DEFAULT_NOISE_FLOOR
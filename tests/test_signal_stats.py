@@ -0,0 +1,162 @@
+import statistics
+
+import pytest
+
+import signal_stats
+from signal_stats import RunningStats, SampleAggregator, collect_samples
+
+SIGNALS = [-67, -71, -64, -80, -69, -73, -66, -70, -75, -68, -72, -65]
+
+def network(ssid, bssid, signal, **extra):
+    sample = dict({"ssid": ssid, "signal": signal, "snr": signal + 95}, **extra)
+    if bssid:
+        sample["bssid"] = bssid
+    return sample
+
+def running(values):
+    stats = RunningStats()
+    for value in values:
+        stats.add(value)
+    return stats
+
+def test_running_stats_match_the_statistics_module():
+    stats = running(SIGNALS)
+    assert stats.count == len(SIGNALS)
+    assert stats.mean == pytest.approx(statistics.mean(SIGNALS))
+    assert stats.variance == pytest.approx(statistics.variance(SIGNALS))
+    assert stats.stdev == pytest.approx(statistics.stdev(SIGNALS))
+    assert stats.standard_error == pytest.approx(statistics.stdev(SIGNALS) / len(SIGNALS) ** 0.5)
+    assert (stats.min, stats.max) == (min(SIGNALS), max(SIGNALS))
+    assert stats.median in (statistics.median_low(SIGNALS), statistics.median_high(SIGNALS))
+
+def test_running_stats_with_too_few_values():
+    assert running([]).mean == 0.0
+    assert running([]).median is None
+    single = running([-70])
+    assert (single.variance, single.stdev, single.standard_error) == (None, None, None)
+    assert single.median == -70
+
+def test_running_stats_percentiles_are_nearest_rank():
+    stats = running(SIGNALS)
+    ordered = sorted(SIGNALS)
+    assert stats.percentile(0) == ordered[0]
+    assert stats.percentile(10) == ordered[1]
+    assert stats.percentile(90) == ordered[10]
+    assert stats.percentile(100) == ordered[-1]
+
+def test_aggregator_merges_samples_per_bssid():
+    aggregator = SampleAggregator()
+    for i, signal in enumerate(SIGNALS):
+        aggregator.add_sample([
+            network("campus", "aa:aa:aa:aa:aa:01", signal, auth="WPA2", channel=6, frequency=2437),
+            # A second AP of the same SSID, 10 dB weaker throughout
+            network("campus", "aa:aa:aa:aa:aa:02", signal - 10, auth="WPA2", channel=11),
+            # Seen in every other scan only
+            *([network("guest", None, -85 + i % 3, auth="Open", channel=1)] if i % 2 else []),
+        ])
+    aggregator.add_sample([])
+    assert (aggregator.scans, aggregator.samples) == (len(SIGNALS) + 1, len(SIGNALS))
+
+    campus, guest = aggregator.results()
+    assert campus["bssid"] == "aa:aa:aa:aa:aa:01"
+    assert campus["signal"] == int(statistics.mean(SIGNALS))
+    assert campus["snr"] == int(statistics.mean(s + 95 for s in SIGNALS))
+    assert campus["samples"] == len(SIGNALS)
+    assert campus["signal_variance"] == int(statistics.stdev(SIGNALS))
+    assert (campus["signal_min"], campus["signal_max"]) == (min(SIGNALS), max(SIGNALS))
+    assert campus["signal_stderr"] == round(statistics.stdev(SIGNALS) / len(SIGNALS) ** 0.5, 2)
+    # Auth/channel/frequency come from the strongest sample of the chosen AP
+    assert (campus["auth"], campus["channel"], campus["frequency"]) == ("WPA2", 6, 2437)
+
+    guest_signals = [-85 + i % 3 for i in range(len(SIGNALS)) if i % 2]
+    assert guest["samples"] == len(guest_signals)
+    assert guest["signal"] == int(statistics.mean(guest_signals))
+    assert "bssid" not in guest
+
+def test_single_sample_has_no_spread_fields():
+    aggregator = SampleAggregator()
+    aggregator.add_sample([network("campus", "aa:aa:aa:aa:aa:01", -70, signal_percent=60, quality=60)])
+    [result] = aggregator.results()
+    assert result == {
+        "ssid": "campus", "signal": -70, "signal_percent": 60, "auth": "Unknown", "channel": 0,
+        "noise_floor": -95, "snr": 25, "samples": 1, "bssid": "aa:aa:aa:aa:aa:01", "quality": 60,
+    }
+
+class FakeClock:
+    """Stands in for signal_stats.time: sleep() only advances monotonic()"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+class FakeScanner:
+    """Returns one scan per call from `signals`, repeating the last one; each scan takes `duration`"""
+
+    def __init__(self, clock, signals, duration=1.0):
+        self.clock = clock
+        self.signals = signals
+        self.duration = duration
+        self.calls = 0
+
+    def __call__(self):
+        signal = self.signals[min(self.calls, len(self.signals) - 1)]
+        self.calls += 1
+        self.clock.now += self.duration
+        return [network("campus", "aa:aa:aa:aa:aa:01", signal)]
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(signal_stats, "time", clock)
+    return clock
+
+def test_fixed_sampling_takes_exactly_samples_scans(clock):
+    scan = FakeScanner(clock, [-70, -90, -50, -70])
+    aggregator = collect_samples(scan, samples=3, delay=0.5)
+    assert scan.calls == aggregator.scans == 3
+    # Sleeps between scans only, not after the last one
+    assert clock.sleeps == [0.5, 0.5]
+
+def test_adaptive_sampling_takes_at_least_samples_scans(clock):
+    # Identical readings converge after two scans, but the minimum is five
+    scan = FakeScanner(clock, [-70])
+    aggregator = collect_samples(scan, samples=5, delay=0, tolerance=1)
+    assert aggregator.converged(1)
+    assert scan.calls == 5
+
+def test_adaptive_sampling_stops_once_within_tolerance(clock):
+    signals = [-60, -80, -70, -70, -70, -70, -70, -70, -70, -70, -70, -70]
+    scan = FakeScanner(clock, signals)
+    aggregator = collect_samples(scan, samples=2, delay=0, tolerance=3, max_samples=50)
+    # Standard error after 2..6 readings: 10.0, 5.77, 4.08, 3.16, 2.58
+    assert scan.calls == 6
+    assert aggregator.converged(3)
+    stats = aggregator.networks["aa:aa:aa:aa:aa:01"].signal
+    assert stats.standard_error == pytest.approx(statistics.stdev(signals[:6]) / 6 ** 0.5)
+
+def test_adaptive_sampling_stops_at_max_samples(clock):
+    # Alternating readings never get within 0.1 dB
+    scan = FakeScanner(clock, [-60, -80] * 20)
+    aggregator = collect_samples(scan, samples=3, delay=0, tolerance=0.1, max_samples=8)
+    assert scan.calls == 8
+    assert not aggregator.converged(0.1)
+
+def test_max_samples_never_cuts_below_samples(clock):
+    scan = FakeScanner(clock, [-60, -80] * 20)
+    collect_samples(scan, samples=6, delay=0, tolerance=0.1, max_samples=4)
+    assert scan.calls == 6
+
+def test_adaptive_sampling_stops_at_max_time(clock):
+    # Each scan takes 1s and each pause 0.5s: scans end at 1, 2.5, 4, 5.5, ...
+    scan = FakeScanner(clock, [-60, -80] * 20)
+    aggregator = collect_samples(scan, samples=2, delay=0.5, tolerance=0.1, max_samples=50, max_time=5)
+    assert scan.calls == 4
+    assert clock.now == 5.5
+    assert not aggregator.converged(0.1)
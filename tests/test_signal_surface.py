@@ -0,0 +1,33 @@
+import pytest
+from location_clusters import LocationClusters, locations_response
+from signal_surface import WORLD_BBOX, SurfaceEngine, parse_bbox, point_response, surface_response
+
+LOCATIONS = {
+    f"k{i}": {"latitude": 23.21 + i * 1e-4, "longitude": 72.68, "networks": [{"ssid": "A", "signal": -50 - i}]}
+    for i in range(5)
+}
+
+@pytest.mark.parametrize("text", ["-inf,0,inf,1", "0,nan,1,1", "0,0,1e400,1", "1,0,0,1", "0,0,1", "a,b,c,d",
+                                  "190,0,200,1", "0,86,1,89"])
+def test_rejects_bad_boxes(text):
+    with pytest.raises(ValueError):
+        parse_bbox(text)
+
+def test_clamps_to_the_world():
+    assert parse_bbox("-400,-89,400,89") == WORLD_BBOX
+    assert parse_bbox("170,10,190,20") == (10.0, 170.0, 20.0, 180.0)
+    assert parse_bbox("72.6,23.2,72.7,23.3") == (23.2, 72.6, 23.3, 72.7)
+
+def test_non_finite_requests_are_client_errors():
+    engine = SurfaceEngine(LOCATIONS, version=1)
+    assert surface_response(engine, {"bbox": "-inf,0,inf,1"})[1] == 400
+    assert surface_response(engine, {"resolution": "inf"})[1] == 400
+    assert point_response(engine, {"lat": "nan", "lon": "72.68"})[1] == 400
+    clusters = LocationClusters(LOCATIONS, version=1)
+    assert locations_response(clusters, {"bbox": "-inf,-inf,inf,inf"})[1] == 400
+
+def test_world_box_finds_every_location():
+    body, status = locations_response(LocationClusters(LOCATIONS, version=1), {"bbox": "-720,-90,720,90"})
+    assert status == 200 and body["total"] == len(LOCATIONS)
+    body, status = surface_response(SurfaceEngine(LOCATIONS, version=1), {"bbox": "72.67,23.2,72.69,23.22"})
+    assert status == 200
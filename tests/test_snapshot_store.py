@@ -0,0 +1,114 @@
+import random
+import numpy as np
+import pytest
+from sharded_map import ShardedMap
+from snapshot_store import SnapshotStore
+from signal_surface import SurfaceEngine
+from location_clusters import LocationClusters
+from spatial_index import build_location_index
+from ssid_index import build_observation_index
+
+def make_location(rng, ssids):
+    return {
+        "latitude": 23.21 + rng.uniform(-0.01, 0.01),
+        "longitude": 72.68 + rng.uniform(-0.01, 0.01),
+        "timestamp": "2024-01-01 00:00:00",
+        "networks": [{"ssid": ssid, "signal": rng.randint(-90, -30)} for ssid in ssids],
+    }
+
+def make_data(rng, count):
+    return {"locations": {f"k{i}": make_location(rng, rng.sample("ABCDEFGH", 3)) for i in range(count)}}
+
+def test_update_shares_untouched_shards():
+    rng = random.Random(1)
+    store = SnapshotStore(make_data(rng, 5000))
+    before = store.get()
+    after = store.update({"k1": make_location(rng, "A"), "k2": None, "new": make_location(rng, "B")})
+    assert after.version == before.version + 1
+    assert after.locations.shared_shards(before.locations) >= len(before.locations._shards) - 3
+    assert len(after.locations) == 5000 and "k2" not in after.locations and "new" in after.locations
+    # The old snapshot still sees its own version
+    assert len(before.locations) == 5000 and "k2" in before.locations and "new" not in before.locations
+    assert after.document()["locations"] == dict(after.locations)
+
+def test_sharded_map_lengths():
+    locations = ShardedMap({"a": 1, "b": 2}, shards=4)
+    updated = locations.updated({"a": 3, "b": None, "c": 4, "d": None})
+    assert len(updated) == 2 and updated.to_dict() == {"a": 3, "c": 4}
+    assert locations.to_dict() == {"a": 1, "b": 2}
+
+def test_carried_forward_views_match_a_rebuild():
+    rng = random.Random(2)
+    store = SnapshotStore(make_data(rng, 500))
+    first = store.get()
+    first.location_index(), first.location_clusters(), first.surface_engine().samples("A")
+    first.observation_index()
+    for _ in range(20):
+        changes = {f"k{rng.randrange(600)}": make_location(rng, rng.sample("ABCDEFGHI", 2)) for _ in range(10)}
+        changes.update({f"k{rng.randrange(600)}": None for _ in range(3)})
+        snapshot = store.update(changes)
+    locations = snapshot.locations.to_dict()
+    # Carried forward rather than rebuilt
+    assert snapshot._index is not None and snapshot._observations is not None
+
+    rebuilt = build_location_index(locations)
+    assert sorted(key for key, _, _, _ in snapshot.location_index().within_bbox(-90, -180, 90, 180)) == \
+        sorted(key for key, _, _, _ in rebuilt.within_bbox(-90, -180, 90, 180))
+
+    clusters = snapshot.location_clusters()
+    assert clusters.version == snapshot.version
+    fresh = LocationClusters(locations, snapshot.version)
+    for zoom in (None, 12, 15):
+        got, want = clusters.query(zoom=zoom, limit=5000), fresh.query(zoom=zoom, limit=5000)
+        assert got["total"] == want["total"]
+        if zoom is None:
+            assert got["locations"] == want["locations"]
+        for a, b in zip(got["clusters"], want["clusters"]):
+            assert a["count"] == b["count"] and a["best_signal"] == b["best_signal"]
+            assert a["latitude"] == pytest.approx(b["latitude"])
+
+    observations, rebuilt_observations = snapshot.observation_index(), build_observation_index(locations)
+    for name in "ABCDEFGHI":
+        assert observations.lookup(name) == rebuilt_observations.lookup(name)
+
+    engine = snapshot.surface_engine()
+    assert engine.version == snapshot.version
+    rebuilt_engine = SurfaceEngine(locations, snapshot.version)
+    assert engine.ssids() == rebuilt_engine.ssids()
+    for ssid in engine.ssids() + [None]:
+        got = sorted(zip(*engine.samples(ssid)))
+        want = sorted(zip(*rebuilt_engine.samples(ssid)))
+        assert np.allclose(got, want)
+
+def snapshot_views(snapshot):
+    """What each derived view of a snapshot returns for the whole world"""
+    index = sorted(key for key, _, _, _ in snapshot.location_index().within_bbox(-90, -180, 90, 180))
+    page = snapshot.location_clusters().query(limit=5000)
+    clusters = sorted(location["key"] for location in page["locations"])
+    observations = {name: snapshot.observation_index().lookup(name) for name in "ABCDEFGHI"}
+    return index, clusters, observations
+
+def test_old_snapshot_views_are_unchanged_by_updates():
+    rng = random.Random(3)
+    store = SnapshotStore(make_data(rng, 300))
+    old = store.get()
+    expected = snapshot_views(old)
+    for _ in range(10):
+        changes = {f"k{rng.randrange(400)}": make_location(rng, rng.sample("ABCDEFGHI", 2)) for _ in range(10)}
+        changes.update({f"k{rng.randrange(300)}": None for _ in range(5)})
+        store.update(changes)
+    assert store.get().locations.to_dict() != old.locations.to_dict()
+
+    # A reader that kept the old snapshot sees only its locations through every view
+    assert snapshot_views(old) == expected
+    index, clusters, observations = expected
+    assert index == clusters == sorted(old.locations)
+    for name, (total, refs) in observations.items():
+        for key, position in refs:
+            assert old.locations[key]["networks"][position]["ssid"] == name
+    assert old.location_index().nearest(23.21, 72.68, 5000)[1] in old.locations
+
+    # And the current snapshot's views match its own locations
+    current = store.get()
+    index, clusters, _ = snapshot_views(current)
+    assert index == clusters == sorted(current.locations)
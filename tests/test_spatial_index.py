@@ -0,0 +1,89 @@
+import math
+import random
+from geo import EARTH_RADIUS, haversine
+from spatial_index import SpatialIndex
+
+def brute_force(points, lat, lon, radius):
+    return sorted(key for key, (p_lat, p_lon) in points.items() if haversine(lat, lon, p_lat, p_lon) <= radius)
+
+def test_point_just_inside_radius_across_a_cell_boundary():
+    index = SpatialIndex(cell_size=50)
+    # The query sits at the top of its cell and the point 99.9 m north, two
+    # cells and a bit away; radius / cell_size is exactly 2
+    lat = (460000 + 0.9999) * index.cell_deg
+    point_lat = lat + math.degrees(99.9 / EARTH_RADIUS)
+    index.insert("north", point_lat, 72.0)
+    assert [key for _, key, _ in index.within_radius(lat, 72.0, 100)] == ["north"]
+
+def test_longitude_span_at_high_latitude():
+    index = SpatialIndex(cell_size=50)
+    lat, lon = 69.9995, 20.0
+    # Due east along the parallel the circle reaches its widest longitude
+    # north of the query latitude
+    points = {}
+    for i in range(400):
+        bearing = random.Random(i).uniform(0, 2 * math.pi)
+        d = 95 + i % 5
+        p_lat = lat + math.degrees(d * math.cos(bearing) / EARTH_RADIUS)
+        p_lon = lon + math.degrees(d * math.sin(bearing) / (EARTH_RADIUS * math.cos(math.radians(p_lat))))
+        points[f"p{i}"] = (p_lat, p_lon)
+        index.insert(f"p{i}", p_lat, p_lon)
+    assert sorted(key for _, key, _ in index.within_radius(lat, lon, 100)) == brute_force(points, lat, lon, 100)
+
+def test_matches_brute_force():
+    rng = random.Random(7)
+    index = SpatialIndex(cell_size=25)
+    points = {}
+    for i in range(2000):
+        points[i] = (23.21 + rng.uniform(-0.005, 0.005), 72.68 + rng.uniform(-0.005, 0.005))
+        index.insert(i, *points[i])
+    for _ in range(50):
+        lat, lon = 23.21 + rng.uniform(-0.005, 0.005), 72.68 + rng.uniform(-0.005, 0.005)
+        for radius in (10, 25, 50, 75, 100, 300):
+            found = index.within_radius(lat, lon, radius)
+            assert sorted(key for _, key, _ in found) == brute_force(points, lat, lon, radius)
+            assert [d for d, _, _ in found] == sorted(d for d, _, _ in found)
+
+def test_nearest_and_replace():
+    index = SpatialIndex()
+    index.insert("a", 23.21, 72.68, "payload")
+    index.insert("b", 23.2101, 72.68)
+    assert index.nearest(23.21, 72.68, 50)[1:] == ("a", "payload")
+    index.insert("a", 23.3, 72.68)
+    assert index.nearest(23.21, 72.68, 50)[1] == "b"
+    index.remove("b")
+    assert index.nearest(23.21, 72.68, 50) is None
+    assert len(index) == 1
+
+def test_columns_follow_removes_and_reinserts():
+    rng = random.Random(3)
+    index = SpatialIndex(cell_size=25)
+    points = {}
+    for step in range(3000):
+        key = rng.randrange(500)
+        if rng.random() < 0.3:
+            index.remove(key)
+            points.pop(key, None)
+        else:
+            points[key] = (23.21 + rng.uniform(-0.002, 0.002), 72.68 + rng.uniform(-0.002, 0.002))
+            index.insert(key, *points[key], payload=step)
+    assert len(index) == len(points)
+    for key, (lat, lon) in points.items():
+        assert index.get(key)[:2] == (lat, lon)
+    assert sorted(key for _, key, _ in index.within_radius(23.21, 72.68, 150)) == brute_force(points, 23.21, 72.68, 150)
+    inside = sorted(key for key, lat, lon, _ in index.within_bbox(23.209, 72.679, 23.211, 72.681))
+    assert inside == sorted(key for key, (lat, lon) in points.items()
+                            if 23.209 <= lat <= 23.211 and 72.679 <= lon <= 72.681)
+
+def test_copies_change_independently():
+    index = SpatialIndex(cell_size=50)
+    for i in range(20):
+        index.insert(i, 23.21 + i * 1e-4, 72.68)
+    copy = index.updated({3: None, 4: {"latitude": 23.3, "longitude": 72.7}, 99: {"latitude": 23.2102, "longitude": 72.68}})
+    # Points in the original's cells, removed or added by the copy, stay as they were in the original
+    index.remove(5)
+    index.insert(98, 23.2101, 72.68)
+    everything = (-90, -180, 90, 180)
+    assert sorted(key for key, _, _, _ in index.within_bbox(*everything)) == sorted(set(range(20)) - {5} | {98})
+    assert sorted(key for key, _, _, _ in copy.within_bbox(*everything)) == sorted(set(range(20)) - {3} | {99})
+    assert index.get(4)[:2] == (23.2104, 72.68) and copy.get(4)[:2] == (23.3, 72.7)
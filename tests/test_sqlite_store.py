@@ -0,0 +1,70 @@
+import json
+import math
+import sqlite3
+from geo import EARTH_RADIUS
+from sqlite_store import SQLiteStore
+from ssid_index import build_observation_index
+
+LOCATIONS = {
+    "a": {"name": "A", "latitude": 23.21, "longitude": 72.68, "timestamp": "2025-04-10T10:00:00",
+          "networks": [{"ssid": "IITGN", "signal": -60, "bssid": "aa:bb:cc:dd:ee:01"},
+                       {"ssid": "Guest", "signal": -80}]},
+    "b": {"name": "B", "latitude": 23.22, "longitude": 72.69, "timestamp": "2025-04-11T10:00:00",
+          "networks": [{"ssid": "IITGN", "signal": -70, "bssid": "aa:bb:cc:dd:ee:02"}]},
+}
+
+def json_lookup(name):
+    index = build_observation_index(LOCATIONS)
+    total, refs = index.lookup(name)
+    return total, [LOCATIONS[key]["networks"][position] for key, position in refs]
+
+def sqlite_lookup(store, name):
+    total, matches = store.ssid_observations(name)
+    return total, [network for _, network in matches]
+
+def test_round_trip(tmp_path):
+    store = SQLiteStore(str(tmp_path / "data.db"))
+    store.save({"locations": json.loads(json.dumps(LOCATIONS)), "metadata": {}})
+    assert store.load()["locations"] == LOCATIONS
+    store.close()
+
+def test_observations_match_json_index(tmp_path):
+    store = SQLiteStore(str(tmp_path / "data.db"))
+    store.save({"locations": json.loads(json.dumps(LOCATIONS)), "metadata": {}})
+    for name in ("IITGN", "Guest", "aa:bb:cc:dd:ee:02", "missing"):
+        assert sqlite_lookup(store, name) == json_lookup(name)
+    store.close()
+
+def test_migrates_bssid_out_of_extra(tmp_path):
+    path = str(tmp_path / "old.db")
+    store = SQLiteStore(path)
+    store.save({"locations": json.loads(json.dumps(LOCATIONS)), "metadata": {}})
+    store.close()
+    # Rebuild the table the way earlier versions laid it out: BSSID in `extra`
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute("UPDATE observations SET extra = json_object('bssid', bssid) WHERE bssid IS NOT NULL")
+        conn.execute("DROP INDEX idx_observations_bssid")
+        conn.execute("ALTER TABLE observations DROP COLUMN bssid")
+    conn.close()
+
+    store = SQLiteStore(path)
+    assert sqlite_lookup(store, "aa:bb:cc:dd:ee:01") == json_lookup("aa:bb:cc:dd:ee:01")
+    assert store.load()["locations"] == LOCATIONS
+    store.close()
+
+def test_nearest_finds_points_at_the_edge_of_the_radius(tmp_path):
+    lat, lon = 23.21, 72.68
+    north = lat + math.degrees(999.5 / EARTH_RADIUS)
+    # Due east along the circle's highest parallel, 999.5 m away
+    ratio = math.sin(999.5 / (2 * EARTH_RADIUS)) / math.cos(math.radians(lat))
+    east = lon + math.degrees(2 * math.asin(ratio))
+    for name, point in (("north", (north, lon)), ("east", (lat, east))):
+        store = SQLiteStore(str(tmp_path / f"{name}.db"))
+        store.save({"locations": {name: {"name": name, "latitude": point[0], "longitude": point[1],
+                                         "networks": []}}, "metadata": {}})
+        match = store.nearest(lat, lon, 1000)
+        assert match is not None and match[1] == name
+        assert 999 < match[0] <= 1000
+        assert store.nearest(lat, lon, 999) is None
+        store.close()
@@ -0,0 +1,65 @@
+from ssid_index import build_observation_index, build_ssid_aggregates, observations_response, verify_ssid_aggregates
+
+def location(timestamp, *ssids):
+    return {"name": timestamp, "latitude": 23.1, "longitude": 72.68, "timestamp": timestamp,
+            "networks": [{"ssid": ssid, "bssid": f"{ssid}-ap", "signal": -60} for ssid in ssids]}
+
+def snapshot(index):
+    return {name: index.lookup(name) for name in ("home", "home-ap", "cafe", "office")}
+
+def test_update_locations_matches_a_rebuild():
+    before = {"a": location("2025-04-10T09:00", "home", "cafe"),
+              "b": location("2025-04-11T09:00", "home"),
+              "c": location("2025-04-12T09:00", "office")}
+    after = dict(before)
+    del after["a"]
+    after["b"] = location("2025-04-11T09:00", "cafe", "home")
+    after["d"] = location("2025-04-13T09:00", "home")
+
+    index = build_observation_index(before)
+    assert index.update_locations(before, after) == 2
+    assert snapshot(index) == snapshot(build_observation_index(after))
+
+def test_updated_leaves_the_original_index_unchanged():
+    before = {"a": location("2025-04-10T09:00", "home", "cafe"),
+              "b": location("2025-04-11T09:00", "home")}
+    index = build_observation_index(before)
+    expected = snapshot(index)
+    successor = index.updated({"a": None, "b": location("2025-04-11T09:00", "cafe", "home"),
+                               "c": location("2025-04-12T09:00", "office")})
+    assert snapshot(index) == expected
+    assert snapshot(successor) == snapshot(build_observation_index(
+        {"b": location("2025-04-11T09:00", "cafe", "home"), "c": location("2025-04-12T09:00", "office")}))
+
+def test_aggregates_update_locations_matches_a_rebuild():
+    before = {"a": location("2025-04-10T09:00", "home", "cafe"),
+              "b": location("2025-04-11T09:00", "home"),
+              "c": location("2025-04-12T09:00", "office")}
+    after = dict(before)
+    del after["a"]
+    after["b"] = location("2025-04-11T09:00", "cafe", "home")
+    after["b"]["networks"][0]["signal"] = -40
+    after["d"] = location("2025-04-13T09:00", "home")
+
+    aggregates = build_ssid_aggregates(before)
+    assert aggregates.update_locations(before, after) == 3
+    assert verify_ssid_aggregates(aggregates, after)
+    assert sorted(aggregates.networks(), key=lambda n: n["ssid"]) == \
+        sorted(build_ssid_aggregates(after).networks(), key=lambda n: n["ssid"])
+
+def test_lookup_filters_by_time_and_pages():
+    locations = {f"k{day:02d}": location(f"2025-04-{day:02d}T09:00", "home") for day in range(1, 11)}
+    index = build_observation_index(locations)
+
+    total, refs = index.lookup("home", since="2025-04-03", until="2025-04-06", offset=1, limit=2)
+    assert total == 4
+    assert refs == [("k04", 0), ("k05", 0)]
+    assert index.lookup("home-ap")[0] == 10
+    assert index.lookup("nobody") == (0, [])
+
+def test_observations_response():
+    assert observations_response("x", 0, [], 0, None)[1] == 404
+    loc = location("2025-04-01T09:00", "home")
+    body, status = observations_response("home", 1, [(loc, loc["networks"][0])], 0, None)
+    assert status == 200
+    assert body["locations"] == 1 and body["data"][0]["signal"] == -60
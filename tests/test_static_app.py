@@ -0,0 +1,47 @@
+import json
+import os
+import static_app
+
+def location(lat, *ssids):
+    return {"name": "L", "latitude": lat, "longitude": 72.68, "timestamp": "2025-04-10T09:00",
+            "networks": [{"ssid": ssid, "signal": -60, "auth": "WPA2", "channel": 6} for ssid in ssids]}
+
+def write(path, locations):
+    tmp = f"{path}.new"
+    with open(tmp, 'w') as file:
+        json.dump({"locations": locations, "metadata": {}}, file)
+    os.replace(tmp, path)
+
+def use_file(monkeypatch, path):
+    monkeypatch.setattr(static_app, "WIFI_DATA_FILE", str(path))
+    for name in ("data_cache", "ssid_aggregates", "ssid_aggregates_source"):
+        monkeypatch.setattr(static_app, name, None)
+
+def test_reload_updates_the_aggregates_in_place(tmp_path, monkeypatch):
+    path = tmp_path / "wifi_data.json"
+    write(path, {"a": location(23.21, "home", "cafe"), "b": location(23.22, "home")})
+    use_file(monkeypatch, path)
+    aggregates = static_app.get_ssid_aggregates()
+    assert sorted(aggregates.ssids()) == ["cafe", "home"]
+
+    write(path, {"b": location(23.22, "home", "office"), "c": location(23.23, "office")})
+    assert static_app.get_ssid_aggregates() is aggregates
+    assert sorted(aggregates.ssids()) == ["home", "office"]
+    response = static_app.app.test_client().get("/stats?verify=1").get_json()
+    assert response["aggregates_verified"] and response["unique_networks"] == 2
+
+def test_network_details_read_locations_and_index_from_one_load(monkeypatch):
+    old = {"locations": {"a": location(23.21, "home")}, "metadata": {}}
+    new = {"locations": {"b": location(23.22, "home"), "c": location(23.23, "home")}, "metadata": {}}
+    loads = [old]
+    monkeypatch.setattr(static_app, "WIFI_DATA_FILE", "wifi_data.json")
+    monkeypatch.setattr(static_app, "load_data", lambda: loads.pop(0) if len(loads) > 1 else loads[0])
+    monkeypatch.setattr(static_app, "observation_index", None)
+    monkeypatch.setattr(static_app, "observation_index_source", None)
+    static_app.get_observation_index()
+    client = static_app.app.test_client()
+    # The file is replaced while a request is being served: a second load sees the new data
+    loads[:] = [old, new]
+    response = client.get("/network/home")
+    assert response.status_code == 200 and response.get_json()["locations"] == 1
+    assert client.get("/network/home").get_json()["locations"] == 2
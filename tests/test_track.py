@@ -0,0 +1,54 @@
+import json
+from scan_log import ScanLog
+from track import Track, interpolate_positions, reproject_session, track_fix
+
+# Fixes at t=0 and t=60 in the same spot (a quiet browser tab), then a walk with a 30 s hole
+FIXES = [(0, 23.2100, 72.68), (60, 23.2100, 72.68), (65, 23.2101, 72.68), (95, 23.2200, 72.68)]
+
+def track():
+    result = Track()
+    for fix in FIXES:
+        result.add(*fix)
+    return result
+
+def test_quiet_source_holds_the_last_fix():
+    positions = track()
+    assert positions.position_at(30) == (23.21, 72.68)
+    # Moving across a gap longer than max_gap has no trustworthy position
+    assert positions.position_at(80) is None
+    assert positions.position_at(95 + 200) == (23.22, 72.68)
+    assert positions.position_at(95 + 400) is None
+    assert positions.position_at(-20) is None
+
+def test_vectorized_pass_matches_the_track():
+    times = [-20, -5, 0, 30, 62, 80, 100, 295, 495]
+    lats, lons, valid = interpolate_positions(*zip(*FIXES), times)
+    positions = track()
+    for t, lat, lon, ok in zip(times, lats.tolist(), lons.tolist(), valid.tolist()):
+        expected = positions.position_at(t)
+        assert ok == (expected is not None), t
+        if ok:
+            assert (round(lat, 9), round(lon, 9)) == tuple(round(v, 9) for v in expected)
+
+def test_only_moving_accurate_sources_go_on_the_track():
+    assert track_fix("gpsd", 4.0)
+    assert track_fix("nmea", None)
+    assert not track_fix("browser", 1500.0)
+    assert not track_fix("ip", 5000)
+    assert not track_fix("fixed", None)
+
+def test_reproject_session_appends_without_loading(tmp_path, monkeypatch):
+    fixes = tmp_path / "s_fixes.jsonl"
+    fixes.write_text("".join(json.dumps({"time": t, "latitude": lat, "longitude": lon, "accuracy": 5, "source": "gpsd"}) + "\n"
+                             for t, lat, lon in FIXES) +
+                     json.dumps({"time": 80, "latitude": 0, "longitude": 0, "accuracy": 5000, "source": "ip"}) + "\n")
+    scans = tmp_path / "s_scans.jsonl"
+    scans.write_text("".join(json.dumps({"scan_start": t - 1, "scan_end": t + 1, "networks": []}) + "\n"
+                             for t in (1000000030, 30, 80, 100)))
+    output = str(tmp_path / "out.json")
+
+    monkeypatch.setattr(ScanLog, "load", lambda self: (_ for _ in ()).throw(AssertionError("loaded")))
+    assert reproject_session(str(fixes), str(scans), output, chunk_size=2) == (2, 2)
+    monkeypatch.undo()
+    locations = ScanLog(output).load()["locations"]
+    assert sorted(round(location["latitude"], 4) for location in locations.values()) == [23.21, 23.22]
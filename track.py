@@ -0,0 +1,308 @@
+"""Position scans on a GPS track by time.
+
+In survey mode the collector records location fixes and scans as two
+independent time series instead of stamping each scan with the fix it got
+before scanning. A scan's position is the track interpolated linearly at
+the midpoint of the scan, so points taken while walking are not smeared
+back to where the scan started.
+
+Two passes share the same rules:
+
+- TrackProjector works while collecting: it holds each scan until the
+  track has a fix at or after the scan's midpoint, then places it.
+- reproject_session() re-projects a recorded session (a fixes file and a
+  scans file) in one vectorized pass, for millions of points.
+
+Only fixes from moving sources with a known accuracy go on the track (see
+track_fix); fixed and IP positions would pin the walk to one spot.
+
+Scans whose midpoint falls in a gap of more than `max_gap` seconds between
+fixes, or more than that before the first fix, have no trustworthy position
+and are dropped. The exception is a source that stops sending because it is
+standing still (a browser's watchPosition only reports movement): scans up
+to `max_hold` seconds after the last fix, or in a longer gap between two
+fixes less than STATIONARY_DISTANCE apart, are held at that fix.
+
+Usage: python track.py SESSION_fixes.jsonl SESSION_scans.jsonl [--output wifi_data.json]
+"""
+import bisect
+import collections
+import json
+import os
+import threading
+import time
+from datetime import datetime
+import numpy as np
+from geo import METERS_PER_DEGREE
+
+# Fixes further apart than this (seconds) don't bracket a scan
+MAX_GAP = 10.0
+
+# Seconds a scan is held at the last fix of a source that has gone quiet
+MAX_HOLD = 300.0
+
+# Fixes closer than this (meters) across a gap mean the surveyor stood still
+STATIONARY_DISTANCE = 5.0
+
+# Sources that follow the surveyor, and the worst accuracy (meters) put on the track
+TRACK_SOURCES = ("gpsd", "nmea", "browser")
+MAX_FIX_ACCURACY = 50.0
+
+# Seconds of track the streaming pass keeps
+TRACK_HISTORY = 600
+
+def scan_midpoint(record):
+    return (record["scan_start"] + record["scan_end"]) / 2
+
+def track_fix(source, accuracy, max_accuracy=MAX_FIX_ACCURACY):
+    """True for a fix that belongs on a survey track: a GPS or browser fix within max_accuracy meters"""
+    return source in TRACK_SOURCES and (accuracy is None or accuracy <= max_accuracy)
+
+def _displacement(lat0, lon0, lat1, lon1):
+    """Approximate meters between two nearby points; works on floats and arrays"""
+    dy = (lat1 - lat0) * METERS_PER_DEGREE
+    dx = (lon1 - lon0) * METERS_PER_DEGREE * np.cos(np.radians(lat0))
+    return np.sqrt(dx * dx + dy * dy)
+
+class Track:
+    """Time-ordered location fixes, trimmed to the last `history` seconds"""
+
+    def __init__(self, max_gap=MAX_GAP, history=TRACK_HISTORY, max_hold=MAX_HOLD):
+        self.max_gap = max_gap
+        self.max_hold = max_hold
+        self.history = history
+        self.times = []
+        self.lats = []
+        self.lons = []
+        self._lock = threading.Lock()
+
+    def add(self, timestamp, latitude, longitude):
+        with self._lock:
+            if not self.times or timestamp >= self.times[-1]:
+                i = len(self.times)
+            else:
+                i = bisect.bisect_right(self.times, timestamp)
+            self.times.insert(i, timestamp)
+            self.lats.insert(i, latitude)
+            self.lons.insert(i, longitude)
+            cutoff = bisect.bisect_left(self.times, self.times[-1] - self.history)
+            if cutoff:
+                del self.times[:cutoff], self.lats[:cutoff], self.lons[:cutoff]
+
+    def covers(self, timestamp):
+        """True once there is a fix at or after `timestamp`"""
+        with self._lock:
+            return bool(self.times) and self.times[-1] >= timestamp
+
+    def position_at(self, timestamp):
+        """Interpolated (lat, lon) at `timestamp`, or None if the track has no fix near it"""
+        with self._lock:
+            times = self.times
+            i = bisect.bisect_right(times, timestamp)
+            if i == 0:
+                if not times or times[0] - timestamp > self.max_gap:
+                    return None
+                return self.lats[0], self.lons[0]
+            if times[i - 1] == timestamp:
+                return self.lats[i - 1], self.lons[i - 1]
+            if i == len(times):
+                if timestamp - times[-1] > self.max_hold:
+                    return None
+                return self.lats[-1], self.lons[-1]
+            t0, t1 = times[i - 1], times[i]
+            if t1 - t0 > self.max_gap and (
+                    timestamp - t0 > self.max_hold or
+                    _displacement(self.lats[i - 1], self.lons[i - 1], self.lats[i], self.lons[i]) > STATIONARY_DISTANCE):
+                return None
+            w = (timestamp - t0) / (t1 - t0)
+            return (self.lats[i - 1] + w * (self.lats[i] - self.lats[i - 1]),
+                    self.lons[i - 1] + w * (self.lons[i] - self.lons[i - 1]))
+
+class TrackProjector:
+    """Streaming pass: places scan records on the track at their midpoint time.
+
+    Records are held until the track has a fix at or after their midpoint,
+    or until `max_delay` seconds have passed without one (then the last fix
+    is used if it is within the track's max_hold). push() returns the
+    records that are ready, in order, with latitude/longitude set; flush()
+    places the rest.
+    """
+
+    def __init__(self, track, max_delay=MAX_GAP):
+        self.track = track
+        self.max_delay = max_delay
+        self.pending = collections.deque()
+        self.placed = 0
+        self.dropped = 0
+
+    def push(self, records, now=None):
+        self.pending.extend(records)
+        return self._drain(time.time() if now is None else now, final=False)
+
+    def flush(self):
+        return self._drain(None, final=True)
+
+    def _drain(self, now, final):
+        ready = []
+        while self.pending:
+            record = self.pending[0]
+            midpoint = scan_midpoint(record)
+            if not final and not self.track.covers(midpoint) and now - midpoint < self.max_delay:
+                break
+            self.pending.popleft()
+            position = self.track.position_at(midpoint)
+            if position is None:
+                self.dropped += 1
+                continue
+            record["latitude"], record["longitude"] = position
+            record["timestamp"] = datetime.fromtimestamp(midpoint).isoformat()
+            self.placed += 1
+            ready.append(record)
+        return ready
+
+class SurveyRecorder:
+    """Writes a session's fixes and scans to <prefix>_fixes.jsonl and <prefix>_scans.jsonl"""
+
+    def __init__(self, directory, name=None):
+        os.makedirs(directory, exist_ok=True)
+        prefix = os.path.join(directory, name or f"survey_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}")
+        self.fixes_path = prefix + "_fixes.jsonl"
+        self.scans_path = prefix + "_scans.jsonl"
+        self._fixes = open(self.fixes_path, 'a')
+        self._scans = open(self.scans_path, 'a')
+        self._lock = threading.Lock()
+
+    def record_fix(self, fix):
+        line = json.dumps({"time": fix.timestamp, "latitude": fix.latitude, "longitude": fix.longitude,
+                           "accuracy": fix.accuracy, "source": fix.source})
+        with self._lock:
+            self._fixes.write(line + "\n")
+            self._fixes.flush()
+
+    def record_scan(self, record):
+        line = json.dumps(record)
+        with self._lock:
+            self._scans.write(line + "\n")
+            self._scans.flush()
+
+    def close(self):
+        self._fixes.close()
+        self._scans.close()
+
+def interpolate_positions(fix_times, fix_lats, fix_lons, times, max_gap=MAX_GAP, max_hold=MAX_HOLD):
+    """Vectorized Track.position_at for many times.
+
+    Returns (lats, lons, valid) arrays; entries with valid False had no fix
+    within max_gap and should be dropped.
+    """
+    order = np.argsort(fix_times, kind="stable")
+    fix_times = np.asarray(fix_times, dtype=float)[order]
+    fix_lats = np.asarray(fix_lats, dtype=float)[order]
+    fix_lons = np.asarray(fix_lons, dtype=float)[order]
+    times = np.asarray(times, dtype=float)
+    n = len(fix_times)
+    if n == 0:
+        empty = np.full(len(times), np.nan)
+        return empty, empty.copy(), np.zeros(len(times), dtype=bool)
+
+    # One binary search serves both coordinates and the gap check
+    i = np.searchsorted(fix_times, times, side="right")
+    lo = np.clip(i - 1, 0, n - 1)
+    hi = np.clip(i, 0, n - 1)
+    t0, t1 = fix_times[lo], fix_times[hi]
+    span = t1 - t0
+    # Outside the track lo == hi, so the position clamps to the end fix like the streaming pass
+    w = np.divide(times - t0, span, out=np.zeros(len(times)), where=span > 0)
+    lats = fix_lats[lo] + w * (fix_lats[hi] - fix_lats[lo])
+    lons = fix_lons[lo] + w * (fix_lons[hi] - fix_lons[lo])
+
+    stationary = (times - t0 <= max_hold) & (
+        _displacement(fix_lats[lo], fix_lons[lo], fix_lats[hi], fix_lons[hi]) <= STATIONARY_DISTANCE)
+    valid = np.where(i == 0, fix_times[0] - times <= max_gap,
+                     np.where(i == n, times - fix_times[-1] <= max_hold,
+                              (span <= max_gap) | (times == t0) | stationary))
+    return lats, lons, valid
+
+def load_fixes(path):
+    """Read a fixes file's track fixes (see track_fix) into (times, lats, lons) arrays"""
+    times, lats, lons = [], [], []
+    with open(path, 'r') as file:
+        for line in file:
+            if not line.strip():
+                continue
+            fix = json.loads(line)
+            if "source" in fix and not track_fix(fix["source"], fix.get("accuracy")):
+                continue
+            times.append(fix["time"])
+            lats.append(fix["latitude"])
+            lons.append(fix["longitude"])
+    return np.array(times), np.array(lats), np.array(lons)
+
+def _scan_chunks(path, chunk_size):
+    chunk = []
+    with open(path, 'r') as file:
+        for line in file:
+            try:
+                chunk.append(json.loads(line))
+            except ValueError:
+                # A torn last line from an interrupted session
+                continue
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+def reproject_session(fixes_path, scans_path, output, max_gap=MAX_GAP, chunk_size=100000):
+    """Place every scan of a recorded session on its track and store it in `output`.
+
+    Scans are read in chunks and written as upserts, a chunk at a time, to
+    the store's log (or its SQLite tables); the store is never loaded, so
+    sessions larger than memory are fine and only the fixes are held in
+    full. A JSON store folds the log into its snapshot the next time it is
+    compacted. Returns (placed, dropped).
+    """
+    from scan_log import open_storage
+    fix_times, fix_lats, fix_lons = load_fixes(fixes_path)
+    storage = open_storage(output)
+    placed = dropped = 0
+
+    for chunk in _scan_chunks(scans_path, chunk_size):
+        midpoints = np.fromiter((scan_midpoint(record) for record in chunk), dtype=float, count=len(chunk))
+        lats, lons, valid = interpolate_positions(fix_times, fix_lats, fix_lons, midpoints, max_gap)
+        items = []
+        for record, midpoint, lat, lon, ok in zip(chunk, midpoints.tolist(), lats.tolist(), lons.tolist(), valid.tolist()):
+            if not ok:
+                dropped += 1
+                continue
+            timestamp = datetime.fromtimestamp(midpoint).isoformat()
+            location_name = f"Survey_Scan_{timestamp}"
+            location = {
+                "name": location_name,
+                "latitude": lat,
+                "longitude": lon,
+                "timestamp": timestamp,
+                "networks": record["networks"],
+                "note": f"Survey scan placed at its midpoint from {os.path.basename(scans_path)}"
+            }
+            items.append((f"{location_name}_{timestamp}", location))
+        placed += len(items)
+        storage.upsert_many(items)
+
+    storage.close()
+    return placed, dropped
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Re-project a recorded survey session onto its GPS track')
+    parser.add_argument('fixes', help='Session fixes file (*_fixes.jsonl)')
+    parser.add_argument('scans', help='Session scans file (*_scans.jsonl)')
+    parser.add_argument('--output', '-o', default='wifi_data.json', help='Store to add the scans to (default: wifi_data.json)')
+    parser.add_argument('--max-gap', type=float, default=MAX_GAP,
+                        help=f'Largest gap between fixes to interpolate across, in seconds (default: {MAX_GAP})')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    placed, dropped = reproject_session(args.fixes, args.scans, args.output, args.max_gap)
+    print(f"Placed {placed} scans, dropped {dropped} outside the track, "
+          f"in {time.perf_counter() - start:.1f}s -> {args.output}")
@@ -1,268 +1,78 @@
-import subprocess
-import platform
-import re
-import time
-import statistics
-import json
-import os
 from datetime import datetime
 import argparse
 import sys
-import urllib.request
-import socket
-import webbrowser
+from scan_log import empty_data, open_storage
+from scan_helper import configure_scanner, get_scanner
+from scanners import SCANNER_BACKENDS
+from signal_stats import collect_samples
+from location_service import LOCATION_TIMEOUT, configure_location, get_location_service
+from persistence import FSYNC_POLICIES, configure_persistence
 
 # File where data will be stored
 DATA_FILE = 'wifi_data.json'
 
-# Function to get WiFi SSIDs and signal strength with configurable samples
-def get_wifi_networks(samples=3, delay=0.2):
-    all_samples = []
-    
-    for _ in range(samples):
-        # Get a single scan
-        networks = get_single_wifi_scan()
-        if networks:
-            all_samples.append(networks)
-        # Wait between scans
-        time.sleep(delay)
-    
-    # Aggregate results from all samples
-    return aggregate_wifi_samples(all_samples)
+# Storage behind DATA_FILE: a JSON snapshot + append-only log, or SQLite for .db files
+storage = None
 
-def get_single_wifi_scan():
-    wifi_data = []
-    os_type = platform.system()
-    
-    # Try to get noise floor (varies by system)
-    noise_floor = -95  # Default noise floor estimation in dBm
+# Adaptive sampling: with a tolerance in dB, keep scanning a point until every
+# network's RSSI standard error is within it (None = always take `samples` scans)
+SAMPLE_TOLERANCE = None
 
-    if os_type == "Windows":
-        try:
-            # Quick adapter refresh
-            subprocess.run("netsh wlan show networks mode=bssid", shell=True, stderr=subprocess.DEVNULL)
-            
-            # Get detailed info about all networks
-            output = subprocess.check_output("netsh wlan show networks mode=bssid", shell=True).decode()
-            
-            # Try to get adapter info for noise floor (might not be available)
-            try:
-                adapter_info = subprocess.check_output("netsh wlan show interfaces", shell=True).decode()
-                # If available, we might find noise floor or use RSSI to estimate it
-            except:
-                pass
-            
-            # Parse the output to extract SSIDs and signal strength
-            ssid_blocks = re.split(r"SSID \d+ : ", output)[1:]  
-            
-            for block in ssid_blocks:
-                lines = block.strip().split('\n')
-                if not lines:
-                    continue
-                    
-                ssid = lines[0].strip()
-                if not ssid:
-                    continue
-                    
-                # Find signal strength
-                signal_match = re.search(r"Signal\s*:\s*(\d+)%", block)
-                # Extract authentication type
-                auth_match = re.search(r"Authentication\s*:\s*(\S+)", block)
-                # Extract channel
-                channel_match = re.search(r"Channel\s*:\s*(\d+)", block)
-                
-                if signal_match:
-                    signal_percent = int(signal_match.group(1))
-                    # Simple conversion formula: 100% = -50dBm, 0% = -100dBm
-                    signal_dbm = int((signal_percent / 2) - 100)
-                    
-                    # Calculate SNR (Signal-to-Noise Ratio)
-                    snr = signal_dbm - noise_floor
-                    
-                    # Get authentication type
-                    auth_type = auth_match.group(1) if auth_match else "Unknown"
-                    
-                    # Get channel
-                    channel = int(channel_match.group(1)) if channel_match else 0
-                    
-                    # Add this network to our list
-                    wifi_data.append({
-                        "ssid": ssid, 
-                        "signal": signal_dbm,
-                        "signal_percent": signal_percent,
-                        "auth": auth_type,
-                        "channel": channel,
-                        "noise_floor": noise_floor,
-                        "snr": snr
-                    })
-            
-            print(f"Found {len(wifi_data)} networks in scan")
+# Budget for adaptive sampling at one point
+MAX_SAMPLES = 20
+MAX_SAMPLE_TIME = None
 
-        except Exception as e:
-            print(f"Error fetching WiFi data: {str(e)}")
+# Function to get WiFi SSIDs and signal strength with configurable samples
+def get_wifi_networks(samples=3, delay=0.2, tolerance=None, max_samples=None, max_time=None):
+    """Scan the current point and return its aggregated networks.
 
-    elif os_type == "Linux":
-        try:
-            # Try to use iwlist for Linux
-            interfaces = subprocess.check_output(["ls", "/sys/class/net"]).decode().split()
-            wifi_interface = None
-            
-            # Find the first wireless interface
-            for interface in interfaces:
-                try:
-                    output = subprocess.check_output(["iwconfig", interface], stderr=subprocess.DEVNULL).decode()
-                    if "ESSID" in output:
-                        wifi_interface = interface
-                        break
-                except:
-                    continue
-            
-            if wifi_interface:
-                # Try to get noise floor from iw survey
-                try:
-                    survey_output = subprocess.check_output(["iw", "dev", wifi_interface, "survey", "dump"], stderr=subprocess.DEVNULL).decode()
-                    noise_match = re.search(r"noise:\s*(-\d+)", survey_output)
-                    if noise_match:
-                        noise_floor = int(noise_match.group(1))
-                except:
-                    pass
-                
-                output = subprocess.check_output(["sudo", "iwlist", wifi_interface, "scan"]).decode()
-                network_sections = re.split(r"Cell \d+ - ", output)[1:]
-                
-                for section in network_sections:
-                    ssid_match = re.search(r'ESSID:"(.*?)"', section)
-                    signal_match = re.search(r"Signal level=(-?\d+) dBm", section)
-                    # Extract channel
-                    channel_match = re.search(r"Channel:(\d+)", section)
-                    # Extract encryption
-                    encryption_match = re.search(r"Encryption key:(on|off)", section)
-                    auth_match = re.search(r"IE: (?:WPA|IEEE 802.11i/WPA2|WPA2) Version \d+", section)
-                    
-                    if ssid_match and signal_match:
-                        ssid = ssid_match.group(1)
-                        signal_dbm = int(signal_match.group(1))
-                        
-                        # Calculate SNR
-                        snr = signal_dbm - noise_floor
-                        
-                        # Get channel
-                        channel = int(channel_match.group(1)) if channel_match else 0
-                        
-                        # Determine authentication type
-                        auth_type = "Open"
-                        if encryption_match and encryption_match.group(1) == "on":
-                            if auth_match:
-                                if "WPA2" in auth_match.group(0):
-                                    auth_type = "WPA2"
-                                else:
-                                    auth_type = "WPA"
-                            else:
-                                auth_type = "WEP"
-                        
-                        # Calculate approximate percentage
-                        signal_percent = max(0, min(100, 2 * (signal_dbm + 100)))
-                        
-                        wifi_data.append({
-                            "ssid": ssid, 
-                            "signal": signal_dbm,
-                            "signal_percent": signal_percent,
-                            "auth": auth_type,
-                            "channel": channel,
-                            "noise_floor": noise_floor,
-                            "snr": snr
-                        })
-        except Exception as e:
-            print(f"Error fetching WiFi data on Linux: {str(e)}")
-    
-    return wifi_data
+    With a tolerance (dB, default SAMPLE_TOLERANCE) sampling is adaptive:
+    `samples` becomes the minimum and scanning stops once every network's
+    RSSI standard error is within tolerance, or at the sample/time budget.
+    """
+    tolerance = SAMPLE_TOLERANCE if tolerance is None else tolerance
+    aggregator = collect_samples(
+        get_single_wifi_scan, samples=samples, delay=delay, tolerance=tolerance,
+        max_samples=MAX_SAMPLES if max_samples is None else max_samples,
+        max_time=MAX_SAMPLE_TIME if max_time is None else max_time)
+    if tolerance is not None:
+        print(f"Took {aggregator.scans} samples (tolerance {tolerance} dB)")
+    return aggregator.results()
 
-def aggregate_wifi_samples(samples):
-    if not samples:
+def get_single_wifi_scan():
+    try:
+        # iwlist/iw scan in the privileged helper process; nmcli, netsh and replay scan in-process
+        return get_scanner().scan()
+    except EOFError:
+        # A replay ran out of scans; let the run end instead of scanning nothing forever
+        raise
+    except Exception as e:
+        print(f"Error fetching WiFi data: {str(e)}")
         return []
-    
-    # If only one sample, return it directly
-    if len(samples) == 1:
-        return sorted(samples[0], key=lambda n: n["signal"], reverse=True)
-    
-    # Combine samples for better accuracy
-    networks_by_ssid = {}
-    
-    for sample in samples:
-        for network in sample:
-            ssid = network["ssid"]
-            if ssid not in networks_by_ssid:
-                networks_by_ssid[ssid] = []
-            networks_by_ssid[ssid].append(network)
-    
-    # Create the final list with averaged values
-    result = []
-    for ssid, networks in networks_by_ssid.items():
-        # Average signal strength
-        signal_values = [n["signal"] for n in networks]
-        snr_values = [n["snr"] for n in networks]
-        avg_signal = int(statistics.mean(signal_values))
-        avg_snr = int(statistics.mean(snr_values))
-        
-        # Calculate signal variance if we have multiple samples
-        signal_variance = None
-        if len(signal_values) > 1:
-            try:
-                signal_variance = int(statistics.stdev(signal_values))
-            except:
-                pass
-        
-        # Get other fields from the strongest sample
-        strongest = max(networks, key=lambda n: n["signal"])
-        
-        # Add to result with combined data
-        network_data = {
-            "ssid": ssid,
-            "signal": avg_signal,
-            "signal_percent": strongest.get("signal_percent", 0),
-            "auth": strongest.get("auth", "Unknown"),
-            "channel": strongest.get("channel", 0),
-            "noise_floor": strongest.get("noise_floor", -95),
-            "snr": avg_snr,
-            "samples": len(networks)
-        }
-        
-        # Add variance if available
-        if signal_variance:
-            network_data["signal_variance"] = signal_variance
-        
-        result.append(network_data)
-    
-    # Sort by signal strength
-    return sorted(result, key=lambda n: n["signal"], reverse=True)
+
+def get_storage():
+    """Return the storage backend for DATA_FILE, recreating it if the path changed"""
+    global storage
+    if storage is None or storage.snapshot_path != DATA_FILE:
+        if storage is not None:
+            storage.close()
+        storage = open_storage(DATA_FILE)
+    return storage
 
 def load_existing_data():
-    """Load existing data from the JSON file if it exists."""
+    """Load existing data from the data file, including updates still in its log."""
     try:
-        if os.path.exists(DATA_FILE):
-            with open(DATA_FILE, 'r') as file:
-                return json.load(file)
+        return get_storage().load()
     except Exception as e:
         print(f"Error loading existing data: {e}")
     
     # Return default structure if file doesn't exist or has issues
-    return {
-        "locations": {},
-        "metadata": {
-            "created": datetime.now().isoformat(),
-            "last_updated": datetime.now().isoformat(),
-            "version": "1.0"
-        }
-    }
+    return empty_data()
 
 def save_data(data_obj):
-    """Save the data to the JSON file."""
-    # Update the last_updated timestamp
-    data_obj["metadata"]["last_updated"] = datetime.now().isoformat()
-    
+    """Save the data to the data file, folding any pending log into it."""
     try:
-        with open(DATA_FILE, 'w') as file:
-            json.dump(data_obj, file, indent=2)
+        get_storage().compact(data_obj)
         print(f"Data saved to {DATA_FILE}")
     except Exception as e:
         print(f"Error saving data: {e}")
@@ -307,157 +117,29 @@ def list_known_locations():
         print(f"  {key}: {loc['description']} ({loc['latitude']}, {loc['longitude']})")
     print()
 
-def get_current_location():
-    """Try to determine the current device location without using external libraries."""
-    try:
-        print("Attempting to determine your current location...")
-        # Try to get public IP-based location (not very accurate but a fallback)
-        try:
-            # Using urllib instead of requests
-            with urllib.request.urlopen('https://ipinfo.io/json', timeout=5) as response:
-                data = json.loads(response.read().decode())
-                if 'loc' in data:
-                    lat, lon = map(float, data['loc'].split(','))
-                    print(f"Location detected: {lat}, {lon} (approximate based on IP)")
-                    return lat, lon, f"IP-based location: {data.get('city', ''), {data.get('region', '')}}"
-        except Exception as e:
-            print(f"Error determining location via IP: {e}")
-            
-        # Rest of the browser-based approach remains the same
-        import http.server
-        import threading
-        import time
-        import urllib.parse
-        
-        location_data = {'lat': None, 'lon': None}
-        server_port = 8000
-        
-        # Find an available port
-        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        while True:
-            try:
-                s.bind(('', server_port))
-                s.close()
-                break
-            except:
-                server_port += 1
-                if server_port > 9000:  # Limit the search
-                    raise Exception("No available ports found")
-        
-        class LocationHandler(http.server.BaseHTTPRequestHandler):
-            def do_GET(self):
-                if self.path.startswith('/setlocation'):
-                    query = urllib.parse.urlparse(self.path).query
-                    params = dict(urllib.parse.parse_qsl(query))
-                    
-                    if 'lat' in params and 'lon' in params:
-                        location_data['lat'] = float(params['lat'])
-                        location_data['lon'] = float(params['lon'])
-                        
-                    self.send_response(200)
-                    self.send_header('Content-type', 'text/html')
-                    self.end_headers()
-                    self.wfile.write(b"<html><body><h1>Location received!</h1><p>You can close this window now.</p></body></html>")
-                else:
-                    self.send_response(200)
-                    self.send_header('Content-type', 'text/html')
-                    self.end_headers()
-                    
-                    html = """
-                    <html>
-                    <head>
-                        <title>Location Permission</title>
-                        <script>
-                        function getLocation() {
-                            if (navigator.geolocation) {
-                                navigator.geolocation.getCurrentPosition(showPosition, showError);
-                                document.getElementById('status').innerHTML = "Getting your location...";
-                            } else {
-                                document.getElementById('status').innerHTML = "Geolocation is not supported by this browser.";
-                            }
-                        }
-                        
-                        function showPosition(position) {
-                            var lat = position.coords.latitude;
-                            var lon = position.coords.longitude;
-                            document.getElementById('status').innerHTML = 
-                                "Location detected: " + lat + ", " + lon;
-                            
-                            // Send location back to server
-                            window.location.href = "/setlocation?lat=" + lat + "&lon=" + lon;
-                        }
-                        
-                        function showError(error) {
-                            switch(error.code) {
-                                case error.PERMISSION_DENIED:
-                                    document.getElementById('status').innerHTML = "User denied the request for Geolocation."
-                                    break;
-                                case error.POSITION_UNAVAILABLE:
-                                    document.getElementById('status').innerHTML = "Location information is unavailable."
-                                    break;
-                                case error.TIMEOUT:
-                                    document.getElementById('status').innerHTML = "The request to get user location timed out."
-                                    break;
-                                case error.UNKNOWN_ERROR:
-                                    document.getElementById('status').innerHTML = "An unknown error occurred."
-                                    break;
-                            }
-                        }
-                        
-                        // Run when page loads
-                        window.onload = getLocation;
-                        </script>
-                    </head>
-                    <body>
-                        <h1>WiFi Data Collector - Location Permission</h1>
-                        <p>To collect accurate location data, please allow location access when prompted.</p>
-                        <p id="status">Waiting for location permission...</p>
-                        <button onclick="getLocation()">Try Again</button>
-                    </body>
-                    </html>
-                    """
-                    self.wfile.write(html.encode())
-                    
-            def log_message(self, format, *args):
-                # Suppress log messages
-                return
-        
-        # Start HTTP server in a separate thread
-        server = http.server.HTTPServer(('', server_port), LocationHandler)
-        thread = threading.Thread(target=server.serve_forever)
-        thread.daemon = True
-        thread.start()
-        
-        # Open browser to get user permission for location
-        webbrowser.open(f'http://localhost:{server_port}')
-        print(f"A browser window has been opened to request your location.")
-        print("Please allow location access when prompted.")
-        
-        # Wait for location data with timeout
-        timeout = 60  # seconds
-        start_time = time.time()
-        while location_data['lat'] is None and time.time() - start_time < timeout:
-            time.sleep(1)
-        
-        # Shutdown server
-        server.shutdown()
-        thread.join()
-        
-        if location_data['lat'] is not None and location_data['lon'] is not None:
-            print(f"Location detected: {location_data['lat']}, {location_data['lon']}")
-            return location_data['lat'], location_data['lon'], "Browser-based geolocation"
-            
-    except Exception as e:
-        print(f"Error determining location via browser: {e}")
-    
-    return None, None, None
+def get_current_location(timeout=0):
+    """Return (lat, lon, description) from the location service's cached fix.
+
+    Never blocks by default; a one-shot collection can pass `timeout` to wait
+    that many seconds for a first fix. Returns (None, None, None) without one.
+    """
+    # Recorded scans carry the position they were taken at
+    scanner_location = get_scanner().location()
+    if scanner_location:
+        return scanner_location
+
+    service = get_location_service()
+    fix = service.wait(timeout) if timeout else service.current()
+    if fix is None:
+        return None, None, None
+    return fix.latitude, fix.longitude, fix.description
 
 def collect_wifi_data(location_name=None, latitude=None, longitude=None, samples=3, note=None):
     """Collect wifi data at the current location and save to JSON file."""
     print(f"Collecting WiFi data with {samples} samples...")
     
     # Always try to auto-detect location first instead of relying on predefined locations
-    auto_lat, auto_lon, auto_desc = get_current_location()
+    auto_lat, auto_lon, auto_desc = get_current_location(timeout=LOCATION_TIMEOUT)
     
     if auto_lat and auto_lon:
         latitude = auto_lat
@@ -549,6 +231,21 @@ def parse_arguments():
     parser.add_argument('--note', '-n', help='Note about this location')
     parser.add_argument('--output', '-o', help='Output JSON file (default: wifi_data.json)')
     parser.add_argument('--list-locations', action='store_true', help='List known locations and exit')
+    parser.add_argument('--tolerance', type=float,
+                        help='Sample adaptively until RSSI standard error is below this many dB; --samples is then the minimum')
+    parser.add_argument('--max-samples', type=int, default=MAX_SAMPLES,
+                        help=f'Most samples when sampling adaptively (default: {MAX_SAMPLES})')
+    parser.add_argument('--max-sample-time', type=float, help='Most seconds to sample when sampling adaptively')
+    parser.add_argument('--location-source', action='append', metavar='SOURCE',
+                        help='Location source, highest priority first: fixed:LAT,LON, gpsd[:HOST[:PORT]], '
+                             'nmea:HOST:PORT, browser[:PORT] or ip (default: ip, with browser if it fails)')
+    parser.add_argument('--scanner', choices=sorted(SCANNER_BACKENDS),
+                        help='Scanner backend (default: netsh on Windows, iwlist elsewhere)')
+    parser.add_argument('--replay', help='Replay recorded scans from this file instead of scanning')
+    parser.add_argument('--replay-rate', type=float, default=1.0,
+                        help='Replay speed, 1 = real time, 0 = as fast as possible (default: 1)')
+    parser.add_argument('--fsync', choices=FSYNC_POLICIES,
+                        help='What to fsync: always, snapshots (default) or never')
     return parser.parse_args()
 
 def main():
@@ -556,9 +253,20 @@ def main():
     args = parse_arguments()
     
     # Set output file if provided
-    global DATA_FILE
+    global DATA_FILE, SAMPLE_TOLERANCE, MAX_SAMPLES, MAX_SAMPLE_TIME
     if args.output:
         DATA_FILE = args.output
+    SAMPLE_TOLERANCE = args.tolerance
+    MAX_SAMPLES = args.max_samples
+    MAX_SAMPLE_TIME = args.max_sample_time
+    if args.scanner or args.replay:
+        configure_scanner(args.scanner, replay=args.replay, rate=args.replay_rate)
+    if args.location_source:
+        configure_location(args.location_source)
+    elif args.latitude is not None and args.longitude is not None and not args.list_locations:
+        # Coordinates given on the command line need no detection
+        configure_location([f"fixed:{args.latitude},{args.longitude}"])
+    configure_persistence(fsync=args.fsync)
     
     print("=== WiFi Data Collector ===")
     print(f"Output file: {DATA_FILE}")